@@ -134,11 +134,8 @@ class TestEchoServerThread(unittest.TestCase):
         self.assertEqual(client._requests_processed, 8)
 
     def _drop_conection(self, client):
-        conn1 = client.pool._queue.get_nowait()
-        conn1.close()
-        conn2 = client.pool._queue.get_nowait()
-        client.pool._queue.put_nowait(conn1)
-        client.pool._queue.put_nowait(conn2)
+        # close an idle connection, the pool discards it on checkout
+        client.pool._available[0].close()
 
 
 @dont_run_with_thread
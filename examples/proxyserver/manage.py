@@ -181,7 +181,7 @@ class DataIterator:
         self.stream = response.environ.get('wsgi.input')
 
     def __iter__(self):
-        yield self.stream.reader.read()
+        yield self.stream.read()
 
 
 class StreamTunnel(pulsar.ProtocolConsumer):
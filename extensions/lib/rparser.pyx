@@ -1,4 +1,5 @@
 from itertools import starmap
+from collections.abc import Sequence
 
 cdef class Task
 
@@ -10,19 +11,33 @@ cdef bytes RESPONSE_STATUS = b'+'
 cdef bytes RESPONSE_ERROR = b'-'
 cdef bytes nil = b'$-1\r\n'
 cdef bytes null_array = b'*-1\r\n'
+cdef int REPLY_STRING = ord('$')
+cdef int REPLY_ARRAY = ord('*')
+cdef int REPLY_INTEGER = ord(':')
+cdef int REPLY_STATUS = ord('+')
+cdef int REPLY_ERROR = ord('-')
 
 
 cdef class RedisParser:
     cdef object _protocolError
     cdef object _responseError
     cdef object _encoding
-    cdef object _inbuffer
+    cdef bytearray _inbuffer
+    cdef Py_ssize_t _pos
     cdef Task _current
+    cdef public bint zero_copy
+    cdef public bint lazy_arrays
+    cdef public Py_ssize_t compact_size
 
-    def __cinit__(self, object perr, object rerr):
+    def __cinit__(self, object perr, object rerr, bint zero_copy=False,
+                  bint lazy_arrays=False):
         self._protocolError = perr
         self._responseError = rerr
         self._inbuffer = bytearray()
+        self._pos = 0
+        self.zero_copy = zero_copy
+        self.lazy_arrays = lazy_arrays
+        self.compact_size = 65536
 
     def on_connect(self, connection):
         if connection.decode_responses:
@@ -39,10 +54,19 @@ cdef class RedisParser:
             return self._get(None)
 
     def feed(self, stream):
-        self._inbuffer.extend(stream)
+        cdef bytearray b = self._inbuffer
+        cdef Py_ssize_t pos = self._pos
+        if pos and (pos == len(b) or
+                    (pos > self.compact_size and 2*pos > len(b))):
+            b = self._compact(b, pos, False)
+        try:
+            b.extend(stream)
+        except BufferError:
+            # memoryview slices of the buffer are still alive
+            self._compact(b, self._pos, True).extend(stream)
 
     def buffer(self):
-        return self._inbuffer
+        return bytes(self._inbuffer[self._pos:])
 
     # CLIENT ENCODERS
     def pack_command(self, args):
@@ -113,30 +137,112 @@ cdef class RedisParser:
             yield v
 
     cdef object _get(self, Task next):
-        b = self._inbuffer
-        cdef int length = b.find(b'\r\n')
-        if length >= 0:
-            self._inbuffer, response = b[length+2:], bytes(b[:length])
-            rtype, response = response[:1], response[1:]
-            if rtype == RESPONSE_ERROR:
-                return self._responseError(response.decode('utf-8'))
-            elif rtype == RESPONSE_INTEGER:
-                return long(response)
-            elif rtype == RESPONSE_STATUS:
-                return response
-            elif rtype == RESPONSE_STRING:
-                task = Task(long(response), next)
+        cdef bytearray b = self._inbuffer
+        cdef Py_ssize_t pos = self._pos
+        cdef Py_ssize_t idx = b.find(CRLF, pos)
+        cdef int rtype
+        cdef long length
+        cdef Task task
+        if idx >= 0:
+            rtype = b[pos] if idx > pos else 0
+            self._pos = idx + 2
+            if rtype == REPLY_ERROR:
+                return self._responseError(b[pos+1:idx].decode('utf-8'))
+            elif rtype == REPLY_INTEGER:
+                return long(b[pos+1:idx])
+            elif rtype == REPLY_STATUS:
+                return bytes(b[pos+1:idx])
+            elif rtype == REPLY_STRING:
+                task = Task(long(b[pos+1:idx]), next)
                 return task.decode(self, False)
-            elif rtype == RESPONSE_ARRAY:
-                task = ArrayTask(long(response), next)
+            elif rtype == REPLY_ARRAY:
+                length = long(b[pos+1:idx])
+                if length < 0:
+                    return None
+                elif self.lazy_arrays:
+                    task = LazyArrayTask(length, next)
+                else:
+                    task = ArrayTask(length, next)
                 return task.decode(self, False)
             else:
                 # Clear the buffer and raise
                 self._inbuffer = bytearray()
+                self._pos = 0
                 raise self._protocolError('Protocol Error')
         else:
             return False
 
+    cdef object _chunk(self, object b, Py_ssize_t start, Py_ssize_t end):
+        if self.zero_copy:
+            chunk = memoryview(b)[start:end]
+        else:
+            chunk = bytes(memoryview(b)[start:end])
+        if self._encoding:
+            return str(chunk, self._encoding)
+        return chunk
+
+    cdef Py_ssize_t _skip(self, object b, Py_ssize_t pos) except -2:
+        cdef Py_ssize_t idx = b.find(CRLF, pos)
+        cdef Py_ssize_t end
+        cdef long length, i
+        cdef int rtype
+        if idx < 0:
+            return -1
+        rtype = b[pos] if idx > pos else 0
+        if rtype == REPLY_STRING:
+            length = long(b[pos+1:idx])
+            end = idx + 4 + length if length >= 0 else idx + 2
+            return end if end <= len(b) else -1
+        elif rtype == REPLY_ARRAY:
+            length = long(b[pos+1:idx])
+            pos = idx + 2
+            for i in range(length):
+                pos = self._skip(b, pos)
+                if pos < 0:
+                    break
+            return pos
+        elif (rtype == REPLY_INTEGER or rtype == REPLY_STATUS or
+              rtype == REPLY_ERROR):
+            return idx + 2
+        else:
+            self._inbuffer = bytearray()
+            self._pos = 0
+            raise self._protocolError('Protocol Error')
+
+    cdef object _decode(self, bytes data, Py_ssize_t start, Py_ssize_t end):
+        cdef Py_ssize_t idx = data.find(CRLF, start)
+        cdef int rtype = data[start]
+        cdef long length, i
+        cdef list offsets
+        if rtype == REPLY_STRING:
+            length = long(data[start+1:idx])
+            if length >= 0:
+                return self._chunk(data, idx + 2, idx + 2 + length)
+        elif rtype == REPLY_ARRAY:
+            length = long(data[start+1:idx])
+            if length >= 0:
+                offsets = [idx + 2]
+                for i in range(length):
+                    offsets.append(self._skip(data, offsets[-1]))
+                return LazyArray(self, data, offsets)
+        elif rtype == REPLY_INTEGER:
+            return long(data[start+1:idx])
+        elif rtype == REPLY_STATUS:
+            return data[start+1:idx]
+        else:
+            return self._responseError(data[start+1:idx].decode('utf-8'))
+
+    cdef bytearray _compact(self, bytearray b, Py_ssize_t pos, bint copy):
+        if not copy:
+            try:
+                del b[:pos]
+            except BufferError:
+                copy = True
+        if copy:
+            b = self._inbuffer = bytearray(memoryview(b)[pos:])
+        self._pos = 0
+        return b
+
     cdef object _resume(self, Task task, object result):
         result = task.decode(self, result)
         if result is not False and task._next:
@@ -155,16 +261,16 @@ cdef class Task:
 
     cdef object decode(self, RedisParser parser, object result):
         cdef long length = self._length
-        cdef bytes chunk
+        cdef bytearray b
+        cdef Py_ssize_t pos, end
         parser._current = None
         if length >= 0:
             b = parser._inbuffer
-            if len(b) >= length+2:
-                parser._inbuffer, chunk = b[length+2:], bytes(b[:length])
-                if parser._encoding:
-                    return chunk.decode(parser._encoding)
-                else:
-                    return chunk
+            pos = parser._pos
+            end = pos + length
+            if len(b) >= end + 2:
+                parser._pos = end + 2
+                return parser._chunk(b, pos, end)
             else:
                 parser._current = self
                 return False
@@ -193,3 +299,61 @@ cdef class ArrayTask(Task):
             elif not parser._current:
                 parser._current = self
             return False
+
+
+cdef class LazyArrayTask(Task):
+    cdef list _offsets
+
+    cdef object decode(self, RedisParser parser, object result):
+        cdef bytearray b = parser._inbuffer
+        cdef Py_ssize_t pos = parser._pos
+        cdef Py_ssize_t end
+        cdef list offsets = self._offsets
+        parser._current = None
+        if offsets is None:
+            self._offsets = offsets = [0]
+        while len(offsets) <= self._length:
+            end = parser._skip(b, pos + offsets[-1])
+            if end < 0:
+                parser._current = self
+                return False
+            offsets.append(end - pos)
+        end = pos + offsets[-1]
+        parser._pos = end
+        return LazyArray(parser, bytes(memoryview(b)[pos:end]), offsets)
+
+
+cdef class LazyArray:
+    cdef RedisParser _parser
+    cdef bytes _data
+    cdef list _offsets
+
+    def __cinit__(self, RedisParser parser, bytes data, list offsets):
+        self._parser = parser
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = range(len(self))[index]
+        return self._parser._decode(self._data, self._offsets[index],
+                                    self._offsets[index+1])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, Sequence)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+Sequence.register(LazyArray)
@@ -3,9 +3,11 @@ import logging
 import json
 from enum import Enum
 from asyncio import gather
+from itertools import groupby
 from collections import namedtuple, OrderedDict
 
 from pulsar import ProtocolError
+from pulsar.utils import serializers
 from pulsar.apps.ds import redis_to_py_pattern
 
 from .store import PubSubClient
@@ -37,16 +39,53 @@ def backoff(value):
     return min(value + 0.25, 16)
 
 
-class Json:
+class Codec:
+    """Protocol for channels encoding messages with a serializer from
+    the :mod:`~pulsar.utils.serializers` registry.
+
+    Messages are tagged with the serializer name and messages of any
+    registered serializer are decoded.
+    """
+    def __init__(self, serializer=None):
+        self.serializer = serializers.get_serializer(serializer)
 
     def encode(self, msg):
-        return json.dumps(msg)
+        return serializers.dumps(msg, self.serializer)
+
+    def encode_events(self, event, channels, data=None):
+        '''Encode the same ``event`` for several ``channels``'''
+        messages = []
+        for channel in channels:
+            msg = {'event': event, 'channel': channel}
+            if data:
+                msg['data'] = data
+            messages.append(self.encode(msg))
+        return messages
 
     def decode(self, msg):
         try:
-            return json.loads(msg.decode('utf-8'))
+            return serializers.loads(msg)
         except Exception as exc:
-            raise ProtocolError('Invalid JSON') from exc
+            raise ProtocolError('Invalid message') from exc
+
+
+class Json(Codec):
+
+    def __init__(self):
+        super().__init__(serializers.DEFAULT_SERIALIZER)
+
+    def encode(self, msg):
+        return json.dumps(msg)
+
+    def encode_events(self, event, channels, data=None):
+        '''Encode the same ``event`` for several ``channels``.
+
+        The event name and ``data`` are serialised once, the result
+        for each channel is the same as :meth:`encode` of the message.
+        '''
+        head = '{"event": %s, "channel": ' % json.dumps(event)
+        tail = ', "data": %s}' % json.dumps(data) if data else '}'
+        return [head + json.dumps(channel) + tail for channel in channels]
 
 
 class Connector:
@@ -69,10 +108,20 @@ class Connector:
 
 class Channels(PubSubClient, Connector):
     """Manage channels for publish/subscribe
+
+    Messages published, and channels subscribed or unsubscribed, during
+    the same loop iteration are sent together: messages as a pipeline of
+    ``PUBLISH`` and channels in ``SUBSCRIBE``/``UNSUBSCRIBE`` commands of
+    at most :attr:`subscribe_batch` channels.
+
+    Messages are encoded by the ``serializer``, or the ``serializer``
+    parameter of the store url, when given, otherwise by the
+    :attr:`~.PubSub.protocol` of ``pubsub``.
     """
+    subscribe_batch = 500
 
     def __init__(self, pubsub, namespace=None, status_channel=None,
-                 logger=None):
+                 logger=None, serializer=None):
         assert pubsub.protocol, "protocol required for channels"
         self._connection_error = False
         self.channels = OrderedDict()
@@ -86,10 +135,16 @@ class Channels(PubSubClient, Connector):
             self.namespace = '%s_' % self.namespace
         self.dns = pubsub.store.buildurl(namespace=self.namespace)
         self.status_channel = (status_channel or DEFAULT_CHANNEL).lower()
+        serializer = serializer or pubsub.store.urlparams.get('serializer')
+        self.codec = Codec(serializer) if serializer else pubsub.protocol
         self.status = StatusType.initialised
         self.pubsub = pubsub
         self.pubsub.bind_event('connection_lost', self._connection_lost)
         self.pubsub.add_client(self)
+        self._messages = []
+        self._messages_waiter = None
+        self._subscriptions = []
+        self._subscriptions_waiter = None
 
     @property
     def _loop(self):
@@ -116,6 +171,11 @@ class Channels(PubSubClient, Connector):
             if channel:
                 channel(message)
 
+    def pool_metrics(self):
+        """Connection pool metrics of the publish/subscribe store
+        """
+        return self.pubsub.store.pool_metrics()
+
     def lock(self, name, **kwargs):
         """Global distributed lock
         """
@@ -171,9 +231,51 @@ class Channels(PubSubClient, Connector):
         msg = {'event': event, 'channel': channel}
         if data:
             msg['data'] = data
+        msg = self.codec.encode(msg)
+        await self._publish(channel, self._message(channel, msg))
+
+    async def publish_many(self, channels, event, data=None):
+        """Publish the same ``event`` on several ``channels``
+
+        The event is encoded once when the protocol supports it.
+        """
+        channels = list(channels)
+        codec = self.codec
+        if hasattr(codec, 'encode_events'):
+            messages = codec.encode_events(event, channels, data)
+        else:
+            messages = []
+            for channel in channels:
+                msg = {'event': event, 'channel': channel}
+                if data:
+                    msg['data'] = data
+                messages.append(codec.encode(msg))
+        await gather(*[self._publish(channel, self._message(channel, msg))
+                       for channel, msg in zip(channels, messages)])
+
+    def prefixed(self, name):
+        if not name.startswith(self.namespace):
+            name = '%s%s' % (self.namespace, name)
+        return name
+
+    def create_channel(self, name):
+        return Channel(self, name)
+
+    def subscription(self, command, channel_name):
+        """Send ``command``, ``subscribe`` or ``unsubscribe``, for
+        ``channel_name`` together with other subscriptions of the same loop
+        iteration
+        """
+        if not self._subscriptions:
+            self._subscriptions_waiter = self._loop.create_future()
+            self._loop.call_soon(self._flush_subscriptions)
+        self._subscriptions.append((command, channel_name))
+        return self._subscriptions_waiter
+
+    async def _publish(self, channel, waiter):
         try:
-            await self.pubsub.publish(self.prefixed(channel), msg)
-        except ConnectionRefusedError:
+            await waiter
+        except ConnectionError:
             self.connection_error = True
             self.logger.critical(
                 '%s cannot publish on "%s" channel - connection error',
@@ -183,13 +285,42 @@ class Channels(PubSubClient, Connector):
         else:
             self.connection_ok()
 
-    def prefixed(self, name):
-        if not name.startswith(self.namespace):
-            name = '%s%s' % (self.namespace, name)
-        return name
-
-    def create_channel(self, name):
-        return Channel(self, name)
+    def _message(self, channel, msg):
+        if not self._messages:
+            self._messages_waiter = self._loop.create_future()
+            self._loop.call_soon(self._flush_messages)
+        self._messages.append((self.prefixed(channel), msg))
+        return self._messages_waiter
+
+    def _flush_messages(self):
+        messages, self._messages = self._messages, []
+        waiter, self._messages_waiter = self._messages_waiter, None
+        self._loop.create_task(
+            self._send(waiter, self.pubsub.publish_batch, messages))
+
+    def _flush_subscriptions(self):
+        subscriptions, self._subscriptions = self._subscriptions, []
+        waiter, self._subscriptions_waiter = self._subscriptions_waiter, None
+        self._loop.create_task(
+            self._send(waiter, self._subscribe, subscriptions))
+
+    async def _subscribe(self, subscriptions):
+        size = self.subscribe_batch
+        for command, group in groupby(subscriptions, lambda s: s[0]):
+            names = list(OrderedDict.fromkeys(name for _, name in group))
+            execute = getattr(self.pubsub, command)
+            for i in range(0, len(names), size):
+                await execute(*names[i:i+size])
+
+    async def _send(self, waiter, send, items):
+        try:
+            await send(items)
+        except Exception as exc:
+            if not waiter.done():
+                waiter.set_exception(exc)
+        else:
+            if not waiter.done():
+                waiter.set_result(None)
 
     def _connection_lost(self, *args):
         self.status = StatusType.disconnected
@@ -207,7 +338,7 @@ class Channels(PubSubClient, Connector):
                 self.status_channel
             )
             await gather(*[c.connect() for c in self.channels.values()])
-        except ConnectionRefusedError:
+        except ConnectionError:
             self.status = StatusType.disconnected
             next_time = backoff(next_time) if next_time else RECONNECT_LAG
             self.logger.critical(
@@ -266,13 +397,13 @@ class Channel:
         channels = self.channels
         if channels.status == StatusType.connected:
             channel_name = channels.prefixed(self.name)
-            await self.channels.pubsub.subscribe(channel_name)
+            await channels.subscription('subscribe', channel_name)
 
     async def disconnect(self):
         channels = self.channels
         if channels.status == StatusType.connected:
             channel_name = channels.prefixed(self.name)
-            await self.channels.pubsub.unsubscribe(channel_name)
+            await channels.subscription('unsubscribe', channel_name)
 
     def register(self, event, callback):
         """Register a ``callback`` for ``event``
@@ -25,19 +25,36 @@ Redis Pipeline
 .. autoclass:: pulsar.apps.data.redis.client.Pipeline
    :members:
    :member-order: bysource
+
+Failover
+~~~~~~~~~~~~~~~
+
+.. autoclass:: pulsar.apps.data.redis.failover.Failover
+   :members:
+   :member-order: bysource
+
+Sharded Store
+~~~~~~~~~~~~~~~
+
+.. autoclass:: pulsar.apps.data.redis.sharded.ShardedStore
+   :members:
+   :member-order: bysource
 '''
 from pulsar.utils.config import Global
 from pulsar.apps.data import register_store
 from pulsar.apps.ds import RedisError, NoScriptError, redis_parser
 
-from .store import RedisStore, RedisStoreConnection
+from .store import RedisStore, RedisStoreConnection, RedisMultiplexConnection
 from .client import ResponseError, Consumer, Pipeline
 from .lock import RedisScript, LockError
+from .failover import Failover
+from .sharded import ShardedStore, HashRing
 
 
 __all__ = ['RedisStore', 'RedisError', 'NoScriptError', 'redis_parser',
-           'RedisStoreConnection', 'Consumer', 'Pipeline', 'ResponseError',
-           'RedisScript', 'LockError']
+           'RedisStoreConnection', 'RedisMultiplexConnection', 'Consumer',
+           'Pipeline', 'ResponseError', 'RedisScript', 'LockError',
+           'ShardedStore', 'HashRing', 'Failover']
 
 
 class RedisServer(Global):
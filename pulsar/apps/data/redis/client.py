@@ -1,4 +1,6 @@
 from itertools import chain
+from collections import deque
+from asyncio import ensure_future
 import datetime
 
 import pulsar
@@ -111,12 +113,42 @@ def pubsub_callback(response, subcommand=None):
         return response
 
 
-class Consumer(pulsar.ProtocolConsumer):
-
+def stream_entries(response, justid=False, **kw):
+    if justid or not response:
+        return response
+    return [(id, None if fields is None else pairs_to_object(fields))
+            for id, fields in response]
+
+
+def stream_read(response, **kw):
+    if not response:
+        return []
+    return [(key, stream_entries(entries)) for key, entries in response]
+
+
+def stream_pending(response, **kw):
+    if response and not isinstance(response[0], list):
+        count, min_id, max_id, consumers = response
+        return {'pending': int(count),
+                'min': min_id,
+                'max': max_id,
+                'consumers': dict(((name, int(c)) for name, c in
+                                   consumers or ()))}
+    return [{'id': id,
+             'consumer': consumer,
+             'idle': int(idle),
+             'delivered': int(delivered)}
+            for id, consumer, idle, delivered in response]
+
+
+class ResponseMixin:
+    '''Convert redis responses into python objects using
+    :attr:`RESPONSE_CALLBACKS`.
+    '''
     RESPONSE_CALLBACKS = dict_merge(
         string_keys_to_dict(
-            'BGSAVE FLUSHALL FLUSHDB HMSET LSET LTRIM MSET RENAME RESTORE '
-            'SAVE SELECT SHUTDOWN SLAVEOF SET WATCH UNWATCH',
+            'BGSAVE FLUSHALL FLUSHDB HMSET LSET LTRIM MSET PFMERGE RENAME '
+            'RESTORE SAVE SELECT SHUTDOWN SLAVEOF SET WATCH UNWATCH',
             lambda r: r == b'OK'
         ),
         string_keys_to_dict('SORT', sort_return_tuples),
@@ -126,7 +158,7 @@ class Consumer(pulsar.ProtocolConsumer):
                             lambda v: float(v) if v is not None else v),
         string_keys_to_dict('ZRANGE ZRANGEBYSCORE ZREVRANGE ZREVRANGEBYSCORE',
                             values_to_zset),
-        string_keys_to_dict('EXISTS EXPIRE EXPIREAT PEXPIRE PEXPIREAT '
+        string_keys_to_dict('EXPIRE EXPIREAT PEXPIRE PEXPIREAT '
                             'PERSIST RENAMENX',
                             lambda r: bool(r)),
         {
@@ -136,10 +168,57 @@ class Consumer(pulsar.ProtocolConsumer):
             'TIME': lambda x: (int(float(x[0])), int(float(x[1]))),
             'HGETALL': pairs_to_object,
             'HMGET': values_to_object,
-            'TYPE': lambda r: r.decode('utf-8')
+            'TYPE': lambda r: r.decode('utf-8'),
+            'XRANGE': stream_entries,
+            'XREVRANGE': stream_entries,
+            'XCLAIM': stream_entries,
+            'XREAD': stream_read,
+            'XREADGROUP': stream_read,
+            'XPENDING': stream_pending,
+            'XGROUP': lambda r: r == b'OK' if isinstance(r, bytes) else r
         }
     )
 
+    def parse_response(self, response, command, options):
+        callback = self.RESPONSE_CALLBACKS.get(command.upper())
+        return callback(response, **options) if callback else response
+
+    def command_response(self, request, response):
+        '''The result of a single command ``request``'''
+        if isinstance(response, Exception):
+            return ResponseError(response)
+        args, options = request
+        return self.parse_response(response, args[0], options)
+
+    def pipeline_response(self, request):
+        '''The result of a ``(commands, raise_on_error, responses,
+        transaction)`` pipeline ``request`` once all responses are available
+        '''
+        commands, raise_on_error, responses, transaction = request
+        error = None
+        response = []
+        if transaction:
+            # responses of MULTI, QUEUED... and EXEC
+            result = responses[-1]
+            if isinstance(result, Exception):
+                error = result
+                result = responses[1:-1]
+            commands = commands[1:-1]
+        else:
+            result = responses
+        for cmds, resp in zip(commands, result):
+            args, options = cmds
+            if isinstance(resp, Exception) and not error:
+                error = resp
+            resp = self.parse_response(resp, args[0], options)
+            response.append(resp)
+        if error and raise_on_error:
+            response = ResponseError(error)
+        return response
+
+
+class Consumer(ResponseMixin, pulsar.ProtocolConsumer):
+
     def start_request(self):
         conn = self._connection
         args = self._request[0]
@@ -149,10 +228,6 @@ class Consumer(pulsar.ProtocolConsumer):
             chunk = conn.parser.pack_pipeline(args)
         conn._transport.write(chunk)
 
-    def parse_response(self, response, command, options):
-        callback = self.RESPONSE_CALLBACKS.get(command.upper())
-        return callback(response, **options) if callback else response
-
     def data_received(self, data):
         conn = self._connection
         parser = conn.parser
@@ -162,34 +237,20 @@ class Consumer(pulsar.ProtocolConsumer):
         try:
             if len(request) == 2:
                 if response is not False:
-                    if not isinstance(response, Exception):
-                        cmnd = request[0][0]
-                        response = self.parse_response(response, cmnd,
-                                                       request[1])
-                    else:
-                        response = ResponseError(response)
-                    self.finished(response)
+                    self.finished(self.command_response(request, response))
             else:   # pipeline
-                commands, raise_on_error, responses = request
+                commands, responses = request[0], request[2]
                 while response is not False:
                     responses.append(response)
                     response = parser.get()
-                if len(responses) == len(commands):
-                    error = None
-                    result = responses[-1]
-                    response = []
-                    if isinstance(result, Exception):
-                        error = result
-                        result = responses[1:-1]
-                    for cmds, resp in zip(commands[1:-1], result):
-                        args, options = cmds
-                        if isinstance(resp, Exception) and not error:
-                            error = resp
-                        resp = self.parse_response(resp, args[0], options)
-                        response.append(resp)
-                    if error and raise_on_error:
-                        response = ResponseError(error)
-                    self.finished(response)
+                if len(responses) > len(commands):
+                    # replies out of step with commands, drop the connection
+                    conn.close()
+                    raise pulsar.ProtocolError(
+                        '%d replies to %d pipelined commands' %
+                        (len(responses), len(commands)))
+                elif len(responses) == len(commands):
+                    self.finished(self.pipeline_response(request))
         except Exception as exc:
             self.finished(exc=exc)
 
@@ -215,10 +276,10 @@ class RedisClient:
     def pubsub(self, **kw):
         return RedisPubSub(self.store, **kw)
 
-    def pipeline(self):
+    def pipeline(self, transaction=True, chunk_size=None):
         '''Create a :class:`.Pipeline` for pipelining commands
         '''
-        return Pipeline(self.store)
+        return Pipeline(self.store, transaction, chunk_size)
 
     def execute(self, command, *args, **options):
         return self.store.execute(command, *args, **options)
@@ -401,6 +462,84 @@ class RedisClient:
         return self.execute_command('ZREVRANGEBYSCORE', key, min, max, *pieces,
                                     withscores=withscores)
 
+    # STREAMS
+    def xadd(self, name, fields, id='*', maxlen=None, approximate=True):
+        '''Append a new entry with ``fields`` to the stream ``name``.
+
+        ``fields`` is a mapping or an iterable over field, value pairs.
+        ``maxlen`` trims the stream to (about, if ``approximate``) the
+        given number of entries.
+        '''
+        pieces = [name]
+        if maxlen is not None:
+            pieces.append(b'MAXLEN')
+            if approximate:
+                pieces.append(b'~')
+            pieces.append(maxlen)
+        pieces.append(id)
+        [pieces.extend(pair) for pair in mapping_iterator(fields)]
+        return self.execute('xadd', *pieces)
+
+    def xtrim(self, name, maxlen, approximate=True):
+        '''Trim the stream ``name`` to (about, if ``approximate``)
+        ``maxlen`` entries and return the number of removed entries.
+        '''
+        pieces = [name, b'MAXLEN']
+        if approximate:
+            pieces.append(b'~')
+        pieces.append(maxlen)
+        return self.execute('xtrim', *pieces)
+
+    def xrange(self, name, start='-', end='+', count=None):
+        pieces = [name, start, end]
+        if count is not None:
+            pieces.extend((b'COUNT', count))
+        return self.execute('xrange', *pieces)
+
+    def xrevrange(self, name, end='+', start='-', count=None):
+        pieces = [name, end, start]
+        if count is not None:
+            pieces.extend((b'COUNT', count))
+        return self.execute('xrevrange', *pieces)
+
+    def xread(self, streams, count=None, block=None):
+        '''Read entries from ``streams``, a mapping of stream names to the
+        id after which entries are read.
+
+        ``block`` is the number of milliseconds to wait for new entries,
+        ``0`` blocks forever.
+        '''
+        return self._xread('xread', [], streams, count, block)
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None,
+                   noack=False):
+        '''Read entries from ``streams`` as ``consumer`` of ``group``.
+
+        Use ``>`` as the stream id to receive entries never delivered to
+        other consumers of the group.
+        '''
+        pieces = [b'GROUP', group, consumer]
+        if noack:
+            pieces.append(b'NOACK')
+        return self._xread('xreadgroup', pieces, streams, count, block)
+
+    def xclaim(self, name, group, consumer, min_idle_time, ids,
+               justid=False):
+        pieces = [name, group, consumer, min_idle_time]
+        pieces.extend(ids)
+        if justid:
+            pieces.append(b'JUSTID')
+        return self.execute('xclaim', *pieces, justid=justid)
+
+    def xpending(self, name, group, start=None, end=None, count=None,
+                 consumer=None):
+        pieces = [name, group]
+        if count is not None:
+            pieces.extend((start or '-', end or '+', count))
+            if consumer:
+                pieces.append(consumer)
+        return self.execute('xpending', *pieces)
+
     def eval(self, script, keys=None, args=None):
         return self._eval('eval', script, keys, args)
 
@@ -484,6 +623,17 @@ class RedisClient:
             raise AttributeError("'%s' object has no attribute '%s'" %
                                  (type(self), name))
 
+    def _xread(self, command, pieces, streams, count, block):
+        if count is not None:
+            pieces.extend((b'COUNT', count))
+        if block is not None:
+            pieces.extend((b'BLOCK', block))
+        pieces.append(b'STREAMS')
+        names, ids = zip(*mapping_iterator(streams))
+        pieces.extend(names)
+        pieces.extend(ids)
+        return self.execute(command, *pieces)
+
     def _eval(self, command, script, keys, args):
         all_args = keys if keys is not None else ()
         num_keys = len(all_args)
@@ -494,9 +644,19 @@ class RedisClient:
 
 class Pipeline(RedisClient):
     '''A :class:`.RedisClient` for pipelining commands
+
+    When ``transaction`` is ``True`` commands are wrapped in a single
+    MULTI/EXEC block. Otherwise they are sent in chunks of at most
+    :attr:`chunk_size` commands and results can be consumed as they
+    arrive via :meth:`stream`.
     '''
-    def __init__(self, store):
+    chunk_size = 1000
+
+    def __init__(self, store, transaction=True, chunk_size=None):
         self.store = store
+        self.transaction = transaction
+        if chunk_size:
+            self.chunk_size = chunk_size
         self.reset()
 
     def execute(self, *args, **kwargs):
@@ -509,10 +669,77 @@ class Pipeline(RedisClient):
     def commit(self, raise_on_error=True):
         '''Send commands to redis.
         '''
+        if not self.transaction:
+            return self._commit(raise_on_error)
         cmds = list(chain([(('multi',), {})],
                           self.command_stack, [(('exec',), {})]))
         self.reset()
         return self.store.execute_pipeline(cmds, raise_on_error)
 
+    def stream(self, raise_on_error=True):
+        '''Send commands to redis and return an asynchronous iterator
+        over results.
+
+        For non transactional pipelines, commands are sent in chunks and
+        the next chunk is sent while results of the previous one are
+        consumed, so that only two chunks of results are held in memory.
+        '''
+        if self.transaction:
+            waiter = ensure_future(self.commit(raise_on_error),
+                                   loop=self.store._loop)
+            return PipelineResults(self.store, (), self.chunk_size,
+                                   raise_on_error, waiter)
+        commands = self.command_stack
+        self.reset()
+        return PipelineResults(self.store, commands, self.chunk_size,
+                               raise_on_error)
+
     def immediate_execute(self, command, *args, **options):
         return self.store.execute(command, *args, **options)
+
+    async def _commit(self, raise_on_error):
+        results = []
+        async for result in self.stream(raise_on_error):
+            results.append(result)
+        return results
+
+
+class PipelineResults:
+    '''Asynchronous iterator over the results of a :class:`.Pipeline`
+    '''
+    def __init__(self, store, commands, chunk_size, raise_on_error,
+                 waiter=None):
+        self.store = store
+        self._commands = commands
+        self._chunk_size = chunk_size
+        self._raise_on_error = raise_on_error
+        self._offset = 0
+        self._results = deque()
+        self._next = waiter
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._results:
+            waiter = self._next or self._send()
+            if waiter is None:
+                raise StopAsyncIteration
+            self._next = None
+            results = await waiter
+            # send the next chunk while these results are consumed
+            self._next = self._send()
+            self._results.extend(results)
+            if not self._results:
+                raise StopAsyncIteration
+        return self._results.popleft()
+
+    def _send(self):
+        start = self._offset
+        chunk = self._commands[start:start + self._chunk_size]
+        if chunk:
+            self._offset += len(chunk)
+            pipeline = self.store.execute_pipeline(chunk,
+                                                   self._raise_on_error,
+                                                   False)
+            return ensure_future(pipeline, loop=self.store._loop)
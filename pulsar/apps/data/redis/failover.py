@@ -0,0 +1,241 @@
+'''Discovery of primary and replica nodes for :class:`.RedisStore`.
+'''
+import asyncio
+import logging
+
+from pulsar import ImproperlyConfigured
+from pulsar.utils.pep import to_string
+from pulsar.apps.ds import ResponseError
+
+
+logger = logging.getLogger('pulsar.redis')
+
+# Commands which can be served by replicas
+READONLY_COMMANDS = frozenset((
+    'BITCOUNT', 'BITPOS', 'DUMP', 'EXISTS', 'GET', 'GETBIT', 'GETRANGE',
+    'HEXISTS', 'HGET', 'HGETALL', 'HKEYS', 'HLEN', 'HMGET', 'HSCAN',
+    'HSTRLEN', 'HVALS', 'KEYS', 'LINDEX', 'LLEN', 'LRANGE', 'MGET', 'PTTL',
+    'RANDOMKEY', 'SCAN', 'SCARD', 'SDIFF', 'SINTER', 'SISMEMBER',
+    'SMEMBERS', 'SRANDMEMBER', 'SSCAN', 'STRLEN', 'SUNION', 'TTL', 'TYPE',
+    'XLEN', 'XRANGE', 'XREVRANGE', 'ZCARD', 'ZCOUNT', 'ZLEXCOUNT', 'ZRANGE',
+    'ZRANGEBYLEX', 'ZRANGEBYSCORE', 'ZRANK', 'ZREVRANGE', 'ZREVRANGEBYLEX',
+    'ZREVRANGEBYSCORE', 'ZREVRANK', 'ZSCAN', 'ZSCORE'))
+# Sentinel flags of replicas which cannot be used
+DOWN_FLAGS = frozenset(('s_down', 'o_down', 'disconnected'))
+# Errors triggering a discovery
+FAILOVER_ERRORS = (ConnectionError, OSError)
+
+
+def addresses(value):
+    '''List of ``(host, port)`` addresses from ``value``.
+
+    ``value`` is either a list of addresses or a comma separated string
+    of ``host:port`` addresses.
+    '''
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    result = []
+    for address in value:
+        if isinstance(address, str):
+            host, _, port = address.strip().rpartition(':')
+            address = (host, port)
+        host, port = address
+        result.append((host, int(port)))
+    return result
+
+
+class Failover:
+    '''Track the primary and replicas of a :class:`.RedisStore`.
+
+    Nodes are discovered from ``sentinels`` monitoring ``service`` or,
+    when no sentinels are given, by asking each of ``nodes`` its ``ROLE``.
+    Discovery runs when the store first connects, every ``interval``
+    seconds and after connection errors. When the primary changes the
+    store switches its connections to the new primary.
+
+    When ``read_from_replicas`` is ``True``, :data:`READONLY_COMMANDS`
+    are sent to replicas in round-robin.
+    '''
+    def __init__(self, store, sentinels=None, service=None, nodes=None,
+                 read_from_replicas=False, interval=10):
+        self.store = store
+        self.sentinels = addresses(sentinels)
+        self.service = service
+        self.nodes = addresses(nodes)
+        if self.sentinels and not service:
+            raise ImproperlyConfigured('sentinel service name required')
+        if not self.sentinels and not self.nodes:
+            raise ImproperlyConfigured('sentinels or nodes required')
+        self.read_from_replicas = read_from_replicas
+        self.interval = float(interval) if interval else None
+        self.primary = None
+        self.replicas = []
+        self._replica_pools = {}
+        self._next = 0
+        self._refreshing = None
+        self._handle = None
+        self._closed = False
+
+    def __repr__(self):
+        return 'Failover(primary=%s, replicas=%s)' % (self.primary,
+                                                      self.replicas)
+    __str__ = __repr__
+
+    @property
+    def _loop(self):
+        return self.store._loop
+
+    async def primary_address(self):
+        '''The address of the primary node'''
+        if self.primary is None:
+            await self.refresh()
+        return self.primary
+
+    def replica_pool(self):
+        '''The connection :class:`.Pool` of the next replica, if any'''
+        replicas = self.replicas
+        if replicas:
+            self._next = (self._next + 1) % len(replicas)
+            return self._replica_pools.get(replicas[self._next])
+
+    def refresh(self):
+        '''Discover primary and replicas.
+
+        Concurrent calls share the same discovery.
+        '''
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._refresh(),
+                                                     loop=self._loop)
+        return self._refreshing
+
+    def failed(self, exc):
+        '''A command failed with ``exc``, check for a failover'''
+        if not self._closed:
+            logger.warning('%s: %s - checking for failover', self.store, exc)
+            self.refresh().add_done_callback(self._refreshed)
+
+    async def discover(self):
+        '''Return the primary address and the list of replica addresses'''
+        if self.sentinels:
+            return await self._from_sentinels()
+        else:
+            return await self._from_nodes()
+
+    def close(self):
+        self._closed = True
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        pools = list(self._replica_pools.values())
+        self._replica_pools.clear()
+        return [pool.close() for pool in pools]
+
+    #    INTERNALS
+    async def _refresh(self):
+        try:
+            primary, replicas = await self.discover()
+            if primary != self.primary:
+                if self.primary is not None:
+                    logger.warning('%s: primary moved from %s to %s',
+                                   self.store, self.primary, primary)
+                    self.primary = primary
+                    self.store._switch_primary(primary)
+                else:
+                    self.primary = primary
+                    self.store._host = primary
+            if replicas != self.replicas:
+                self._switch_replicas(replicas)
+        finally:
+            self._refreshing = None
+            self._schedule()
+
+    def _switch_replicas(self, replicas):
+        pools = self._replica_pools
+        for address in set(pools) - set(replicas):
+            pools.pop(address).close()
+        if self.read_from_replicas:
+            for address in replicas:
+                if address not in pools:
+                    pools[address] = self.store._create_pool(address)
+        self.replicas = replicas
+
+    def _schedule(self):
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        if self.interval and not self._closed:
+            self._handle = self._loop.call_later(self.interval,
+                                                 self._periodic)
+
+    def _periodic(self):
+        self._handle = None
+        self.refresh().add_done_callback(self._refreshed)
+
+    def _refreshed(self, fut):
+        if not fut.cancelled() and fut.exception():
+            logger.error('%s: node discovery failed - %s', self.store,
+                         fut.exception())
+
+    async def _from_sentinels(self):
+        for address in self.sentinels:
+            connection = None
+            try:
+                connection = await self.store._open(address)
+                primary = await connection.execute(
+                    'SENTINEL', 'get-master-addr-by-name', self.service)
+                if not primary:
+                    continue
+                replicas = await connection.execute(
+                    'SENTINEL', 'slaves', self.service)
+            except FAILOVER_ERRORS + (ResponseError,) as exc:
+                logger.warning('%s: sentinel %s failed - %s', self.store,
+                               address, exc)
+                continue
+            finally:
+                if connection:
+                    connection.close()
+            primary = (to_string(primary[0]), int(primary[1]))
+            return primary, self._sentinel_replicas(replicas)
+        raise ConnectionError('No sentinel could provide the primary of "%s"'
+                              % self.service)
+
+    def _sentinel_replicas(self, replicas):
+        result = []
+        for replica in replicas or ():
+            info = dict(zip(replica[::2], replica[1::2]))
+            flags = set(to_string(info.get(b'flags', b'')).split(','))
+            if not flags & DOWN_FLAGS:
+                result.append((to_string(info[b'ip']), int(info[b'port'])))
+        return result
+
+    async def _from_nodes(self):
+        roles = await asyncio.gather(*[self._role(address)
+                                       for address in self.nodes],
+                                     loop=self._loop)
+        primary = None
+        replicas = []
+        for address, role in zip(self.nodes, roles):
+            if role == 'master':
+                if primary is None:
+                    primary = address
+            elif role in ('slave', 'replica'):
+                replicas.append(address)
+        if primary is None:
+            raise ConnectionError('No primary node available')
+        return primary, replicas
+
+    async def _role(self, address):
+        connection = None
+        try:
+            connection = await self.store.connect(address=address)
+            role = await connection.execute('ROLE')
+        except FAILOVER_ERRORS + (ResponseError,) as exc:
+            logger.warning('%s: node %s failed - %s', self.store,
+                           address, exc)
+        else:
+            return to_string(role[0])
+        finally:
+            if connection:
+                connection.close()
@@ -44,6 +44,13 @@ class RedisPubSub(PubSub):
             message = self._protocol.encode(message)
         return self.store.execute('PUBLISH', channel, message)
 
+    def publish_batch(self, messages):
+        if len(messages) == 1:
+            return self.store.execute('PUBLISH', *messages[0])
+        commands = [(('PUBLISH', channel, message), {})
+                    for channel, message in messages]
+        return self.store.execute_pipeline(commands, transaction=False)
+
     def count(self, *channels):
         kw = {'subcommand': 'numsub'}
         return self.store.execute('PUBSUB', 'NUMSUB', *channels, **kw)
@@ -0,0 +1,337 @@
+'''Consistent-hashing sharding of keys across several redis or
+pulsar-ds nodes.
+'''
+import asyncio
+from bisect import bisect
+from hashlib import md5
+
+from pulsar.utils.pep import to_string
+from pulsar.apps.data import create_store
+
+from .client import RedisClient, Pipeline
+from .failover import READONLY_COMMANDS
+
+
+# Commands executed on every node, the result of the first node is returned
+ALL_NODES_COMMANDS = frozenset(('FLUSHALL', 'FLUSHDB', 'PING',
+                                'SCRIPT'))
+# Commands executed on the first available node, as publish/subscribe
+FIRST_NODE_COMMANDS = frozenset(('PUBLISH', 'PUBSUB'))
+# Commands with keys after the STREAMS argument
+STREAM_READ_COMMANDS = frozenset(('XREAD', 'XREADGROUP'))
+# Position of the first key in a command, when not the first argument
+KEY_POSITIONS = {'BITOP': 2, 'DEBUG': 2, 'MEMORY': 2, 'OBJECT': 2,
+                 'EVAL': 3, 'EVALSHA': 3}
+# Errors which cause a node to be ejected from the ring
+NODE_ERRORS = (ConnectionError, OSError, asyncio.TimeoutError)
+
+
+def hash_key(key):
+    '''The part of ``key`` used for hashing.
+
+    When the key contains a ``{hashtag}``, only the hashtag is used so
+    that related keys are stored in the same node.
+    '''
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    elif not isinstance(key, bytes):
+        key = str(key).encode('utf-8')
+    start = key.find(b'{')
+    if start > -1:
+        end = key.find(b'}', start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+class HashRing:
+    '''A ketama consistent-hash ring.
+
+    Each node is placed in :attr:`points` positions of the ring, four for
+    each md5 digest of ``node-n``. Removing a node only remaps the keys
+    it owned.
+    '''
+    points = 160
+
+    def __init__(self, nodes=None):
+        self._nodes = set()
+        self._hashes = []
+        self._ring = {}
+        for node in nodes or ():
+            self.add(node)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, node):
+        return node in self._nodes
+
+    def add(self, node):
+        '''Add ``node`` to the ring'''
+        if node not in self._nodes:
+            self._nodes.add(node)
+            for h in self._node_hashes(node):
+                self._ring[h] = node
+            self._hashes = sorted(self._ring)
+
+    def remove(self, node):
+        '''Remove ``node`` from the ring'''
+        if node in self._nodes:
+            self._nodes.discard(node)
+            for h in self._node_hashes(node):
+                self._ring.pop(h, None)
+            self._hashes = sorted(self._ring)
+
+    def get(self, key):
+        '''The node owning ``key`` or ``None`` if the ring is empty'''
+        if self._hashes:
+            h = self._hash(md5(hash_key(key)).digest(), 0)
+            i = bisect(self._hashes, h)
+            return self._ring[self._hashes[i if i < len(self._hashes) else 0]]
+
+    def _node_hashes(self, node):
+        for i in range(self.points // 4):
+            digest = md5(('%s-%s' % (node, i)).encode('utf-8')).digest()
+            for j in range(4):
+                yield self._hash(digest, j)
+
+    def _hash(self, digest, j):
+        return int.from_bytes(digest[4*j:4*j + 4], 'little')
+
+
+class ShardedStore:
+    '''Distribute keys across several redis or pulsar-ds stores.
+
+    Keys are assigned to nodes via a :class:`.HashRing` which honours
+    ``{hashtag}``. ``MGET``, ``MSET``, ``DEL``, ``UNLINK`` and ``EXISTS``
+    are split per node, as are pipelines, and executed in parallel.
+    Pipelines are atomic on each node only.
+
+    Publish/subscribe are served by the first available node. ``XREAD``
+    and ``XREADGROUP`` must read streams stored in the same node.
+
+    A node failing with a connection error is ejected from the ring, its
+    keys remapped to the remaining nodes, and added back once it answers
+    a ``PING``, checked every ``retry_timeout`` seconds. Only read-only
+    commands are retried on the remaining nodes, others may have been
+    applied by the failed node and the error is raised.
+
+    :param urls: list of store urls.
+    :param kw: parameters passed to :func:`.create_store` for each node.
+    '''
+    retry_timeout = 30
+
+    def __init__(self, urls, loop=None, retry_timeout=None, **kw):
+        if not urls:
+            raise ValueError('No urls given')
+        self.nodes = []
+        for url in urls:
+            store = create_store(url, loop=loop, **kw)
+            loop = store._loop
+            self.nodes.append(store)
+        self._loop = loop
+        self._stores = dict(((store.dns, store) for store in self.nodes))
+        self.ring = HashRing(self._stores)
+        self.loaded_scripts = set()
+        self._checks = {}
+        if retry_timeout is not None:
+            self.retry_timeout = retry_timeout
+
+    def __repr__(self):
+        return 'ShardedStore(%s)' % ', '.join(self._stores)
+    __str__ = __repr__
+
+    @property
+    def encoding(self):
+        return self.nodes[0].encoding
+
+    @property
+    def namespace(self):
+        return self.nodes[0].namespace
+
+    def client(self):
+        '''Get a :class:`.RedisClient` for the sharded store'''
+        return RedisClient(self)
+
+    def pipeline(self, transaction=True, chunk_size=None):
+        '''Get a :class:`.Pipeline` for the sharded store'''
+        return Pipeline(self, transaction, chunk_size)
+
+    def pubsub(self, protocol=None):
+        '''Publish/subscribe are served by the first available node'''
+        return self._first_node().pubsub(protocol=protocol)
+
+    def node(self, key):
+        '''The store owning ``key``'''
+        name = self.ring.get(key)
+        if name is None:
+            raise ConnectionError('No available nodes')
+        return self._stores[name]
+
+    def ping(self):
+        return self.client().ping()
+
+    def pool_metrics(self):
+        '''Connection pool metrics by node'''
+        return dict(((store.dns, store.pool_metrics())
+                     for store in self.nodes))
+
+    def flush(self):
+        return self.execute('flushdb')
+
+    def close(self):
+        '''Close connections with all nodes'''
+        for handle in self._checks.values():
+            handle.cancel()
+        self._checks.clear()
+        return asyncio.gather(*[store.close() for store in self.nodes],
+                              loop=self._loop)
+
+    async def execute(self, *args, **options):
+        command = to_string(args[0]).upper()
+        if command in ('MGET', 'MSET', 'DEL', 'UNLINK', 'EXISTS'):
+            return await self._execute_multi(command, args, options)
+        elif command in ALL_NODES_COMMANDS:
+            results = await asyncio.gather(
+                *[self._execute(store, args, options)
+                  for store in self._available()], loop=self._loop)
+            return results[0]
+        return await self._execute(self._command_node(command, args),
+                                   args, options)
+
+    async def execute_pipeline(self, commands, raise_on_error=True,
+                               transaction=True):
+        if transaction:
+            commands = commands[1:-1]
+        groups = {}
+        for index, command in enumerate(commands):
+            args = command[0]
+            store = self._command_node(to_string(args[0]).upper(), args)
+            if store not in groups:
+                groups[store] = ([], [])
+            groups[store][0].append(index)
+            groups[store][1].append(command)
+        nodes = list(groups.items())
+        results = await asyncio.gather(
+            *[self._execute_pipeline(store, cmds, raise_on_error,
+                                     transaction)
+              for store, (_, cmds) in nodes], loop=self._loop)
+        response = [None]*len(commands)
+        for (_, (indexes, _)), result in zip(nodes, results):
+            for index, value in zip(indexes, result):
+                response[index] = value
+        return response
+
+    #    INTERNALS
+    def _available(self):
+        return [store for store in self.nodes if store.dns in self.ring]
+
+    def _first_node(self):
+        available = self._available()
+        if not available:
+            raise ConnectionError('No available nodes')
+        return available[0]
+
+    def _command_node(self, command, args):
+        if command in FIRST_NODE_COMMANDS:
+            return self._first_node()
+        elif command in STREAM_READ_COMMANDS:
+            return self._stream_node(command, args)
+        position = KEY_POSITIONS.get(command, 1)
+        if command in ('EVAL', 'EVALSHA') and not int(args[2]):
+            position = len(args)
+        return self.node(args[position] if len(args) > position else b'')
+
+    def _stream_node(self, command, args):
+        names = [to_string(arg).upper() for arg in args]
+        if 'STREAMS' not in names:
+            raise ValueError('%s requires STREAMS' % command)
+        start = names.index('STREAMS') + 1
+        keys = args[start:start + (len(args) - start) // 2]
+        nodes = set((self.node(key) for key in keys))
+        if len(nodes) > 1:
+            raise ValueError('%s streams are stored in different nodes, '
+                             'use a {hashtag}' % command)
+        return nodes.pop() if nodes else self.node(b'')
+
+    async def _execute_multi(self, command, args, options):
+        step = 2 if command == 'MSET' else 1
+        groups = {}
+        for index in range(1, len(args), step):
+            store = self.node(args[index])
+            if store not in groups:
+                groups[store] = ([], [args[0]])
+            groups[store][0].append(index)
+            groups[store][1].extend(args[index:index + step])
+        nodes = list(groups.items())
+        results = await asyncio.gather(
+            *[self._execute(store, cmd, options)
+              for store, (_, cmd) in nodes], loop=self._loop)
+        if command == 'MSET':
+            return all(results)
+        elif command == 'MGET':
+            response = [None]*(len(args) - 1)
+            for (_, (indexes, _)), result in zip(nodes, results):
+                for index, value in zip(indexes, result):
+                    response[index - 1] = value
+            return response
+        return sum(results)
+
+    async def _execute(self, store, args, options):
+        try:
+            return await store.execute(*args, **options)
+        except NODE_ERRORS:
+            retry = to_string(args[0]).upper() in READONLY_COMMANDS
+            if not self._eject(store) or not retry:
+                raise
+        return await self.execute(*args, **options)
+
+    async def _execute_pipeline(self, store, commands, raise_on_error,
+                                transaction):
+        if transaction:
+            commands = list(commands)
+            commands.insert(0, (('multi',), {}))
+            commands.append((('exec',), {}))
+        try:
+            return await store.execute_pipeline(commands, raise_on_error,
+                                                transaction)
+        except NODE_ERRORS:
+            cmds = commands[1:-1] if transaction else commands
+            retry = all((to_string(args[0]).upper() in READONLY_COMMANDS
+                         for args, _ in cmds))
+            if not self._eject(store) or not retry:
+                raise
+        return await self.execute_pipeline(commands, raise_on_error,
+                                           transaction)
+
+    def _eject(self, store):
+        '''Eject ``store`` from the ring and schedule a health check.
+
+        Return ``True`` if the store was ejected and other nodes are
+        available for a retry.
+        '''
+        if store.dns not in self.ring:
+            return False
+        self.ring.remove(store.dns)
+        self._schedule_check(store)
+        return bool(self.ring)
+
+    def _schedule_check(self, store):
+        self._checks[store.dns] = self._loop.call_later(
+            self.retry_timeout, self._recover, store)
+
+    def _recover(self, store):
+        self._checks.pop(store.dns, None)
+        self._loop.create_task(self._check(store))
+
+    async def _check(self, store):
+        '''Add ``store`` back to the ring if it answers a ``PING``'''
+        handle = self._checks.pop(store.dns, None)
+        if handle:
+            handle.cancel()
+        try:
+            await store.ping()
+        except Exception:
+            self._schedule_check(store)
+        else:
+            self.ring.add(store.dns)
@@ -1,12 +1,42 @@
+import asyncio
+from collections import deque
 from functools import partial
+from weakref import WeakSet
 
-from pulsar import Connection, Pool, get_actor
+from pulsar import Connection, Protocol, Pool, get_actor
 from pulsar.utils.pep import to_string
 from pulsar.apps.data import RemoteStore
-from pulsar.apps.ds import redis_parser
+from pulsar.apps.ds import redis_parser, ReadOnlyError
 
-from .client import RedisClient, Pipeline, Consumer, ResponseError
+from .client import (RedisClient, Pipeline, Consumer, ResponseMixin,
+                     ResponseError)
 from .pubsub import RedisPubSub
+from .failover import Failover, READONLY_COMMANDS, FAILOVER_ERRORS
+
+
+# Commands which block or change the state of a connection, they are
+# never sent via a multiplexed connection
+CONNECTION_COMMANDS = frozenset(('BLPOP', 'BRPOP', 'BRPOPLPUSH', 'DISCARD',
+                                 'EXEC', 'MONITOR', 'MULTI', 'PSUBSCRIBE',
+                                 'SELECT', 'SUBSCRIBE', 'UNWATCH', 'WATCH',
+                                 'XREAD', 'XREADGROUP'))
+
+
+def _seconds(value):
+    return float(value) if value else None
+
+
+def _boolean(value):
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+async def _multiplexed_result(waiter):
+    result = await waiter
+    if isinstance(result, ResponseError):
+        raise result.exception
+    return result
 
 
 class RedisStoreConnection(Connection):
@@ -23,23 +53,135 @@ class RedisStoreConnection(Connection):
             raise result.exception
         return result
 
-    async def execute_pipeline(self, commands, raise_on_error=True):
+    async def execute_pipeline(self, commands, raise_on_error=True,
+                               transaction=True):
         consumer = self.current_consumer()
-        consumer.start((commands, raise_on_error, []))
+        consumer.start((commands, raise_on_error, [], transaction))
         result = await consumer.on_finished
         if isinstance(result, ResponseError):
             raise result.exception
         return result
 
 
+class RedisMultiplexConnection(ResponseMixin, Protocol):
+    '''A connection carrying many in-flight commands.
+
+    Commands issued during the same event loop iteration are coalesced
+    into a single pipelined write. Responses are matched, in order, with
+    the FIFO of pending requests.
+    '''
+    def __init__(self, loop, **kw):
+        super().__init__(loop, **kw)
+        self.parser = self._producer._parser_class()
+        self._pending = deque()
+        self._queue = []
+        self._flush_handle = None
+        self.bind_event('connection_lost', self._connection_lost)
+
+    @property
+    def load(self):
+        '''Number of commands queued or waiting for a response'''
+        return len(self._pending) + len(self._queue)
+
+    def execute(self, *args, **options):
+        return _multiplexed_result(self._enqueue((args, options)))
+
+    def execute_pipeline(self, commands, raise_on_error=True,
+                         transaction=True):
+        return _multiplexed_result(
+            self._enqueue((commands, raise_on_error, [], transaction)))
+
+    def data_received(self, data):
+        parser = self.parser
+        parser.feed(data)
+        pending = self._pending
+        response = parser.get()
+        while response is not False:
+            waiter, request = pending[0]
+            if len(request) == 2:
+                pending.popleft()
+                self._resolve(waiter, self.command_response, request,
+                              response)
+            else:
+                responses = request[2]
+                responses.append(response)
+                if len(responses) == len(request[0]):
+                    pending.popleft()
+                    self._resolve(waiter, self.pipeline_response, request)
+            response = parser.get()
+
+    #    INTERNALS
+    def _enqueue(self, request, waiter=None):
+        if self.closed:
+            raise ConnectionResetError('No Transport')
+        if waiter is None:
+            waiter = self._loop.create_future()
+        self._queue.append((waiter, request))
+        if self._flush_handle is None:
+            self._flush_handle = self._loop.call_soon(self._flush)
+        return waiter
+
+    def _flush(self):
+        self._flush_handle = None
+        queue = self._queue
+        if queue and not self.closed:
+            self._queue = []
+            commands = []
+            for _, request in queue:
+                if len(request) == 2:
+                    commands.append(request)
+                else:
+                    commands.extend(request[0])
+            self._pending.extend(queue)
+            self._transport.write(self.parser.pack_pipeline(commands))
+
+    def _resolve(self, waiter, callback, *args):
+        try:
+            result = callback(*args)
+        except Exception as exc:
+            if not waiter.done():
+                waiter.set_exception(exc)
+        else:
+            if not waiter.done():
+                waiter.set_result(result)
+
+    def _connection_lost(self, _, exc=None):
+        pending = list(self._pending)
+        pending.extend(self._queue)
+        self._pending.clear()
+        self._queue = []
+        for waiter, _ in pending:
+            if not waiter.done():
+                waiter.set_exception(ConnectionResetError('Connection lost'))
+
+
 class RedisStore(RemoteStore):
     '''Redis :class:`.Store` implementation.
+
+    When ``multiplex`` is a positive integer, commands are sent via at
+    most ``multiplex`` :class:`.RedisMultiplexConnection` shared by all
+    callers rather than checking out a connection from the pool for
+    each command. Blocking and connection-state commands
+    always use the pool.
+
+    The ``pool_min_size``, ``pool_max_idle_time``, ``pool_max_lifetime``
+    and ``pool_keepalive`` parameters are passed to the connection
+    :class:`.Pool`, idle connections are checked with a ``PING``.
+
+    When ``sentinels`` (and the ``service`` name) or a list of ``nodes``
+    are given, the store connects to the primary discovered by a
+    :class:`.Failover` and follows it when it changes. Read-only commands
+    are sent to replicas when ``read_from_replicas`` is set.
     '''
     protocol_factory = partial(RedisStoreConnection, Consumer)
     supported_queries = frozenset(('filter', 'exclude'))
 
     def _init(self, namespace=None, parser_class=None, pool_size=50,
-              decode_responses=False, **kwargs):
+              decode_responses=False, multiplex=0, pool_min_size=0,
+              pool_max_idle_time=None, pool_max_lifetime=None,
+              pool_keepalive=None, sentinels=None, service=None,
+              nodes=None, read_from_replicas=False, failover_interval=10,
+              serializer=None, **kwargs):
         self._decode_responses = decode_responses
         if not parser_class:
             actor = get_actor()
@@ -48,10 +190,31 @@ class RedisStore(RemoteStore):
         self._parser_class = parser_class
         if namespace:
             self._urlparams['namespace'] = namespace
-        self._pool = Pool(self.connect, pool_size=pool_size, loop=self._loop)
+        if serializer:
+            self._urlparams['serializer'] = serializer
+        self._pool_options = dict(pool_size=int(pool_size),
+                                  loop=self._loop,
+                                  min_size=int(pool_min_size),
+                                  max_idle_time=_seconds(pool_max_idle_time),
+                                  max_lifetime=_seconds(pool_max_lifetime),
+                                  keepalive=_seconds(pool_keepalive),
+                                  ping=self._ping_connection)
+        self._failover = None
+        if sentinels or nodes:
+            self._failover = Failover(
+                self, sentinels=sentinels, service=service, nodes=nodes,
+                read_from_replicas=_boolean(read_from_replicas),
+                interval=failover_interval)
+        self._pool = self._create_pool()
+        self._pubsubs = WeakSet()
         if self._database is None:
             self._database = 0
         self._database = int(self._database)
+        self._multiplex = int(multiplex)
+        self._multiplexed = []
+        # requests waiting for the first multiplexed connection
+        self._multiplex_queue = []
+        self._multiplex_opening = None
         self.loaded_scripts = set()
 
     @property
@@ -72,37 +235,56 @@ class RedisStore(RemoteStore):
         '''Get a :class:`.RedisClient` for the Store'''
         return RedisClient(self)
 
-    def pipeline(self):
+    def pipeline(self, transaction=True, chunk_size=None):
         '''Get a :class:`.Pipeline` for the Store'''
-        return Pipeline(self)
+        return Pipeline(self, transaction, chunk_size)
+
+    @property
+    def failover(self):
+        '''The :class:`.Failover` tracking primary and replicas, if any'''
+        return self._failover
 
     def pubsub(self, protocol=None):
-        return RedisPubSub(self, protocol=protocol)
+        pubsub = RedisPubSub(self, protocol=protocol)
+        self._pubsubs.add(pubsub)
+        return pubsub
 
     def ping(self):
         return self.client().ping()
 
+    def pool_metrics(self):
+        '''Metrics of the connection :class:`.Pool`'''
+        return self._pool.metrics()
+
     async def execute(self, *args, **options):
-        connection = await self._pool.connect()
-        with connection:
-            result = await connection.execute(*args, **options)
-            return result
+        if self._failover:
+            try:
+                return await self._execute(*args, **options)
+            except FAILOVER_ERRORS + (ReadOnlyError,) as exc:
+                self._failover.failed(exc)
+                raise
+        return await self._execute(*args, **options)
 
-    async def execute_pipeline(self, commands, raise_on_error=True):
-        conn = await self._pool.connect()
-        with conn:
-            result = await conn.execute_pipeline(commands, raise_on_error)
-            return result
+    async def execute_pipeline(self, commands, raise_on_error=True,
+                               transaction=True):
+        if self._failover:
+            try:
+                return await self._execute_pipeline(commands, raise_on_error,
+                                                    transaction)
+            except FAILOVER_ERRORS + (ReadOnlyError,) as exc:
+                self._failover.failed(exc)
+                raise
+        return await self._execute_pipeline(commands, raise_on_error,
+                                            transaction)
 
-    async def connect(self, protocol_factory=None):
-        protocol_factory = protocol_factory or self.create_protocol
-        if isinstance(self._host, tuple):
-            host, port = self._host
-            transport, connection = await self._loop.create_connection(
-                protocol_factory, host, port)
-        else:
-            raise NotImplementedError('Could not connect to %s' %
-                                      str(self._host))
+    async def connect(self, protocol_factory=None, address=None):
+        '''Connect to ``address``, the primary node by default'''
+        if address is None:
+            if self._failover:
+                address = await self._failover.primary_address()
+            else:
+                address = self._host
+        connection = await self._open(address, protocol_factory)
         if self._password:
             await connection.execute('AUTH', self._password)
         if self._database:
@@ -114,7 +296,15 @@ class RedisStore(RemoteStore):
 
     def close(self):
         '''Close all open connections.'''
-        return self._pool.close()
+        waiters = [c.close() for c in self._multiplexed]
+        self._multiplexed = []
+        if self._multiplex_opening:
+            self._multiplex_opening.cancel()
+        self._multiplex_failed(ConnectionResetError('Store closed'))
+        waiters.append(self._pool.close())
+        if self._failover:
+            waiters.extend(self._failover.close())
+        return asyncio.gather(*waiters, loop=self._loop)
 
     def has_query(self, query_type):
         return query_type in self.supported_queries
@@ -124,6 +314,107 @@ class RedisStore(RemoteStore):
         postfix = ':'.join((to_string(p) for p in args if p is not None))
         return '%s:%s' % (key, postfix) if postfix else key
 
+    async def _execute(self, *args, **options):
+        command = to_string(args[0]).upper()
+        pool = self._pool
+        if (self._failover and self._failover.read_from_replicas and
+                command in READONLY_COMMANDS):
+            pool = self._failover.replica_pool() or pool
+        elif self._multiplex and command not in CONNECTION_COMMANDS:
+            return await _multiplexed_result(
+                self._multiplexed_request((args, options)))
+        connection = await pool.connect()
+        with connection:
+            result = await connection.execute(*args, **options)
+            return result
+
+    async def _execute_pipeline(self, commands, raise_on_error, transaction):
+        if self._multiplex:
+            return await _multiplexed_result(self._multiplexed_request(
+                (commands, raise_on_error, [], transaction)))
+        conn = await self._pool.connect()
+        with conn:
+            result = await conn.execute_pipeline(commands, raise_on_error,
+                                                 transaction)
+            return result
+
+    async def _open(self, address, protocol_factory=None):
+        protocol_factory = protocol_factory or self.create_protocol
+        if isinstance(address, tuple):
+            host, port = address
+            transport, connection = await self._loop.create_connection(
+                protocol_factory, host, port)
+        else:
+            raise NotImplementedError('Could not connect to %s' %
+                                      str(address))
+        return connection
+
+    def _create_pool(self, address=None):
+        return Pool(partial(self.connect, address=address),
+                    **self._pool_options)
+
+    def _switch_primary(self, address):
+        '''The primary moved to ``address``: drop connections to the
+        previous primary, publish/subscribe handlers reconnect.
+        '''
+        self._host = address
+        pool, self._pool = self._pool, self._create_pool()
+        pool.close()
+        multiplexed, self._multiplexed = self._multiplexed, []
+        for connection in multiplexed:
+            connection.close()
+        for pubsub in list(self._pubsubs):
+            if pubsub._connection:
+                pubsub._connection.close()
+
+    def _ping_connection(self, connection):
+        return connection.execute('PING')
+
+    def _multiplexed_request(self, request):
+        '''Send ``request`` via the least loaded multiplexed connection.
+
+        Until the first connection is open requests are queued by the
+        store so that they are written in the order they were issued.
+        Return a future called back with the response.
+        '''
+        connections = self._multiplexed
+        if (len(connections) < self._multiplex and
+                self._multiplex_opening is None):
+            self._multiplex_opening = asyncio.ensure_future(
+                self._open_multiplexed(), loop=self._loop)
+        if connections:
+            connection = min(connections, key=lambda c: c.load)
+            return connection._enqueue(request)
+        waiter = self._loop.create_future()
+        self._multiplex_queue.append((waiter, request))
+        return waiter
+
+    async def _open_multiplexed(self):
+        protocol_factory = partial(RedisMultiplexConnection, self._loop,
+                                   producer=self)
+        try:
+            connection = await self.connect(protocol_factory)
+        except Exception as exc:
+            self._multiplex_failed(exc)
+        else:
+            connection.bind_event('connection_lost', self._multiplexed_lost)
+            self._multiplexed.append(connection)
+            queue, self._multiplex_queue = self._multiplex_queue, []
+            for waiter, request in queue:
+                connection._enqueue(request, waiter)
+        finally:
+            self._multiplex_opening = None
+
+    def _multiplex_failed(self, exc):
+        queue, self._multiplex_queue = self._multiplex_queue, []
+        for waiter, _ in queue:
+            if not waiter.done():
+                waiter.set_exception(exc)
+
+    def _multiplexed_lost(self, connection, exc=None):
+        if connection in self._multiplexed:
+            self._multiplexed.remove(connection)
+
     def meta(self, meta):
         '''Extract model metadata for lua script stdnet/lib/lua/odm.lua'''
         #  indices = dict(((idx.attname, idx.unique) for idx in meta.indices))
@@ -333,6 +333,13 @@ class PubSub(EventHandler):
         '''
         raise NotImplementedError
 
+    def publish_batch(self, messages):
+        '''Publish a list of ``(channel, message)`` pairs.
+
+        Messages are already encoded by the :attr:`protocol`.
+        '''
+        raise NotImplementedError
+
     def count(self, *channels):
         '''Returns the number of subscribers (not counting clients
         subscribed to patterns) for the specified channels.
@@ -47,6 +47,7 @@ class ClientMixin:
         self.store = store
         self.database = 0
         self.transaction = None
+        self.reply_buffer = None
         self.last_command = ''
         self.flag = 0
         self.blocked = None
@@ -70,9 +71,14 @@ class ClientMixin:
                     return self.reply_error(self.store.PUBSUB_ONLY)
             if self.blocked:
                 return self.reply_error('Blocked client cannot request')
-            if self.transaction is not None and command not in 'exec':
+            if (self.transaction is not None and
+                    command not in self.store.TRANSACTION_COMMANDS):
+                if not handle:
+                    # abort the transaction at EXEC
+                    self.flag |= self.store.DIRTY_EXEC
+                    return self.reply_error("unknown command '%s'" % command)
                 self.transaction.append((handle, request))
-                return self._transport.write(self.store.QUEUED)
+                return self._write(self.store.QUEUED)
         self._execute_command(handle, request)
 
     def _execute_command(self, handle, request):
@@ -195,8 +201,8 @@ class PulsarStoreClient(pulsar.Protocol, ClientMixin):
 
     # Internals
     def _write(self, response):
-        if self.transaction is not None:
-            self.transaction.append(response)
+        if self.reply_buffer is not None:
+            self.reply_buffer.extend(response)
         elif not self._transport._closing:
             self._transport.write(response)
 
@@ -232,15 +238,14 @@ class Blocked:
             store._bpop_blocked_clients -= 1
             #
             # make sure to remove the client from the set of blocked
-            # clients in the database associated with key
-            if key is None:
-                bkeys = client.db._blocking_keys
-                for key in self.keys:
-                    clients = bkeys.get(key)
-                    if clients:
-                        clients.discard(client)
-                        if not clients:
-                            bkeys.pop(key)
+            # clients in the database associated with keys
+            bkeys = client.db._blocking_keys
+            for bkey in self.keys:
+                clients = bkeys.get(bkey)
+                if clients:
+                    clients.discard(client)
+                    if not clients:
+                        bkeys.pop(bkey)
             #
             # send the response
             if value is None:
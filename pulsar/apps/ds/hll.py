@@ -0,0 +1,232 @@
+'''HyperLogLog cardinality estimator stored as a string value.
+
+The value is a ``bytearray`` with a 16 bytes header followed by the
+registers::
+
+    +------+---+-----+-------------+-----------+
+    | HYLL | E | N/U | Cardinality | registers |
+    +------+---+-----+-------------+-----------+
+
+``E`` is the encoding, ``DENSE`` or ``SPARSE``. The cardinality is a
+little endian cache of the last estimate, invalidated by setting the
+most significant bit of its last byte.
+
+* Dense registers are 6 bits wide and packed little endian, 12KB for
+  the 16384 registers.
+* Sparse registers are a sorted sequence of 3 bytes entries holding the
+  register index and value. It is used for small cardinalities and
+  converted to the dense encoding once larger than :data:`SPARSE_MAX`.
+
+Bulk operations (count and merge) work on unpacked registers, one byte
+per register, which are converted from and to the dense encoding using
+slice assignments and big integer bitwise operations rather than
+per-register python loops.
+'''
+from hashlib import blake2b
+from math import log
+
+
+MAGIC = b'HYLL'
+DENSE = 0
+SPARSE = 1
+P = 14
+REGISTERS = 1 << P
+HEADER_SIZE = 16
+DENSE_SIZE = REGISTERS * 6 // 8
+SPARSE_MAX = 3000
+INVALID_CACHE = 0x80
+ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+
+_HIGH = int.from_bytes(b'\x80' * REGISTERS, 'little')
+_LANE_MASKS = tuple(int.from_bytes(mask * (REGISTERS // 4), 'little')
+                    for mask in (b'\x3f\x00\x00\x00', b'\x00\x3f\x00\x00',
+                                 b'\x00\x00\x3f\x00', b'\x00\x00\x00\x3f'))
+
+
+def is_hll(value):
+    '''Check if ``value`` is a valid HyperLogLog string'''
+    if len(value) < HEADER_SIZE or value[:4] != MAGIC:
+        return False
+    encoding = value[4]
+    size = len(value) - HEADER_SIZE
+    if encoding == DENSE:
+        return size == DENSE_SIZE
+    return encoding == SPARSE and not size % 3
+
+
+def hll_new():
+    '''A new empty HyperLogLog in the sparse encoding'''
+    value = bytearray(HEADER_SIZE)
+    value[:4] = MAGIC
+    value[4] = SPARSE
+    return value
+
+
+def hll_add(value, elements):
+    '''Add ``elements`` to the HyperLogLog ``value``.
+
+    Return ``True`` if at least one register was updated.
+    '''
+    updates = {}
+    for element in elements:
+        index, rank = _hash(element)
+        if rank > updates.get(index, 0):
+            updates[index] = rank
+    if value[4] == SPARSE:
+        registers = _sparse_registers(value)
+        changed = False
+        for index, rank in updates.items():
+            if rank > registers.get(index, 0):
+                registers[index] = rank
+                changed = True
+        if changed:
+            if 3*len(registers) > SPARSE_MAX:
+                value[4] = DENSE
+                value[HEADER_SIZE:] = _pack(_sparse_unpacked(registers))
+            else:
+                value[HEADER_SIZE:] = b''.join(
+                    ((index << 6) | rank).to_bytes(3, 'big')
+                    for index, rank in sorted(registers.items()))
+    else:
+        changed = False
+        for index, rank in updates.items():
+            if _dense_set(value, index, rank):
+                changed = True
+    if changed:
+        value[15] |= INVALID_CACHE
+    return changed
+
+
+def hll_count(value):
+    '''Estimated cardinality of the HyperLogLog ``value``.
+
+    The estimate is cached in the header until the next update.
+    '''
+    if not value[15] & INVALID_CACHE:
+        return int.from_bytes(value[8:16], 'little')
+    if value[4] == SPARSE:
+        registers = _sparse_registers(value)
+        histogram = [0]*64
+        histogram[0] = REGISTERS - len(registers)
+        for rank in registers.values():
+            histogram[rank] += 1
+    else:
+        histogram = _histogram(hll_registers(value))
+    count = _estimate(histogram)
+    value[8:16] = count.to_bytes(8, 'little')
+    return count
+
+
+def hll_registers(value):
+    '''Unpacked registers, one byte per register, of ``value``'''
+    if value[4] == SPARSE:
+        return _sparse_unpacked(_sparse_registers(value))
+    # spread each 3 bytes group of 4 registers into 4 bytes
+    groups = bytearray(REGISTERS)
+    dense = value[HEADER_SIZE:]
+    groups[0::4] = dense[0::3]
+    groups[1::4] = dense[1::3]
+    groups[2::4] = dense[2::3]
+    x = int.from_bytes(groups, 'little')
+    m0, m1, m2, m3 = _LANE_MASKS
+    x = (x & m0) | ((x << 2) & m1) | ((x << 4) & m2) | ((x << 6) & m3)
+    return x.to_bytes(REGISTERS, 'little')
+
+
+def hll_merge(values):
+    '''Unpacked registers of the union of HyperLogLog ``values``.
+
+    Registers are merged with a bytewise max performed on big
+    integers, one operation for all registers.
+    '''
+    result = 0
+    for value in values:
+        registers = int.from_bytes(hll_registers(value), 'little')
+        # the high bit of each byte is set where result >= registers
+        ge = (((result | _HIGH) - registers) & _HIGH) >> 7
+        mask = ge * 0xff
+        result = (result & mask) | (registers & ~mask)
+    return result.to_bytes(REGISTERS, 'little')
+
+
+def hll_dense(registers):
+    '''A new dense HyperLogLog from unpacked ``registers``'''
+    value = hll_new()
+    value[4] = DENSE
+    value[15] = INVALID_CACHE
+    value.extend(_pack(registers))
+    return value
+
+
+def hll_count_registers(registers):
+    '''Estimated cardinality from unpacked ``registers``'''
+    return _estimate(_histogram(registers))
+
+
+#    INTERNALS
+def _hash(element):
+    h = int.from_bytes(blake2b(element, digest_size=8).digest(), 'little')
+    index = h & (REGISTERS - 1)
+    # a sentinel bit guarantees a rank of at most 64 - P + 1
+    rest = (h >> P) | (1 << (64 - P))
+    return index, (rest & -rest).bit_length()
+
+
+def _estimate(histogram):
+    z = 0.0
+    for rank, count in enumerate(histogram):
+        if count:
+            z += count / (1 << rank)
+    estimate = ALPHA * REGISTERS * REGISTERS / z
+    zeros = histogram[0]
+    if estimate <= 2.5 * REGISTERS and zeros:
+        estimate = REGISTERS * log(REGISTERS / zeros)
+    return int(estimate + 0.5)
+
+
+def _histogram(registers):
+    return [registers.count(rank) for rank in range(64)]
+
+
+def _pack(registers):
+    x = int.from_bytes(registers, 'little')
+    m0, m1, m2, m3 = _LANE_MASKS
+    x = (x & m0) | ((x & m1) >> 2) | ((x & m2) >> 4) | ((x & m3) >> 6)
+    groups = x.to_bytes(REGISTERS, 'little')
+    dense = bytearray(DENSE_SIZE)
+    dense[0::3] = groups[0::4]
+    dense[1::3] = groups[1::4]
+    dense[2::3] = groups[2::4]
+    return dense
+
+
+def _dense_set(value, index, rank):
+    bit = 6*index
+    pos = HEADER_SIZE + (bit >> 3)
+    shift = bit & 7
+    word = value[pos]
+    if pos + 1 < len(value):
+        word |= value[pos + 1] << 8
+    if (word >> shift) & 63 >= rank:
+        return False
+    word = (word & ~(63 << shift)) | (rank << shift)
+    value[pos] = word & 255
+    if pos + 1 < len(value):
+        value[pos + 1] = word >> 8
+    return True
+
+
+def _sparse_registers(value):
+    data = value[HEADER_SIZE:]
+    registers = {}
+    for i in range(0, len(data), 3):
+        entry = int.from_bytes(data[i:i+3], 'big')
+        registers[entry >> 6] = entry & 63
+    return registers
+
+
+def _sparse_unpacked(registers):
+    unpacked = bytearray(REGISTERS)
+    for index, rank in registers.items():
+        unpacked[index] = rank
+    return unpacked
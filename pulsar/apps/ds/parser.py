@@ -27,9 +27,14 @@ class NoScriptError(ResponseError):
     pass
 
 
+class ReadOnlyError(ResponseError):
+    pass
+
+
 EXCEPTION_CLASSES = {
     'ERR': ResponseError,
     'NOSCRIPT': NoScriptError,
+    'READONLY': ReadOnlyError,
 }
 
 
@@ -43,15 +48,15 @@ def response_error(response):
     return EXCEPTION_CLASSES[error_code](response)
 
 
-def PyRedisParser():
-    return Parser(InvalidResponse, response_error)
+def PyRedisParser(**kw):
+    return Parser(InvalidResponse, response_error, **kw)
 
 
 if pulsar.HAS_C_EXTENSIONS:
     from pulsar.utils.lib import RedisParser as _RedisParser
 
-    def RedisParser():
-        return _RedisParser(InvalidResponse, response_error)
+    def RedisParser(**kw):
+        return _RedisParser(InvalidResponse, response_error, **kw)
 
 else:    # pragma nocover
     RedisParser = PyRedisParser
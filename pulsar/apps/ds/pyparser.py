@@ -1,6 +1,7 @@
 '''A parser for redis messages
 '''
-from itertools import starmap
+from itertools import chain, starmap
+from collections.abc import Sequence
 
 nil = b'$-1\r\n'
 null_array = b'*-1\r\n'
@@ -9,6 +10,44 @@ REPLAY_TYPE = frozenset((b'$',   # REDIS_REPLY_STRING,
                          b':',   # REDIS_REPLY_INTEGER,
                          b'+',   # REDIS_REPLY_STATUS,
                          b'-'))  # REDIS_REPLY_ERROR
+REPLY_STRING = ord('$')
+REPLY_ARRAY = ord('*')
+REPLY_INTEGER = ord(':')
+REPLY_STATUS = ord('+')
+REPLY_ERROR = ord('-')
+CRLF = b'\r\n'
+# Pre-encoded array and bulk string headers
+HEADERS_SIZE = 1024
+ARRAY_HEADERS = tuple(('*%d\r\n' % n).encode('utf-8')
+                      for n in range(HEADERS_SIZE))
+BULK_HEADERS = tuple(('$%d\r\n' % n).encode('utf-8')
+                     for n in range(HEADERS_SIZE))
+# Maximum number of cached command prefixes
+PREFIXES_SIZE = 1024
+_prefixes = {}
+
+
+def array_header(n):
+    return ARRAY_HEADERS[n] if n < HEADERS_SIZE else b'*%d\r\n' % n
+
+
+def bulk_header(n):
+    return BULK_HEADERS[n] if n < HEADERS_SIZE else b'$%d\r\n' % n
+
+
+def command_prefix(name):
+    '''Encoded bulk string of a command ``name``, cached'''
+    prefix = _prefixes.get(name)
+    if prefix is None:
+        value = name
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        elif not isinstance(value, bytes):
+            value = str(value).encode('utf-8')
+        prefix = bulk_header(len(value)) + value + CRLF
+        if len(_prefixes) < PREFIXES_SIZE:
+            _prefixes[name] = prefix
+    return prefix
 
 
 class String:
@@ -23,12 +62,11 @@ class String:
         length = self._length
         if length >= 0:
             b = parser._inbuffer
-            if len(b) >= length+2:
-                parser._inbuffer, chunk = b[length+2:], bytes(b[:length])
-                if parser.encoding:
-                    return chunk.decode(parser.encoding)
-                else:
-                    return chunk
+            pos = parser._pos
+            end = pos + length
+            if len(b) >= end + 2:
+                parser._pos = end + 2
+                return parser._chunk(memoryview(b), pos, end)
             else:
                 parser._current = self
                 return False
@@ -62,15 +100,95 @@ class ArrayTask:
             return False
 
 
+class LazyArrayTask:
+    '''Scan an array reply without decoding its elements.
+
+    ``_offsets`` are the offsets of the elements found so far, relative
+    to the parser position, which is not moved until the whole array is
+    available.
+    '''
+    __slots__ = ('_length', '_offsets', 'next')
+
+    def __init__(self, length, next):
+        self._length = length
+        self._offsets = [0]
+        self.next = next
+
+    def decode(self, parser, result):
+        parser._current = None
+        b = parser._inbuffer
+        pos = parser._pos
+        offsets = self._offsets
+        while len(offsets) <= self._length:
+            end = parser._skip(b, pos + offsets[-1])
+            if end < 0:
+                parser._current = self
+                return False
+            offsets.append(end - pos)
+        end = pos + offsets[-1]
+        parser._pos = end
+        return LazyArray(parser, bytes(memoryview(b)[pos:end]), offsets)
+
+
+class LazyArray(Sequence):
+    '''An array reply whose elements are decoded when accessed.
+
+    The reply is stored in a single ``bytes`` object, nested arrays
+    are :class:`LazyArray` over the same data.
+    '''
+    __slots__ = ('_parser', '_data', '_offsets')
+
+    def __init__(self, parser, data, offsets):
+        self._parser = parser
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = range(len(self))[index]
+        offsets = self._offsets
+        return self._parser._decode(self._data, offsets[index],
+                                    offsets[index+1])
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, Sequence)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
 class Parser:
-    '''A python parser for redis.'''
+    '''A python parser for redis.
+
+    Data is accumulated in a ``bytearray`` parsed from a read offset,
+    the consumed part is discarded only when larger than
+    :attr:`compact_size` and half of the buffer. Commands are packed
+    using pre-encoded headers and cached command name prefixes.
+
+    :param zero_copy: return bulk strings as ``memoryview`` slices of the
+        buffer rather than ``bytes``.
+    :param lazy_arrays: return arrays as :class:`LazyArray`, stored in a
+        single copy of the reply and decoded when accessed.
+    '''
     encoding = None
+    compact_size = 65536
 
-    def __init__(self, protocolError, responseError):
+    def __init__(self, protocolError, responseError, zero_copy=False,
+                 lazy_arrays=False):
         self.protocolError = protocolError
         self.responseError = responseError
+        self.zero_copy = zero_copy
+        self.lazy_arrays = lazy_arrays
         self._current = None
         self._inbuffer = bytearray()
+        self._pos = 0
+        self._stack = []
 
     def on_connect(self, connection):
         if connection.decode_responses:
@@ -81,28 +199,106 @@ class Parser:
 
     def feed(self, buffer):
         '''Feed new data into the buffer'''
-        self._inbuffer.extend(buffer)
+        b = self._inbuffer
+        pos = self._pos
+        if pos and (pos == len(b) or
+                    (pos > self.compact_size and 2*pos > len(b))):
+            b = self._compact(b, pos)
+        try:
+            b.extend(buffer)
+        except BufferError:
+            # memoryview slices of the buffer are still alive
+            self._compact(b, self._pos, True).extend(buffer)
 
     def get(self):
-        '''Called by the protocol consumer'''
+        '''Called by the protocol consumer.
+
+        Return the next reply or ``False`` when more data is needed. Arrays
+        are decoded in a single loop, partially decoded arrays are kept in
+        a stack of ``(response, length)`` pairs until more data is fed.
+        '''
         if self._current:
-            return self._resume(self._current, False)
-        else:
-            return self._get(None)
+            return self._current.decode(self, False)
+        b = self._inbuffer
+        pos = self._pos
+        size = len(b)
+        stack = self._stack
+        find = b.find
+        view = memoryview(b)
+        try:
+            while True:
+                idx = find(CRLF, pos)
+                if idx < 0:
+                    break
+                rtype = b[pos] if idx > pos else None
+                if rtype == REPLY_STRING:
+                    length = int(b[pos+1:idx])
+                    if length >= 0:
+                        end = idx + 2 + length
+                        if end + 2 > size:
+                            break
+                        if self.zero_copy or self.encoding:
+                            value = self._chunk(view, idx + 2, end)
+                        else:
+                            value = bytes(view[idx+2:end])
+                        pos = end + 2
+                    else:
+                        value = None
+                        pos = idx + 2
+                elif rtype == REPLY_ARRAY:
+                    length = int(b[pos+1:idx])
+                    pos = idx + 2
+                    if length >= 0 and self.lazy_arrays:
+                        self._pos = pos
+                        task = LazyArrayTask(length, None)
+                        return task.decode(self, False)
+                    elif length > 0:
+                        stack.append(([], length))
+                        continue
+                    value = None if length < 0 else []
+                elif rtype == REPLY_INTEGER:
+                    value = int(b[pos+1:idx])
+                    pos = idx + 2
+                elif rtype == REPLY_STATUS:
+                    value = bytes(b[pos+1:idx])
+                    pos = idx + 2
+                elif rtype == REPLY_ERROR:
+                    value = self.responseError(b[pos+1:idx].decode('utf-8'))
+                    pos = idx + 2
+                else:
+                    self._protocol_error()
+                while stack:
+                    response, length = stack[-1]
+                    response.append(value)
+                    if len(response) < length:
+                        break
+                    stack.pop()
+                    value = response
+                else:
+                    self._pos = pos
+                    return value
+            self._pos = pos
+            return False
+        finally:
+            view.release()
 
     def bulk(self, value):
         if value is None:
             return nil
         else:
-            return ('$%d\r\n' % len(value)).encode('utf-8') + value + b'\r\n'
+            return bulk_header(len(value)) + value + CRLF
 
     def multi_bulk_len(self, len):
-        return ('*%s\r\n' % len).encode('utf-8')
+        return array_header(len)
 
     def multi_bulk(self, args):
         '''Multi bulk encoding for list/tuple ``args``
         '''
-        return null_array if args is None else b''.join(self._pack(args))
+        if args is None:
+            return null_array
+        chunks = []
+        self._pack(args, chunks)
+        return b''.join(chunks)
 
     def pack_command(self, args):
         '''Encode a command to send to the server.
@@ -113,49 +309,46 @@ class Parser:
 
     def pack_pipeline(self, commands):
         '''Packs pipeline commands into bytes.'''
-        return b''.join(
-            starmap(lambda *args: b''.join(self._pack_command(args)),
-                    (a for a, _ in commands)))
+        pack = self._pack_command
+        return b''.join(chain.from_iterable(pack(args)
+                                            for args, _ in commands))
 
     #    INTERNALS
     def _pack_command(self, args):
-        crlf = b'\r\n'
-        yield ('*%d\r\n' % len(args)).encode('utf-8')
-        for value in args:
+        chunks = [array_header(len(args)), command_prefix(args[0])]
+        append = chunks.append
+        for value in args[1:]:
             if isinstance(value, str):
                 value = value.encode('utf-8')
             elif not isinstance(value, bytes):
                 value = str(value).encode('utf-8')
-            yield ('$%d\r\n' % len(value)).encode('utf-8')
-            yield value
-            yield crlf
+            append(bulk_header(len(value)))
+            append(value)
+            append(CRLF)
+        return chunks
 
-    def _pack(self, args):
-        crlf = b'\r\n'
-        yield ('*%d\r\n' % len(args)).encode('utf-8')
+    def _pack(self, args, chunks):
+        append = chunks.append
+        append(array_header(len(args)))
         for value in args:
             if value is None:
-                yield nil
-            elif isinstance(value, bytes):
-                yield ('$%d\r\n' % len(value)).encode('utf-8')
-                yield value
-                yield crlf
+                append(nil)
+                continue
             elif isinstance(value, str):
                 value = value.encode('utf-8')
-                yield ('$%d\r\n' % len(value)).encode('utf-8')
-                yield value
-                yield crlf
+            elif isinstance(value, bytes):
+                pass
             elif hasattr(value, 'items'):
-                for value in self._pack(tuple(self._lua_dict(value))):
-                    yield value
+                self._pack(tuple(self._lua_dict(value)), chunks)
+                continue
             elif hasattr(value, '__len__'):
-                for value in self._pack(value):
-                    yield value
+                self._pack(value, chunks)
+                continue
             else:
                 value = str(value).encode('utf-8')
-                yield ('$%d\r\n' % len(value)).encode('utf-8')
-                yield value
-                yield crlf
+            append(bulk_header(len(value)))
+            append(value)
+            append(CRLF)
 
     def _lua_dict(self, d):
         index = 0
@@ -166,35 +359,144 @@ class Parser:
                 break
             yield v
 
+    def _chunk(self, view, start, end):
+        chunk = view[start:end]
+        if self.encoding:
+            return str(chunk, self.encoding)
+        return chunk if self.zero_copy else bytes(chunk)
+
+    def _skip(self, b, pos):
+        '''End of the reply starting at ``pos`` or -1 when incomplete'''
+        idx = b.find(b'\r\n', pos)
+        if idx < 0:
+            return -1
+        rtype = b[pos] if idx > pos else None
+        if rtype == REPLY_STRING:
+            length = int(b[pos+1:idx])
+            end = idx + 4 + length if length >= 0 else idx + 2
+            return end if end <= len(b) else -1
+        elif rtype == REPLY_ARRAY:
+            length = int(b[pos+1:idx])
+            pos = idx + 2
+            for _ in range(length):
+                pos = self._skip(b, pos)
+                if pos < 0:
+                    break
+            return pos
+        elif rtype in (REPLY_INTEGER, REPLY_STATUS, REPLY_ERROR):
+            return idx + 2
+        else:
+            self._protocol_error()
+
+    def _decode(self, data, start, end):
+        '''Decode the complete reply in ``data[start:end]``'''
+        idx = data.find(b'\r\n', start)
+        rtype = data[start]
+        if rtype == REPLY_STRING:
+            length = int(data[start+1:idx])
+            if length >= 0:
+                return self._chunk(memoryview(data), idx + 2,
+                                   idx + 2 + length)
+        elif rtype == REPLY_ARRAY:
+            length = int(data[start+1:idx])
+            if length >= 0:
+                offsets = [idx + 2]
+                for _ in range(length):
+                    offsets.append(self._skip(data, offsets[-1]))
+                return LazyArray(self, data, offsets)
+        elif rtype == REPLY_INTEGER:
+            return int(data[start+1:idx])
+        elif rtype == REPLY_STATUS:
+            return data[start+1:idx]
+        else:
+            return self.responseError(data[start+1:idx].decode('utf-8'))
+
+    def _protocol_error(self):
+        # Clear the buffer and raise
+        self._inbuffer = bytearray()
+        self._pos = 0
+        self._stack = []
+        raise self.protocolError('Protocol Error')
+
+    def _compact(self, b, pos, copy=False):
+        if not copy:
+            try:
+                del b[:pos]
+            except BufferError:
+                copy = True
+        if copy:
+            b = self._inbuffer = bytearray(memoryview(b)[pos:])
+        self._pos = 0
+        return b
+
+    def buffer(self):
+        '''Current unparsed buffer'''
+        return bytes(self._inbuffer[self._pos:])
+
+
+class TaskParser(Parser):
+    '''The original python parser, decoding replies with a chain of tasks
+    and packing commands with generators.
+
+    Slower than :class:`Parser`, it is used as a reference in tests and
+    benchmarks.
+    '''
+    def get(self):
+        if self._current:
+            return self._resume(self._current, False)
+        else:
+            return self._get(None)
+
+    def pack_command(self, args):
+        return b''.join(self._pack_command(args))
+
+    def pack_pipeline(self, commands):
+        return b''.join(
+            starmap(lambda *args: b''.join(self._pack_command(args)),
+                    (a for a, _ in commands)))
+
+    def _pack_command(self, args):
+        crlf = b'\r\n'
+        yield ('*%d\r\n' % len(args)).encode('utf-8')
+        for value in args:
+            if isinstance(value, str):
+                value = value.encode('utf-8')
+            elif not isinstance(value, bytes):
+                value = str(value).encode('utf-8')
+            yield ('$%d\r\n' % len(value)).encode('utf-8')
+            yield value
+            yield crlf
+
     def _get(self, next):
         b = self._inbuffer
-        length = b.find(b'\r\n')
-        if length >= 0:
-            self._inbuffer, response = b[length+2:], bytes(b[:length])
-            rtype, response = response[:1], response[1:]
-            if rtype == b'-':
-                return self.responseError(response.decode('utf-8'))
-            elif rtype == b':':
-                return int(response)
-            elif rtype == b'+':
-                return response
-            elif rtype == b'$':
-                task = String(int(response), next)
+        pos = self._pos
+        idx = b.find(b'\r\n', pos)
+        if idx >= 0:
+            rtype = b[pos] if idx > pos else None
+            self._pos = idx + 2
+            if rtype == REPLY_ERROR:
+                return self.responseError(b[pos+1:idx].decode('utf-8'))
+            elif rtype == REPLY_INTEGER:
+                return int(b[pos+1:idx])
+            elif rtype == REPLY_STATUS:
+                return bytes(b[pos+1:idx])
+            elif rtype == REPLY_STRING:
+                task = String(int(b[pos+1:idx]), next)
                 return task.decode(self, False)
-            elif rtype == b'*':
-                task = ArrayTask(int(response), next)
+            elif rtype == REPLY_ARRAY:
+                length = int(b[pos+1:idx])
+                if length < 0:
+                    return None
+                elif self.lazy_arrays:
+                    task = LazyArrayTask(length, next)
+                else:
+                    task = ArrayTask(length, next)
                 return task.decode(self, False)
             else:
-                # Clear the buffer and raise
-                self._inbuffer = bytearray()
-                raise self.protocolError('Protocol Error')
+                self._protocol_error()
         else:
             return False
 
-    def buffer(self):
-        '''Current buffer'''
-        return bytes(self._inbuffer)
-
     def _resume(self, task, result):
         result = task.decode(self, result)
         if result is not False and task.next:
@@ -45,19 +45,28 @@ import re
 import time
 import math
 import pickle
-from random import choice
+from sys import getsizeof
+from heapq import nlargest
+from random import choice, random
+from operator import itemgetter
 from itertools import islice, chain
 from functools import partial, reduce
-from collections import namedtuple
+from collections import namedtuple, deque
 from itertools import zip_longest
 
 import pulsar
 from pulsar.apps.socket import SocketServer
 from pulsar.utils.config import Global
-from pulsar.utils.structures import Dict, Zset, Deque
-
-from .parser import redis_parser
-from .utils import sort_command, count_bytes, and_op, or_op, xor_op, save_data
+from pulsar.utils.pep import to_string
+from pulsar.utils.system import psutil, convert_bytes
+from pulsar.utils.structures import Dict, Zset, Deque, Stream, StreamGroup
+from pulsar.utils.structures.stream import MIN_ID, MAX_ID
+
+from .parser import redis_parser, CommandError
+from .utils import (sort_command, count_bytes, and_op, or_op, xor_op,
+                    save_data, value_size)
+from .hll import (is_hll, hll_new, hll_add, hll_count, hll_merge, hll_dense,
+                  hll_count_registers)
 from .client import (command, PulsarStoreClient, Blocked,
                      COMMANDS_INFO, check_input, redis_to_py_pattern)
 
@@ -196,6 +205,8 @@ class PulsarDS(SocketServer):
 # #############################################################################
 # #    DATA STORE
 pubsub_patterns = namedtuple('pubsub_patterns', 're clients')
+xread_request = namedtuple('xread_request',
+                           'keys ids count group consumer noack')
 
 
 class Storage:
@@ -214,6 +225,8 @@ class Storage:
         self._expired_keys = 0
         self._dirty = 0
         self._bpop_blocked_clients = 0
+        self._used_memory_peak = 0
+        self._lazyfree = LazyFree(self._loop)
         self._last_save = int(time.time())
         self._channels = {}
         self._patterns = {}
@@ -233,22 +246,26 @@ class Storage:
         self.NOTIFY_ZSET = (1 << 7)
         self.NOTIFY_EXPIRED = (1 << 8)
         self.NOTIFY_EVICTED = (1 << 9)
+        self.NOTIFY_STREAM = (1 << 10)
         self.NOTIFY_ALL = (self.NOTIFY_GENERIC | self.NOTIFY_STRING |
                            self.NOTIFY_LIST | self.NOTIFY_SET |
                            self.NOTIFY_HASH | self.NOTIFY_ZSET |
-                           self.NOTIFY_EXPIRED | self.NOTIFY_EVICTED)
+                           self.NOTIFY_EXPIRED | self.NOTIFY_EVICTED |
+                           self.NOTIFY_STREAM)
 
         self.MONITOR = (1 << 2)
         self.MULTI = (1 << 3)
         self.BLOCKED = (1 << 4)
         self.DIRTY_CAS = (1 << 5)
+        self.DIRTY_EXEC = (1 << 6)
         #
         self._event_handlers = {self.NOTIFY_GENERIC: self._generic_event,
                                 self.NOTIFY_STRING: self._string_event,
                                 self.NOTIFY_SET: self._set_event,
                                 self.NOTIFY_HASH: self._hash_event,
                                 self.NOTIFY_LIST: self._list_event,
-                                self.NOTIFY_ZSET: self._zset_event}
+                                self.NOTIFY_ZSET: self._zset_event,
+                                self.NOTIFY_STREAM: self._stream_event}
         self._set_options = (b'ex', b'px', b'nx', b'xx')
         self.OK = b'+OK\r\n'
         self.QUEUED = b'+QUEUED\r\n'
@@ -263,14 +280,23 @@ class Storage:
         self.NOT_SUPPORTED = 'Command not yet supported'
         self.OUT_OF_BOUND = 'Out of bound'
         self.SYNTAX_ERROR = 'Syntax error'
+        self.INVALID_INTEGER = 'value is not an integer or out of range'
+        self.BIGGEST_KEYS = 5
+        self.INVALID_HLL = 'Key is not a valid HyperLogLog string value.'
+        self.INVALID_STREAM_ID = ('Invalid stream ID specified as stream '
+                                  'command argument')
+        self.EXECABORT = 'Transaction discarded because of previous errors.'
         self.SUBSCRIBE_COMMANDS = ('psubscribe', 'punsubscribe', 'subscribe',
                                    'unsubscribe', 'quit')
+        self.TRANSACTION_COMMANDS = frozenset(('discard', 'exec', 'multi',
+                                               'watch'))
         self.encoder = pickle
         self.hash_type = Dict
         self.list_type = Deque
         self.zset_type = Zset
+        self.stream_type = Stream
         self.data_types = (bytearray, set, self.hash_type,
-                           self.list_type, self.zset_type)
+                           self.list_type, self.zset_type, self.stream_type)
         self.zset_aggregate = {b'min': min,
                                b'max': max,
                                b'sum': sum}
@@ -278,12 +304,20 @@ class Storage:
                                 self.hash_type: self.NOTIFY_HASH,
                                 self.list_type: self.NOTIFY_LIST,
                                 set: self.NOTIFY_SET,
-                                self.zset_type: self.NOTIFY_ZSET}
+                                self.zset_type: self.NOTIFY_ZSET,
+                                self.stream_type: self.NOTIFY_STREAM}
         self._type_name_map = {bytearray: 'string',
                                self.hash_type: 'hash',
                                self.list_type: 'list',
                                set: 'set',
-                               self.zset_type: 'zset'}
+                               self.zset_type: 'zset',
+                               self.stream_type: 'stream'}
+        self._type_encoding_map = {bytearray: 'raw',
+                                   self.hash_type: 'hashtable',
+                                   self.list_type: 'linkedlist',
+                                   set: 'hashtable',
+                                   self.zset_type: 'skiplist',
+                                   self.stream_type: 'stream'}
         self.databases = dict(((num, Db(num, self))
                                for num in range(cfg.key_value_databases)))
         # Initialise lua
@@ -312,11 +346,9 @@ class Storage:
 
     @command('Keys')
     def exists(self, client, request, N):
-        check_input(request, N != 1)
-        if client.db.exists(request[1]):
-            client.reply_one()
-        else:
-            client.reply_zero()
+        check_input(request, not N)
+        exists = client.db.exists
+        client.reply_int(sum((1 for key in request[1:] if exists(key))))
 
     @command('Keys', True)
     def expire(self, client, request, N, m=1):
@@ -387,9 +419,27 @@ class Storage:
         self._signal(self._type_event_map[type(value)], db2, 'set', key, 1)
         client.reply_one()
 
-    @command('Keys', supported=False)
+    @command('Keys', subcommands=['encoding', 'freq', 'idletime',
+                                  'refcount'])
     def object(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, N != 2)
+        subcommand = request[1].decode('utf-8').lower()
+        key = request[2]
+        db = client.db
+        value = db.peek(key)
+        if value is None:
+            client.reply_bulk()
+        elif subcommand == 'encoding':
+            encoding = self._type_encoding_map[type(value)]
+            client.reply_bulk(encoding.encode('utf-8'))
+        elif subcommand == 'freq':
+            client.reply_int(db.frequency(key))
+        elif subcommand == 'idletime':
+            client.reply_int(db.idletime(key))
+        elif subcommand == 'refcount':
+            client.reply_one()
+        else:
+            client.reply_error("unknown command 'object %s'" % subcommand)
 
     @command('Keys', True)
     def persist(self, client, request, N):
@@ -499,6 +549,13 @@ class Storage:
             result = self._type_name_map[type(value)]
         client.reply_status(result)
 
+    @command('Keys', True)
+    def unlink(self, client, request, N):
+        check_input(request, not N)
+        unlink = client.db.unlink
+        result = reduce(lambda x, y: x + unlink(y), request[1:], 0)
+        client.reply_int(result)
+
     @command('Keys', supported=False)
     def scan(self, client, request, N):
         client.reply_error(self.NOT_SUPPORTED)
@@ -588,7 +645,8 @@ class Storage:
     def decr(self, client, request, N):
         check_input(request, N != 1)
         r = self._incrby(client, request[0], request[1], b'-1', int)
-        client.reply_int(r)
+        if r is not None:
+            client.reply_int(r)
 
     @command('Strings', True)
     def decrby(self, client, request, N):
@@ -598,7 +656,8 @@ class Storage:
         except Exception:
             val = request[2]
         r = self._incrby(client, request[0], request[1], val, int)
-        client.reply_int(r)
+        if r is not None:
+            client.reply_int(r)
 
     @command('Strings')
     def get(self, client, request, N):
@@ -682,19 +741,22 @@ class Storage:
     def incr(self, client, request, N):
         check_input(request, N != 1)
         r = self._incrby(client, request[0], request[1], b'1', int)
-        client.reply_int(r)
+        if r is not None:
+            client.reply_int(r)
 
     @command('Strings', True)
     def incrby(self, client, request, N):
         check_input(request, N != 2)
         r = self._incrby(client, request[0], request[1], request[2], int)
-        client.reply_int(r)
+        if r is not None:
+            client.reply_int(r)
 
     @command('Strings', True)
     def incrbyfloat(self, client, request, N):
         check_input(request, N != 2)
         r = self._incrby(client, request[0], request[1], request[2], float)
-        client.reply_bulk(str(r).encode('utf-8'))
+        if r is not None:
+            client.reply_bulk(str(r).encode('utf-8'))
 
     @command('Strings')
     def mget(self, client, request, N):
@@ -1776,6 +1838,374 @@ class Storage:
     def zscan(self, client, request, N):
         client.reply_error(self.NOT_SUPPORTED)
 
+    # #########################################################################
+    # #    STREAMS COMMANDS
+    @command('Streams', True)
+    def xack(self, client, request, N):
+        check_input(request, N < 3)
+        value = client.db.get(request[1])
+        if value is None:
+            return client.reply_zero()
+        elif not isinstance(value, self.stream_type):
+            return client.reply_wrongtype()
+        try:
+            ids = [self._stream_id(id) for id in request[3:]]
+        except ValueError:
+            return client.reply_error(self.INVALID_STREAM_ID)
+        group = value.groups.get(request[2])
+        acked = group.ack(ids) if group else 0
+        self._dirty += acked
+        client.reply_int(acked)
+
+    @command('Streams', True)
+    def xadd(self, client, request, N):
+        check_input(request, N < 4)
+        key = request[1]
+        it = 2
+        maxlen = None
+        approximate = False
+        try:
+            if request[it].lower() == b'maxlen':
+                it += 1
+                if request[it] == b'~':
+                    approximate = True
+                    it += 1
+                maxlen = int(request[it])
+                if maxlen < 0:
+                    raise ValueError
+                it += 1
+            id = request[it]
+        except Exception:
+            return client.reply_error(self.SYNTAX_ERROR)
+        fields = request[it+1:]
+        check_input(request, not fields or len(fields) % 2)
+        db = client.db
+        value = db.get(key)
+        if value is None:
+            value = self.stream_type()
+        elif not isinstance(value, self.stream_type):
+            return client.reply_wrongtype()
+        if id == b'*':
+            id = value.next_id(int(1000*time.time()))
+        else:
+            try:
+                id = self._stream_id(id)
+            except ValueError:
+                return client.reply_error(self.INVALID_STREAM_ID)
+            if id <= value.last_id:
+                return client.reply_error('The ID specified in XADD is equal '
+                                          'or smaller than the target stream '
+                                          'top item')
+        # the stream is created only once the ID is accepted
+        db._data[key] = value
+        value.add(id, fields)
+        if maxlen is not None:
+            value.trim(maxlen, approximate)
+        self._signal(self.NOTIFY_STREAM, db, request[0], key, 1)
+        client.reply_bulk(self._stream_id_bytes(id))
+
+    @command('Streams', True)
+    def xclaim(self, client, request, N):
+        check_input(request, N < 5)
+        value = client.db.get(request[1])
+        if value is not None and not isinstance(value, self.stream_type):
+            return client.reply_wrongtype()
+        group = value.groups.get(request[2]) if value else None
+        if group is None:
+            return client.reply_error("No such key '%s' or consumer group "
+                                      "'%s'" % (to_string(request[1]),
+                                                to_string(request[2])),
+                                      'NOGROUP')
+        consumer = request[3]
+        now = int(1000*time.time())
+        delivered = retrycount = None
+        force = justid = False
+        ids = []
+        try:
+            min_idle = max(0, int(request[4]))
+            options = iter(request[5:])
+            for arg in options:
+                opt = arg.lower()
+                if opt == b'idle':
+                    delivered = now - int(next(options))
+                elif opt == b'time':
+                    delivered = int(next(options))
+                elif opt == b'retrycount':
+                    retrycount = int(next(options))
+                elif opt == b'force':
+                    force = True
+                elif opt == b'justid':
+                    justid = True
+                else:
+                    ids.append(self._stream_id(arg))
+        except Exception:
+            return client.reply_error(self.SYNTAX_ERROR)
+        group.consumer(consumer, now)
+        result = []
+        for id in ids:
+            fields = value.get(id)
+            if fields is None:
+                group.ack((id,))
+            elif group.claim(id, consumer, now, min_idle, delivered,
+                             retrycount, force, justid):
+                id = self._stream_id_bytes(id)
+                result.append(id if justid else (id, fields))
+        self._signal(self.NOTIFY_STREAM, client.db, request[0], request[1],
+                     len(result))
+        client.reply_multi_bulk(result)
+
+    @command('Streams', True)
+    def xdel(self, client, request, N):
+        check_input(request, N < 2)
+        key = request[1]
+        db = client.db
+        value = db.get(key)
+        if value is None:
+            return client.reply_zero()
+        elif not isinstance(value, self.stream_type):
+            return client.reply_wrongtype()
+        try:
+            ids = [self._stream_id(id) for id in request[2:]]
+        except ValueError:
+            return client.reply_error(self.INVALID_STREAM_ID)
+        removed = value.remove(ids)
+        if removed:
+            self._signal(self.NOTIFY_STREAM, db, request[0], key, removed)
+        client.reply_int(removed)
+
+    @command('Streams', True)
+    def xgroup(self, client, request, N):
+        check_input(request, N < 3)
+        subcommand = request[1].decode('utf-8').lower()
+        key, name = request[2], request[3]
+        db = client.db
+        value = db.get(key)
+        if value is not None and not isinstance(value, self.stream_type):
+            return client.reply_wrongtype()
+        if subcommand == 'create':
+            check_input(request, N < 4 or N > 5)
+            if N == 5 and request[5].lower() != b'mkstream':
+                return client.reply_error(self.SYNTAX_ERROR)
+            if value is None:
+                if N != 5:
+                    return client.reply_error(
+                        'The XGROUP subcommand requires the key to exist')
+                value = self.stream_type()
+                db._data[key] = value
+            if name in value.groups:
+                return client.reply_error('Consumer Group name already '
+                                          'exists', 'BUSYGROUP')
+            try:
+                id = self._stream_read_id(value, request[4])
+            except ValueError:
+                return client.reply_error(self.INVALID_STREAM_ID)
+            value.groups[name] = StreamGroup(id)
+            self._signal(self.NOTIFY_STREAM, db, request[0], key, 1)
+            return client.reply_ok()
+        group = value.groups.get(name) if value else None
+        if subcommand == 'destroy':
+            check_input(request, N != 3)
+            if group is None:
+                return client.reply_zero()
+            value.groups.pop(name)
+            self._signal(self.NOTIFY_STREAM, db, request[0], key, 1)
+            return client.reply_one()
+        elif subcommand not in ('setid', 'delconsumer'):
+            return client.reply_error("Unknown command 'xgroup %s'" %
+                                      subcommand)
+        check_input(request, N != 4)
+        if group is None:
+            return client.reply_error("No such key '%s' or consumer group "
+                                      "'%s'" % (to_string(key),
+                                                to_string(name)),
+                                      'NOGROUP')
+        if subcommand == 'setid':
+            try:
+                group.last_id = self._stream_read_id(value, request[4])
+            except ValueError:
+                return client.reply_error(self.INVALID_STREAM_ID)
+            self._signal(self.NOTIFY_STREAM, db, request[0], key, 1)
+            client.reply_ok()
+        else:
+            removed = group.remove_consumer(request[4])
+            self._signal(self.NOTIFY_STREAM, db, request[0], key, removed)
+            client.reply_int(removed)
+
+    @command('Streams')
+    def xlen(self, client, request, N):
+        check_input(request, N != 1)
+        value = client.db.get(request[1])
+        if value is None:
+            client.reply_zero()
+        elif not isinstance(value, self.stream_type):
+            client.reply_wrongtype()
+        else:
+            client.reply_int(len(value))
+
+    @command('Streams')
+    def xpending(self, client, request, N):
+        check_input(request, N != 2 and N != 5 and N != 6)
+        value = client.db.get(request[1])
+        if value is not None and not isinstance(value, self.stream_type):
+            return client.reply_wrongtype()
+        group = value.groups.get(request[2]) if value else None
+        if group is None:
+            return client.reply_error("No such key '%s' or consumer group "
+                                      "'%s'" % (to_string(request[1]),
+                                                to_string(request[2])),
+                                      'NOGROUP')
+        pending = group.pending
+        if N == 2:
+            if not pending:
+                return client.reply_multi_bulk((0, None, None, None))
+            consumers = [(name, len(c.pending))
+                         for name, c in sorted(group.consumers.items())
+                         if c.pending]
+            client.reply_multi_bulk((len(pending),
+                                     self._stream_id_bytes(min(pending)),
+                                     self._stream_id_bytes(max(pending)),
+                                     consumers))
+        else:
+            try:
+                start = self._stream_id(request[3], MIN_ID, b'-')
+                end = self._stream_id(request[4], MAX_ID, b'+')
+                count = int(request[5])
+            except ValueError:
+                return client.reply_error(self.INVALID_STREAM_ID)
+            consumer = request[6] if N == 6 else None
+            now = int(1000*time.time())
+            result = []
+            for id in sorted(pending):
+                if len(result) >= count or id > end:
+                    break
+                entry = pending[id]
+                if id < start or (consumer and entry.consumer != consumer):
+                    continue
+                result.append((self._stream_id_bytes(id), entry.consumer,
+                               now - entry.delivered, entry.count))
+            client.reply_multi_bulk(result)
+
+    @command('Streams')
+    def xrange(self, client, request, N):
+        check_input(request, N != 3 and N != 5)
+        value = client.db.get(request[1])
+        if value is not None and not isinstance(value, self.stream_type):
+            return client.reply_wrongtype()
+        reverse = request[0] == 'xrevrange'
+        start, end = (request[3], request[2]) if reverse else request[2:4]
+        count = None
+        try:
+            start = self._stream_id(start, MIN_ID, b'-')
+            end = self._stream_id(end, MAX_ID, b'+')
+            if N == 5:
+                if request[4].lower() != b'count':
+                    raise ValueError
+                count = int(request[5])
+        except ValueError:
+            return client.reply_error(self.SYNTAX_ERROR)
+        if value is None:
+            client.reply_multi_bulk(())
+        else:
+            entries = value.range(start, end, count, reverse)
+            client.reply_multi_bulk(self._stream_entries(entries))
+
+    @command('Streams', script=0)
+    def xread(self, client, request, N):
+        check_input(request, N < 3)
+        try:
+            req, timeout = self._xread_request(client, request)
+        except ValueError:
+            return client.reply_error(self.INVALID_STREAM_ID)
+        if req:
+            result = self._xread(client, req)
+            if result:
+                client.reply_multi_bulk(result)
+            elif timeout is None:
+                client.reply_multi_bulk(None)
+            else:
+                client.blocked = Blocked(client, request[0], req.keys,
+                                         timeout, req)
+
+    @command('Streams', True, script=0)
+    def xreadgroup(self, client, request, N):
+        check_input(request, N < 6)
+        return self.xread(client, request, N)
+
+    @command('Streams')
+    def xrevrange(self, client, request, N):
+        return self.xrange(client, request, N)
+
+    @command('Streams', True)
+    def xtrim(self, client, request, N):
+        check_input(request, N != 3 and N != 4)
+        key = request[1]
+        db = client.db
+        value = db.get(key)
+        if value is not None and not isinstance(value, self.stream_type):
+            return client.reply_wrongtype()
+        approximate = N == 4 and request[3] == b'~'
+        try:
+            if request[2].lower() != b'maxlen' or (N == 4 and
+                                                   not approximate):
+                raise ValueError
+            maxlen = int(request[-1])
+        except ValueError:
+            return client.reply_error(self.SYNTAX_ERROR)
+        removed = value.trim(maxlen, approximate) if value else 0
+        if removed:
+            self._signal(self.NOTIFY_STREAM, db, request[0], key, removed)
+        client.reply_int(removed)
+
+    # #########################################################################
+    # #    HYPERLOGLOG COMMANDS
+    @command('HyperLogLog', True)
+    def pfadd(self, client, request, N):
+        check_input(request, not N)
+        key = request[1]
+        db = client.db
+        value = db.get(key)
+        if value is None:
+            value = hll_new()
+            db._data[key] = value
+            changed = True
+        elif not isinstance(value, bytearray):
+            return client.reply_wrongtype()
+        elif not is_hll(value):
+            return client.reply_error(self.INVALID_HLL, 'WRONGTYPE')
+        else:
+            changed = False
+        if hll_add(value, request[2:]) or changed:
+            self._signal(self.NOTIFY_STRING, db, request[0], key, 1)
+            client.reply_one()
+        else:
+            client.reply_zero()
+
+    @command('HyperLogLog')
+    def pfcount(self, client, request, N):
+        check_input(request, not N)
+        values = self._hll_values(client, request[1:])
+        if values is None:
+            return
+        elif not values:
+            client.reply_zero()
+        elif len(values) == 1:
+            client.reply_int(hll_count(values[0]))
+        else:
+            client.reply_int(hll_count_registers(hll_merge(values)))
+
+    @command('HyperLogLog', True)
+    def pfmerge(self, client, request, N):
+        check_input(request, not N)
+        dest = request[1]
+        values = self._hll_values(client, request[1:])
+        if values is None:
+            return
+        db = client.db
+        db.pop(dest)
+        db._data[dest] = hll_dense(hll_merge(values))
+        self._signal(self.NOTIFY_STRING, db, request[0], dest, 1)
+        client.reply_ok()
+
     # #########################################################################
     # #    PUBSUB COMMANDS
     @command('Pub/Sub', script=0)
@@ -1891,14 +2321,27 @@ class Storage:
             client.reply_error("EXEC without MULTI")
         else:
             requests = client.transaction
-            if client.flag & self.DIRTY_CAS:
-                self._close_transaction(client)
+            flag = client.flag
+            self._close_transaction(client)
+            if flag & self.DIRTY_EXEC:
+                client.reply_error(self.EXECABORT, 'EXECABORT')
+            elif flag & self.DIRTY_CAS:
                 client.reply_multi_bulk(())
             else:
-                self._close_transaction(client)
-                client.reply_multi_bulk_len(len(requests))
-                for handle, request in requests:
-                    client._execute_command(handle, request)
+                N = len(requests)
+                # Replies are collected into one buffer and written after
+                # the multi-bulk header. Requests are popped as they are
+                # executed so that their memory is released eagerly
+                requests.reverse()
+                client.reply_buffer = buffer = bytearray()
+                try:
+                    while requests:
+                        handle, request = requests.pop()
+                        client._execute_command(handle, request)
+                finally:
+                    client.reply_buffer = None
+                client.reply_multi_bulk_len(N)
+                client._write(buffer)
 
     @command('Transactions', script=0)
     def multi(self, client, request, N):
@@ -1907,7 +2350,7 @@ class Storage:
             client.reply_ok()
             client.transaction = []
         else:
-            self.error_replay("MULTI calls can not be nested")
+            client.reply_error("MULTI calls can not be nested")
 
     @command('Transactions', script=0)
     def watch(self, client, request, N):
@@ -2046,27 +2489,51 @@ class Storage:
         check_input(request, N != 0)
         client.reply_int(len(client.db))
 
-    @command('Server', supported=False, subcommands=['object', 'segfault'])
+    @command('Server', subcommands=['object'])
     def debug(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, not N)
+        subcommand = request[1].decode('utf-8').lower()
+        if subcommand == 'object':
+            check_input(request, N != 2)
+            key = request[2]
+            db = client.db
+            value = db.peek(key)
+            if value is None:
+                return client.reply_error('no such key')
+            info = ('Value at:0x%x' % id(value),
+                    'refcount:1',
+                    'encoding:%s' % self._type_encoding_map[type(value)],
+                    'serializedlength:%d' % len(self.encoder.dumps(value, 2)),
+                    'memory:%d' % db.key_size(key),
+                    'lru_seconds_idle:%d' % db.idletime(key))
+            client.reply_status(' '.join(info))
+        else:
+            client.reply_error("unknown command 'debug %s'" % subcommand)
 
     @command('Server', True)
     def flushdb(self, client, request, N):
-        check_input(request, N)
-        client.db.flush()
+        check_input(request, N > 1)
+        lazy = self._flush_mode(request, N)
+        if lazy is None:
+            return client.reply_error(self.SYNTAX_ERROR)
+        client.db.flush(lazy)
         client.reply_ok()
 
     @command('Server', True)
     def flushall(self, client, request, N):
-        check_input(request, N)
+        check_input(request, N > 1)
+        lazy = self._flush_mode(request, N)
+        if lazy is None:
+            return client.reply_error(self.SYNTAX_ERROR)
         for db in self.databases.values():
-            db.flush()
+            db.flush(lazy)
         client.reply_ok()
 
     @command('Server')
     def info(self, client, request, N):
-        check_input(request, N)
-        info = '\n'.join(self._flat_info())
+        check_input(request, N > 1)
+        section = request[1].decode('utf-8').lower() if N else None
+        info = '\n'.join(self._flat_info(section))
         client.reply_bulk(info.encode('utf-8'))
 
     @command('Server')
@@ -2074,6 +2541,33 @@ class Storage:
         check_input(request, N)
         client.reply_int(self._last_save)
 
+    @command('Server', subcommands=['usage'])
+    def memory(self, client, request, N):
+        check_input(request, not N)
+        subcommand = request[1].decode('utf-8').lower()
+        if subcommand == 'usage':
+            check_input(request, N != 2 and N != 4)
+            key = request[2]
+            db = client.db
+            if N == 4:
+                if request[3].lower() != b'samples':
+                    return client.reply_error(self.SYNTAX_ERROR)
+                try:
+                    samples = int(request[4])
+                except ValueError:
+                    return client.reply_error(self.INVALID_INTEGER)
+                value = db.peek(key)
+                size = (None if value is None else
+                        getsizeof(key) + value_size(value, samples))
+            else:
+                size = db.key_size(key)
+            if size is None:
+                client.reply_bulk()
+            else:
+                client.reply_int(size)
+        else:
+            client.reply_error("unknown command 'memory %s'" % subcommand)
+
     @command('Server', script=0)
     def monitor(self, client, request, N):
         check_input(request, N)
@@ -2103,6 +2597,11 @@ class Storage:
     def sync(self, client, request, N):
         client.reply_error(self.NOT_SUPPORTED)
 
+    @command('Server')
+    def role(self, client, request, N):
+        check_input(request, N != 0)
+        client.reply_multi_bulk((b'master', 0, ()))
+
     @command('Server')
     def time(self, client, request, N):
         check_input(request, N != 0)
@@ -2184,7 +2683,9 @@ class Storage:
 
     def _block_callback(self, client, command, key, value, dest):
         db = client.db
-        if command[:2] == 'br':
+        if isinstance(dest, xread_request):
+            return client.reply_multi_bulk(self._xread(client, dest) or None)
+        elif command[:2] == 'br':
             if dest is not None:
                 dval = db.get(dest)
                 if dval is None:
@@ -2208,6 +2709,143 @@ class Storage:
         else:
             client.reply_bulk(elem)
 
+    def _hll_values(self, client, keys):
+        db = client.db
+        values = []
+        for key in keys:
+            value = db.get(key)
+            if value is None:
+                continue
+            elif not isinstance(value, bytearray):
+                return client.reply_wrongtype()
+            elif not is_hll(value):
+                return client.reply_error(self.INVALID_HLL, 'WRONGTYPE')
+            values.append(value)
+        return values
+
+    def _stream_id(self, value, default=MIN_ID, special=None):
+        """Convert ``value`` into a ``(ms, seq)`` stream id.
+
+        When ``value`` is the ``special`` symbol, ``default`` is returned.
+        An incomplete id, without the sequence part, takes the sequence
+        of ``default``.
+        """
+        if value == special:
+            return default
+        ms, _, seq = value.partition(b'-')
+        id = (int(ms), int(seq) if seq else default[1])
+        if id < MIN_ID or id > MAX_ID:
+            raise ValueError
+        return id
+
+    def _stream_id_bytes(self, id):
+        return ('%d-%d' % id).encode('utf-8')
+
+    def _stream_read_id(self, stream, value):
+        if value == b'$':
+            return stream.last_id if stream else MIN_ID
+        return self._stream_id(value)
+
+    def _stream_entries(self, entries):
+        tobytes = self._stream_id_bytes
+        return [(tobytes(id), fields) for id, fields in entries]
+
+    def _xread_request(self, client, request):
+        group = consumer = count = timeout = None
+        noack = False
+        args = iter(request[1:])
+        try:
+            if request[0] == 'xreadgroup':
+                if next(args).lower() != b'group':
+                    raise ValueError
+                group, consumer = next(args), next(args)
+            for arg in args:
+                opt = arg.lower()
+                if opt == b'count':
+                    count = max(0, int(next(args))) or None
+                elif opt == b'block':
+                    timeout = max(0, int(next(args)))/1000
+                elif opt == b'noack' and group:
+                    noack = True
+                elif opt == b'streams':
+                    break
+                else:
+                    raise ValueError
+            else:
+                raise ValueError
+        except (ValueError, StopIteration):
+            raise CommandError(self.SYNTAX_ERROR)
+        streams = list(args)
+        N = len(streams) // 2
+        if not N or 2*N != len(streams):
+            raise CommandError("Unbalanced '%s' list of streams: for each "
+                               "stream key an ID or '$' must be "
+                               "specified" % request[0])
+        keys, ids = streams[:N], streams[N:]
+        db = client.db
+        for i, key in enumerate(keys):
+            value = db.get(key)
+            if value is not None and not isinstance(value, self.stream_type):
+                client.reply_wrongtype()
+                return None, None
+            if group is None:
+                ids[i] = self._stream_read_id(value, ids[i])
+            elif not value or group not in value.groups:
+                client.reply_error("No such key '%s' or consumer group '%s' "
+                                   "in XREADGROUP with GROUP option" %
+                                   (to_string(key), to_string(group)),
+                                   'NOGROUP')
+                return None, None
+            elif ids[i] == b'>':
+                ids[i] = None
+            else:
+                ids[i] = self._stream_id(ids[i])
+                timeout = None
+        req = xread_request(keys, ids, count, group, consumer, noack)
+        return req, timeout
+
+    def _xread(self, client, req):
+        db = client.db
+        now = int(1000*time.time())
+        result = []
+        for key, id in zip(req.keys, req.ids):
+            stream = db.get(key)
+            if not isinstance(stream, self.stream_type):
+                continue
+            if req.group is None:
+                entries = stream.after(id, req.count)
+            else:
+                group = stream.groups.get(req.group)
+                if group is None:
+                    continue
+                consumer = group.consumer(req.consumer, now)
+                if id is None:
+                    entries = stream.after(group.last_id, req.count)
+                    for eid, _ in entries:
+                        group.deliver(eid, req.consumer, now, req.noack)
+                    if entries:
+                        self._signal(self.NOTIFY_STREAM, db, 'xreadgroup',
+                                     key, len(entries))
+                else:
+                    ids = sorted((i for i in consumer.pending if i > id))
+                    if req.count:
+                        ids = ids[:req.count]
+                    entries = [(i, stream.get(i)) for i in ids]
+                    result.append((key, self._stream_entries(entries)))
+                    continue
+            if entries:
+                result.append((key, self._stream_entries(entries)))
+        return result
+
+    def _xread_ready(self, req, key, value):
+        if (not isinstance(req, xread_request) or
+                not isinstance(value, self.stream_type)):
+            return False
+        if req.group is None:
+            return value.last_id > req.ids[req.keys.index(key)]
+        group = value.groups.get(req.group)
+        return group is not None and value.last_id > group.last_id
+
     def _range_values(self, value, start, end):
         start = int(start)
         end = int(end)
@@ -2220,17 +2858,28 @@ class Storage:
                 end += 1
         return start, end
 
+    def _flush_mode(self, request, N):
+        if not N:
+            return False
+        mode = request[1].lower()
+        if mode == b'async':
+            return True
+        elif mode == b'sync':
+            return False
+
     def _close_transaction(self, client):
         client.transaction = None
         client.watched_keys = None
-        client.flag &= ~self.DIRTY_CAS
+        client.flag &= ~(self.DIRTY_CAS | self.DIRTY_EXEC)
         self._watching.discard(client)
 
-    def _flat_info(self):
+    def _flat_info(self, section=None):
         info = self._server.info()
         info['server']['redis_version'] = self.version
         e = self._encode_info_value
         for k, values in info.items():
+            if section and k != section:
+                continue
             if isinstance(values, dict):
                 yield '#%s' % k
                 for key, value in values.items():
@@ -2386,7 +3035,37 @@ class Storage:
                 keyspace[str(db)] = db.info()
         return {'keyspace': keyspace,
                 'stats': stats,
-                'persistance': persistance}
+                'persistance': persistance,
+                'memory': self._memory_info()}
+
+    def _memory_info(self):
+        dataset = 0
+        overhead = 0
+        biggest = []
+        for db in self.databases.values():
+            dataset += db.memory()
+            overhead += db.overhead()
+            biggest.extend((('%s:%s' % (db, to_string(key)), size)
+                            for key, size in db.biggest_keys()))
+        used = dataset + overhead
+        self._used_memory_peak = max(self._used_memory_peak, used)
+        info = {'used_memory': used,
+                'used_memory_human': convert_bytes(used),
+                'used_memory_peak': self._used_memory_peak,
+                'used_memory_dataset': dataset,
+                'used_memory_overhead': overhead,
+                'lazyfree_pending_objects': len(self._lazyfree),
+                'lazyfreed_objects': self._lazyfree.freed}
+        if psutil is not None:
+            rss = psutil.Process().memory_info().rss
+            info['used_memory_rss'] = rss
+            info['mem_fragmentation_ratio'] = round(rss/used, 2) if used else 0
+        if biggest:
+            e = self._encode_info_value
+            info['biggest_keys'] = dict(((e(key), size) for key, size in
+                                         nlargest(self.BIGGEST_KEYS, biggest,
+                                                  key=itemgetter(1))))
+        return info
 
     def _client_list(self, client):
         for client in client._producer._concurrent_connections:
@@ -2435,10 +3114,14 @@ class Storage:
                 db = self.databases.get(num)
                 if db is not None:
                     db._data = data
+                    db._unsized.update(data)
 
     def _signal(self, type, db, command, key=None, dirty=0):
         self._dirty += dirty
-        self._event_handlers[type](db, key, COMMANDS_INFO[command])
+        info = COMMANDS_INFO[command]
+        if info.write and key is not None:
+            db._changed(key)
+        self._event_handlers[type](db, key, info)
 
     def _publish_clients(self, msg, clients):
         remove = set()
@@ -2482,6 +3165,23 @@ class Storage:
             for client in db._blocking_keys.pop(key):
                 client.blocked.unblock(client, key, value)
 
+    def _stream_event(self, db, key, command):
+        if command.write:
+            self._modified_key(key)
+        # new entries may be served to clients blocked on the key
+        clients = db._blocking_keys.get(key)
+        if clients:
+            if key in db._data:
+                value = db._data[key]
+            elif key in db._expires:
+                value = db._expires[key].value
+            else:
+                value = None
+            for client in tuple(clients):
+                blocked = client.blocked
+                if blocked and self._xread_ready(blocked.dest, key, value):
+                    blocked.unblock(client, key, value)
+
     def _remove_connection(self, client, _, **kw):
         # Remove a client from the server
         self._monitors.discard(client)
@@ -2511,7 +3211,20 @@ class Storage:
 
 class Db:
     '''A database.
+
+    Besides the data, a database keeps track of the approximate memory
+    used by each key and of the last access time and access frequency
+    of keys. Sizes are cached and invalidated when a key is modified,
+    the aggregate :meth:`memory` is updated incrementally with the
+    sizes of modified keys only.
     '''
+    # Number of elements sampled when evaluating the size of a container
+    memory_samples = 5
+    # Logarithmic access frequency counter parameters, as in redis LFU
+    lfu_init = 5
+    lfu_log_factor = 10
+    lfu_decay_time = 60
+
     def __init__(self, num, store):
         self.store = store
         self._num = num
@@ -2520,6 +3233,10 @@ class Db:
         self._expires = {}
         self._events = {}
         self._blocking_keys = {}
+        self._sizes = {}
+        self._unsized = set()
+        self._memory = 0
+        self._access = {}
 
     def __repr__(self):
         return 'db%s' % self._num
@@ -2533,25 +3250,49 @@ class Db:
 
     # #########################################################################
     # #    INTERNALS
-    def flush(self):
+    def flush(self, lazy=False):
         removed = len(self._data)
-        self._data.clear()
-        [t.handle.cancel() for t in self._expires.values()]
-        self._expires.clear()
+        lazyfree = self.store._lazyfree
+        if lazy and len(self) > lazyfree.threshold:
+            # detach the data and free it incrementally. Expiry timers
+            # are cancelled now so that they cannot fire on the new data
+            [t.handle.cancel() for t in self._expires.values()]
+            lazyfree.free(self._data)
+            lazyfree.free(self._expires)
+            self._data = {}
+            self._expires = {}
+        else:
+            self._data.clear()
+            [t.handle.cancel() for t in self._expires.values()]
+            self._expires.clear()
+        self._sizes.clear()
+        self._unsized.clear()
+        self._access.clear()
+        self._memory = 0
         self.store._signal(self.store.NOTIFY_GENERIC, self, 'flushdb',
                            dirty=removed)
 
     def get(self, key, default=None):
         if key in self._data:
             self.store._hit_keys += 1
+            self._touch(key)
             return self._data[key]
         elif key in self._expires:
             self.store._hit_keys += 1
+            self._touch(key)
             return self._expires[key].value
         else:
             self.store._missed_keys += 1
             return default
 
+    def peek(self, key):
+        '''The value at ``key`` without updating access statistics
+        '''
+        if key in self._data:
+            return self._data[key]
+        elif key in self._expires:
+            return self._expires[key].value
+
     def exists(self, key):
         return key in self._data or key in self._expires
 
@@ -2595,7 +3336,58 @@ class Db:
 
     def info(self):
         return {'Keys': len(self._data),
-                'expires': len(self._expires)}
+                'expires': len(self._expires),
+                'memory': self.memory()}
+
+    def memory(self):
+        '''Approximate memory used by keys and values in this database.
+
+        Only the sizes of keys modified since the last call are evaluated.
+        '''
+        if self._unsized:
+            for key in tuple(self._unsized):
+                self.key_size(key)
+        return self._memory
+
+    def overhead(self):
+        '''Approximate memory used by the database bookkeeping'''
+        size = (getsizeof(self._data) + getsizeof(self._expires) +
+                getsizeof(self._sizes) + getsizeof(self._access))
+        if self._expires:
+            timer = next(iter(self._expires.values()))
+            size += getsizeof(timer)*len(self._expires)
+        return size
+
+    def key_size(self, key):
+        '''Approximate memory used by ``key`` and its value, ``None`` if
+        the key does not exist. The size is cached until the key is
+        modified.
+        '''
+        size = self._sizes.get(key)
+        if size is None:
+            self._unsized.discard(key)
+            value = self.peek(key)
+            if value is not None:
+                size = getsizeof(key) + value_size(value, self.memory_samples)
+                self._sizes[key] = size
+                self._memory += size
+        return size
+
+    def biggest_keys(self, n=5):
+        '''The ``n`` keys using the largest amount of memory as a list of
+        ``(key, size)`` pairs'''
+        self.memory()
+        return nlargest(n, self._sizes.items(), key=itemgetter(1))
+
+    def idletime(self, key):
+        '''Number of seconds since ``key`` was last accessed'''
+        access = self._access.get(key)
+        return int(self._loop.time() - access[0]) if access else 0
+
+    def frequency(self, key):
+        '''Logarithmic access frequency counter of ``key``'''
+        access = self._access.get(key)
+        return self._decayed(access, self._loop.time()) if access else 0
 
     def pop(self, key, value=None):
         if not value:
@@ -2623,11 +3415,62 @@ class Db:
             self.store._missed_keys += 1
             return 0
 
+    def unlink(self, key):
+        '''Remove ``key`` and free its value in the background when large
+        '''
+        value = self.pop(key)
+        if value is None:
+            self.store._missed_keys += 1
+            return 0
+        self.store._hit_keys += 1
+        self.store._lazyfree.free_lazy(value)
+        self.store._signal(self.store.NOTIFY_GENERIC, self, 'del', key, 1)
+        return 1
+
     def _do_expire(self, key):
         if key in self._expires:
             t = self._expires.pop(key)
             t.handle.cancel()
             self.store._expired_keys += 1
+            self.store._lazyfree.free_lazy(t.value)
+            self._forget(key)
+
+    def _touch(self, key):
+        now = self._loop.time()
+        access = self._access.get(key)
+        if access is None:
+            self._access[key] = [now, self.lfu_init]
+        else:
+            counter = self._decayed(access, now)
+            if counter < 255:
+                base = max(counter - self.lfu_init, 0)
+                if random() * (base*self.lfu_log_factor + 1) < 1:
+                    counter += 1
+            access[0] = now
+            access[1] = counter
+
+    def _decayed(self, access, now):
+        periods = int((now - access[0]) // self.lfu_decay_time)
+        return max(access[1] - periods, 0)
+
+    def _changed(self, key):
+        # invalidate the cached size of a modified key
+        size = self._sizes.pop(key, None)
+        if size is not None:
+            self._memory -= size
+        if self.exists(key):
+            self._unsized.add(key)
+            if key not in self._access:
+                self._access[key] = [self._loop.time(), self.lfu_init]
+        else:
+            self._forget(key)
+
+    def _forget(self, key):
+        size = self._sizes.pop(key, None)
+        if size is not None:
+            self._memory -= size
+        self._unsized.discard(key)
+        self._access.pop(key, None)
 
     def _timer(self, timeout, key, value):
         loop = self._loop
@@ -2637,8 +3480,119 @@ class Db:
 
 
 class Timer:
+    __slots__ = ('handle', 'value', 'when')
 
     def __init__(self, handle, value, when):
         self.handle = handle
         self.value = value
         self.when = when
+
+
+class LazyFree:
+    '''Free large values incrementally.
+
+    Deallocating a container with millions of elements is a single
+    operation which would block the event loop, therefore values are
+    emptied in chunks of at most :attr:`chunk_size` elements, one chunk
+    per loop iteration.
+    '''
+    chunk_size = 1000
+    # values with less elements than this are freed synchronously
+    threshold = 64
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._values = deque()
+        self._handle = None
+        self.freed = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def free_lazy(self, value):
+        '''Free ``value`` in the background if it is large.
+
+        Return ``True`` if the value was scheduled for freeing.
+        '''
+        if self.effort(value) > self.threshold:
+            self.free(value)
+            return True
+        return False
+
+    def free(self, value):
+        '''Schedule ``value`` to be freed in the background'''
+        self._values.append(value)
+        if self._handle is None:
+            self._handle = self._loop.call_soon(self._step)
+
+    def effort(self, value):
+        '''Number of elements to free in ``value``'''
+        if isinstance(value, (bytes, bytearray)):
+            return 1
+        try:
+            return len(value)
+        except TypeError:
+            return 1
+
+    def _step(self):
+        self._handle = None
+        values = self._values
+        budget = self.chunk_size
+        while values and budget > 0:
+            work, done = self._free_chunk(values[0], budget)
+            budget -= work
+            if done:
+                values.popleft()
+                self.freed += 1
+        if values:
+            self._handle = self._loop.call_soon(self._step)
+
+    def _free_chunk(self, value, n):
+        if isinstance(value, dict):
+            return self._free_dict(value, n)
+        elif isinstance(value, set):
+            work = min(n, len(value))
+            for _ in range(work):
+                value.pop()
+            return work, not value
+        elif isinstance(value, deque):
+            work = min(n, len(value))
+            for _ in range(work):
+                value.pop()
+            return work, not value
+        elif isinstance(value, Zset):
+            return self._free_zset(value, n)
+        elif isinstance(value, Stream):
+            chunks = value._chunks
+            work = 0
+            while chunks and work < n:
+                work += len(chunks.pop()[0])
+            if not chunks:
+                value.__init__()
+            return max(work, 1), not chunks
+        return 1, True
+
+    def _free_dict(self, value, n):
+        work = min(n, len(value))
+        free_lazy = self.free_lazy
+        for _ in range(work):
+            _, v = value.popitem()
+            if isinstance(v, Timer):
+                v.handle.cancel()
+                v = v.value
+            # nested containers are freed in chunks too
+            free_lazy(v)
+        return work, not value
+
+    def _free_zset(self, zset, n):
+        data = zset._dict
+        work = min(n, len(data))
+        for _ in range(work):
+            data.popitem()
+        # detach skiplist nodes from the head, one at a time
+        head = zset._sl._head.next
+        while head[0] is not None and work < n:
+            for level, node in enumerate(head[0].next):
+                head[level] = node
+            work += 1
+        return max(work, 1), not data and head[0] is None
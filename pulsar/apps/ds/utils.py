@@ -1,5 +1,9 @@
 import shutil
 import pickle
+from sys import getsizeof
+from itertools import islice
+
+from pulsar.utils.structures import Zset, Stream
 
 
 def save_data(cfg, filename, data):
@@ -195,3 +199,43 @@ def or_op(x, y):
 
 def xor_op(x, y):
     return x ^ y
+
+
+def value_size(value, samples=0):
+    '''Approximate memory, in bytes, used by a data store ``value``.
+
+    The size is obtained by walking the value with ``sys.getsizeof``.
+    When ``samples`` is positive only the first ``samples`` elements
+    of a container are measured and their average size extrapolated
+    to the whole container.
+    '''
+    if isinstance(value, bytearray):
+        return getsizeof(value)
+    elif isinstance(value, dict):
+        size = getsizeof(value)
+        elements = (getsizeof(k) + getsizeof(v) for k, v in value.items())
+    elif isinstance(value, Zset):
+        size = getsizeof(value) + getsizeof(value._dict)
+        elements = (getsizeof(node) + getsizeof(node.next) +
+                    getsizeof(node.width) + getsizeof(node.score) +
+                    getsizeof(node.value) for node in _skiplist_nodes(value))
+    elif isinstance(value, Stream):
+        size = getsizeof(value) + sum((getsizeof(ids) + getsizeof(fields)
+                                       for ids, fields in value._chunks))
+        elements = (getsizeof(id) + getsizeof(fields) +
+                    sum((getsizeof(f) for f in fields))
+                    for id, fields in value)
+    else:
+        size = getsizeof(value)
+        elements = (getsizeof(e) for e in value)
+    N = len(value)
+    if samples > 0 and N > samples:
+        return size + sum(islice(elements, samples)) * N // samples
+    return size + sum(elements)
+
+
+def _skiplist_nodes(zset):
+    node = zset._sl._head.next[0]
+    while node:
+        yield node
+        node = node.next[0]
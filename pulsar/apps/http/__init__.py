@@ -543,6 +543,7 @@ class HttpResponse(ProtocolConsumer):
     _status_code = None
     _cookies = None
     _raw = None
+    _upgrade_data = b''
     request_again = None
     ONE_TIME_EVENTS = ('pre_request', 'on_headers', 'post_request')
 
@@ -635,8 +636,14 @@ class HttpResponse(ProtocolConsumer):
 
     def recv_body(self):
         """Flush the response body and return it.
+
+        After a ``101 Switching Protocols`` response, the body is the data
+        received for the upgraded protocol.
         """
-        return self.parser.recv_body()
+        body = self.parser.recv_body()
+        if self._upgrade_data:
+            body, self._upgrade_data = body + self._upgrade_data, b''
+        return body
 
     def get_status(self):
         code = self.status_code
@@ -707,9 +714,16 @@ class HttpResponse(ProtocolConsumer):
         # request.parser my change (100-continue)
         # Always invoke it via request
         try:
-            if request.parser.execute(data, len(data)) == len(data):
-                if request.parser.is_headers_complete():
-                    status_code = request.parser.get_status_code()
+            parser = request.parser
+            processed = parser.execute(data, len(data))
+            if (processed < len(data) and parser.is_message_complete() and
+                    parser.get_status_code() == 101):
+                # the remaining data belongs to the upgraded protocol
+                self._upgrade_data = data[processed:]
+                processed = len(data)
+            if processed == len(data):
+                if parser.is_headers_complete():
+                    status_code = parser.get_status_code()
                     if (request.headers.has('expect', '100-continue') and
                             status_code == 100):
                         request.new_parser()
@@ -719,7 +733,7 @@ class HttpResponse(ProtocolConsumer):
                         if not self.event('on_headers').fired():
                             self.fire_event('on_headers')
                         if (not self.event('post_request').fired() and
-                                request.parser.is_message_complete()):
+                                parser.is_message_complete()):
                             self.finished()
             else:
                 raise pulsar.ProtocolError('%s\n%s' % (self, self.headers))
@@ -736,6 +750,7 @@ class HttpClient(AbstractClient):
     It handles pool of asynchronous connections.
 
     :param pool_size: set the :attr:`pool_size` attribute.
+    :param pool_options: set the :attr:`pool_options` attribute.
     :param store_cookies: set the :attr:`store_cookies` attribute
 
     .. attribute:: headers
@@ -767,6 +782,12 @@ class HttpClient(AbstractClient):
 
         The size of a pool of connection for a given host.
 
+    .. attribute:: pool_options
+
+        Dictionary of additional parameters for connection pools, such as
+        ``min_size``, ``max_idle_time``, ``max_lifetime`` and
+        ``keepalive``. Check the :class:`.Pool` for details.
+
     .. attribute:: connection_pools
 
         Dictionary of connection pools for different hosts
@@ -818,12 +839,14 @@ class HttpClient(AbstractClient):
                  websocket_handler=None, parser=None, trust_env=True,
                  loop=None, client_version=None, timeout=None, stream=False,
                  pool_size=10, frame_parser=None, logger=None,
-                 close_connections=False, keep_alive=None):
+                 close_connections=False, keep_alive=None,
+                 pool_options=None):
         super().__init__(loop)
         self._logger = logger or LOGGER
         self.client_version = client_version or self.client_version
         self.connection_pools = {}
         self.pool_size = pool_size
+        self.pool_options = dict(pool_options or ())
         self.trust_env = trust_env
         self.timeout = timeout
         self.store_cookies = store_cookies
@@ -958,6 +981,12 @@ class HttpClient(AbstractClient):
         self.connection_pools.clear()
         return asyncio.gather(*waiters, loop=self._loop)
 
+    def pool_metrics(self):
+        """Dictionary of :meth:`.Pool.metrics` by connection pool key
+        """
+        return dict(((key, pool.metrics())
+                     for key, pool in self.connection_pools.items()))
+
     async def __aenter__(self):
         await self.close()
         return self
@@ -982,7 +1011,7 @@ class HttpClient(AbstractClient):
                                 (host, port),
                                 ssl=request.ssl)
             pool = self.connection_pool(connector, pool_size=self.pool_size,
-                                        loop=self._loop)
+                                        loop=self._loop, **self.pool_options)
             self.connection_pools[request.key] = pool
         try:
             conn = await pool.connect()
@@ -68,10 +68,12 @@ from .middleware import (clean_path_middleware, authorization_middleware,
 from .response import AccessControl, GZipMiddleware
 from .wrappers import EnvironMixin, WsgiResponse, WsgiRequest, cached_property
 from .server import HttpServerResponse, test_wsgi_environ, AbortWsgi
+from .http2 import Http2ServerConnection, H2Connection
 from .route import route, Route
 from .handlers import WsgiHandler, LazyWsgi
 from .routers import (Router, MediaRouter, MediaMixin, RouterParam,
                       file_response)
+from .assets import AssetCache
 from .auth import HttpAuthenticate, parse_authorization_header
 from .formdata import parse_form_data
 from .utils import (handle_wsgi_error, render_error_debug, wsgi_request,
@@ -81,6 +83,7 @@ __all__ = [
     # Server
     'WSGIServer',
     'HttpServerResponse',
+    'Http2ServerConnection',
     'test_wsgi_environ',
     'AbortWsgi',
     #
@@ -123,6 +126,7 @@ __all__ = [
     'MediaMixin',
     'RouterParam',
     'file_response',
+    'AssetCache',
     #
     # Utilities
     'parse_form_data',
@@ -137,15 +141,57 @@ __all__ = [
 ]
 
 
+class WsgiSetting(pulsar.Setting):
+    virtual = True
+    app = 'wsgi'
+    section = "WSGI Servers"
+
+
+class HttpPipeline(WsgiSetting):
+    name = "http_pipeline"
+    flags = ["--http-pipeline"]
+    validator = pulsar.validate_pos_int
+    type = int
+    default = 16
+    desc = """\
+        Maximum number of pipelined HTTP/1.1 requests served concurrently
+        on a connection.
+
+        Only requests with safe methods (GET, HEAD and OPTIONS) are served
+        concurrently, other requests wait for the requests before them.
+        Responses are always sent in the order of the requests.
+        Set to 1 to serve pipelined requests one at a time.
+        """
+
+
+class Http2(WsgiSetting):
+    name = "http2"
+    flags = ["--http2"]
+    validator = pulsar.validate_bool
+    action = "store_true"
+    default = False
+    desc = """\
+        Serve HTTP/2 requests.
+
+        Clients can start HTTP/2 with prior knowledge or upgrade
+        cleartext HTTP/1.1 connections with ``Upgrade: h2c``.
+        Requires the h2 package.
+        """
+
+
 class WSGIServer(SocketServer):
     '''A WSGI :class:`.SocketServer`.
     '''
     name = 'wsgi'
-    cfg = pulsar.Config(apps=['socket'],
+    cfg = pulsar.Config(apps=['socket', 'wsgi'],
                         server_software=pulsar.SERVER_SOFTWARE)
 
     def protocol_factory(self):
         cfg = self.cfg
+        if cfg.http2 and H2Connection is None:
+            raise pulsar.ImproperlyConfigured('HTTP/2 requires the h2 package')
+        environ = HttpServerResponse.environ_template(cfg, cfg.server_software)
         consumer_factory = partial(HttpServerResponse, cfg.callable, cfg,
-                                   cfg.server_software)
+                                   cfg.server_software, environ=environ)
         return partial(Connection, consumer_factory)
+
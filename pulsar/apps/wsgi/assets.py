@@ -0,0 +1,223 @@
+'''
+An in-memory cache of static files for the :class:`.MediaRouter`.
+
+Files are read once and kept, together with their ``gzip`` and, when the
+brotli_ package is installed, ``br`` encoded variants, in a least recently
+used cache with a memory budget. Cached files are checked for changes,
+by comparing their modification time and size, at most once every
+``check_interval`` seconds, as the autoreloader does for python modules.
+
+When an event loop is given, encoded variants are compressed in the
+loop executor and the file is served without content coding until they
+are ready.
+
+Usage::
+
+    from pulsar.apps.wsgi import MediaRouter, AssetCache
+
+    media = MediaRouter('/media', path, asset_cache=AssetCache())
+
+.. autoclass:: AssetCache
+   :members:
+   :member-order: bysource
+
+.. _brotli: https://github.com/google/brotli
+'''
+import os
+import stat
+import gzip
+import time
+import mimetypes
+from collections import OrderedDict
+from functools import partial
+
+try:
+    import brotli
+except ImportError:     # pragma    nocover
+    brotli = None
+
+from pulsar.utils.security import digest
+
+from .response import re_media_type
+
+
+ONEMB = 2**20
+
+
+def accepted_encodings(header):
+    '''The set of content codings accepted by an ``Accept-Encoding``
+    ``header``
+    '''
+    encodings = set()
+    for value in (header or '').split(','):
+        coding, _, params = value.partition(';')
+        coding = coding.strip().lower()
+        if coding:
+            quality = params.strip()
+            if quality.startswith('q='):
+                try:
+                    if float(quality[2:]) <= 0:
+                        continue
+                except ValueError:
+                    continue
+            encodings.add(coding)
+    return encodings
+
+
+class Asset:
+    '''A cached file and its encoded variants'''
+    __slots__ = ('path', 'mtime', 'size', 'etag', 'content_type',
+                 'encoding', 'variants', 'memory', 'checked')
+
+    def __init__(self, path, mtime, size, data, content_type, encoding):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.etag = digest(data)
+        self.content_type = content_type
+        self.encoding = encoding
+        self.variants = {'identity': data}
+        self.memory = len(data)
+        self.checked = time.monotonic()
+
+    def add_variant(self, coding, data):
+        if len(data) < self.size:
+            self.variants[coding] = data
+            self.memory += len(data)
+
+    def select(self, accept_encoding):
+        '''The content coding to serve for an ``Accept-Encoding`` header
+        '''
+        if len(self.variants) > 1:
+            accepted = accepted_encodings(accept_encoding)
+            for coding in ('br', 'gzip'):
+                if coding in self.variants and coding in accepted:
+                    return coding
+        return 'identity'
+
+    def entity_tag(self, coding):
+        '''The strong entity tag, unquoted, of the ``coding`` variant'''
+        if coding == 'identity':
+            return self.etag
+        return '%s-%s' % (self.etag, coding)
+
+
+class AssetCache:
+    '''A least recently used cache of static files.
+
+    :param max_size: memory budget, in bytes, of all cached variants.
+    :param max_file_size: files larger than this are not cached and
+        served from disk.
+    :param check_interval: seconds between checks for changes of a
+        cached file.
+    :param min_length: files smaller than this are not compressed.
+    :param compresslevel: compression level of encoded variants.
+    '''
+    def __init__(self, max_size=64*ONEMB, max_file_size=ONEMB,
+                 check_interval=1, min_length=200, compresslevel=9):
+        self.max_size = max_size
+        self.max_file_size = max_file_size
+        self.check_interval = check_interval
+        self.min_length = min_length
+        self.compresslevel = compresslevel
+        self.memory = 0
+        self._assets = OrderedDict()
+
+    def __len__(self):
+        return len(self._assets)
+
+    def __contains__(self, path):
+        return path in self._assets
+
+    def get(self, path, loop=None):
+        '''The :class:`Asset` of the file at ``path``.
+
+        The file is loaded when not cached or when it has changed.
+        Return ``None`` when ``path`` is not a file or the file is too
+        large for the cache.
+
+        :param loop: optional event loop, when given a loaded file is
+            compressed in its executor rather than synchronously.
+        '''
+        asset = self._assets.get(path)
+        if asset is not None:
+            now = time.monotonic()
+            if now - asset.checked < self.check_interval:
+                self._assets.move_to_end(path)
+                return asset
+            try:
+                info = os.stat(path)
+            except OSError:
+                self.remove(path)
+                return None
+            if info.st_mtime == asset.mtime and info.st_size == asset.size:
+                asset.checked = now
+                self._assets.move_to_end(path)
+                return asset
+            self.remove(path)
+        return self._load(path, loop)
+
+    def remove(self, path):
+        '''Remove ``path`` from the cache'''
+        asset = self._assets.pop(path, None)
+        if asset is not None:
+            self.memory -= asset.memory
+
+    def clear(self):
+        self._assets.clear()
+        self.memory = 0
+
+    #    INTERNALS
+    def _load(self, path, loop):
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        if (not stat.S_ISREG(info.st_mode) or
+                info.st_size > self.max_file_size):
+            return None
+        with open(path, 'rb') as file:
+            data = file.read()
+        content_type, encoding = mimetypes.guess_type(path)
+        asset = Asset(path, info.st_mtime, len(data), data, content_type,
+                      encoding)
+        compress = self._compressible(asset)
+        if compress and loop is None:
+            self._add_variants(asset, self._compress(data))
+        if asset.memory <= self.max_size:
+            self._assets[path] = asset
+            self.memory += asset.memory
+            self._evict()
+            if compress and loop is not None:
+                future = loop.run_in_executor(None, self._compress, data)
+                future.add_done_callback(partial(self._compressed, asset))
+        return asset
+
+    def _compress(self, data):
+        variants = [('gzip', gzip.compress(data, self.compresslevel))]
+        if brotli:  # pragma    nocover
+            variants.append(('br', brotli.compress(data)))
+        return variants
+
+    def _compressed(self, asset, future):
+        # encoded variants ready, add them if the asset is still cached
+        if (not future.cancelled() and not future.exception() and
+                self._assets.get(asset.path) is asset):
+            memory = asset.memory
+            self._add_variants(asset, future.result())
+            self.memory += asset.memory - memory
+            self._evict()
+
+    def _add_variants(self, asset, variants):
+        for coding, data in variants:
+            asset.add_variant(coding, data)
+
+    def _evict(self):
+        while self.memory > self.max_size:
+            _, evicted = self._assets.popitem(last=False)
+            self.memory -= evicted.memory
+
+    def _compressible(self, asset):
+        return (asset.size >= self.min_length and
+                not asset.encoding and
+                not re_media_type.match(asset.content_type or ''))
@@ -1,10 +1,11 @@
 import email.parser
 import asyncio
+from collections import deque
 from http.client import HTTPMessage, _MAXLINE, _MAXHEADERS
 from io import BytesIO
 from urllib.parse import parse_qs
 from base64 import b64encode
-from functools import reduce
+from tempfile import SpooledTemporaryFile
 from cgi import valid_boundary, parse_header
 
 from pulsar import HttpException, BadRequest, isawaitable, ensure_future
@@ -17,6 +18,14 @@ from pulsar.utils.httpurl import (DEFAULT_CHARSET, ENCODE_BODY_METHODS,
 ONEMB = 2**20
 # Default max size for body when not streaming
 DEFAULT_MAXSIZE = 10*ONEMB
+# Default max line length of body readers
+DEFAULT_LIMIT = 2**16
+# Body bytes buffered before pausing the transport
+HIGH_WATER = ONEMB
+# Size of chunks read by the form decoders
+CHUNK_SIZE = 2**16
+# Multipart parts larger than this are spooled to disk
+SPOOL_SIZE = 2**18
 
 FORM_ENCODED_TYPES = ('application/x-www-form-urlencoded',
                       'application/x-url-encoded')
@@ -31,22 +40,61 @@ def http_protocol(parser):
 
 
 class HttpBodyReader:
+    '''The ``wsgi.input`` stream of a request body.
+
+    Body chunks received from the parser are kept in a deque and handed
+    to readers without joining them into a single buffer. Reading from
+    the ``transport`` is paused when more than ``high_water`` bytes are
+    waiting to be read and resumed once they drop below ``low_water``
+    or a reader needs more data.
+    '''
     _expect_sent = None
-    _waiting = None
+    _waiter = None
+    _paused = False
 
-    def __init__(self, headers, parser, transport, **kw):
+    def __init__(self, headers, parser, transport, limit=DEFAULT_LIMIT,
+                 high_water=HIGH_WATER, low_water=None, loop=None):
         self.headers = headers
         self.parser = parser
-        self.reader = asyncio.StreamReader(**kw)
-        self.reader.set_transport(transport)
-        self.feed_data = self.reader.feed_data
-        self.feed_eof = self.reader.feed_eof
+        self.transport = transport
+        self.high_water = high_water
+        self.low_water = high_water // 4 if low_water is None else low_water
+        self._limit = limit
+        self._loop = loop or asyncio.get_event_loop()
+        self._chunks = deque()
+        self._size = 0
+        self._eof = False
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def feed_data(self, data):
+        if data:
+            self._chunks.append(data)
+            self._size += len(data)
+            self._wakeup()
+            if (self._size > self.high_water and not self._paused and
+                    self.transport is not None):
+                try:
+                    self.transport.pause_reading()
+                except NotImplementedError:
+                    pass
+                else:
+                    self._paused = True
+
+    def feed_eof(self):
+        self._eof = True
+        self._wakeup()
+
+    def at_eof(self):
+        return self._eof and not self._size
 
     def waiting_expect(self):
         '''``True`` when the client is waiting for 100 Continue.
         '''
         if self._expect_sent is None:
-            if (not self.reader.at_eof() and
+            if (not self.at_eof() and
                     self.headers.has('expect', '100-continue')):
                 return True
             self._expect_sent = ''
@@ -59,31 +107,160 @@ class HttpBodyReader:
             else:
                 msg = '%s 100 Continue\r\n\r\n' % http_protocol(self.parser)
                 self._expect_sent = msg
-                self.reader._transport.write(msg.encode(DEFAULT_CHARSET))
+                self.transport.write(msg.encode(DEFAULT_CHARSET))
 
     def fail(self):
         if self.waiting_expect():
             raise HttpException(status=417)
 
-    def read(self, n=-1):
+    async def read(self, n=-1):
+        '''Read up to ``n`` bytes, or until EOF when ``n`` is negative
+        '''
         self.can_continue()
-        return self.reader.read(n=n)
+        if not n:
+            return b''
+        if n < 0:
+            blocks = []
+            while True:
+                if self._size:
+                    blocks.append(self._take(self._size))
+                elif self._eof:
+                    return b''.join(blocks)
+                else:
+                    await self._wait_for_data()
+        if not self._size and not self._eof:
+            await self._wait_for_data()
+        return self._take(min(n, self._size))
 
-    def readline(self):
-        self.can_continue()
-        return self.reader.readline()
+    async def readinto(self, buffer):
+        '''Read bytes into a pre-allocated, writable ``buffer``.
 
-    def readexactly(self, n):
+        Chunks are copied once, directly into ``buffer``.
+
+        :return: the number of bytes read, 0 at EOF.
+        '''
         self.can_continue()
-        return self.reader.readexactly(n)
+        view = memoryview(buffer).cast('B')
+        if not self._size and not self._eof:
+            await self._wait_for_data()
+        chunks = self._chunks
+        nbytes = 0
+        total = len(view)
+        while chunks and nbytes < total:
+            chunk = chunks[0]
+            size = min(len(chunk), total - nbytes)
+            view[nbytes:nbytes+size] = memoryview(chunk)[:size]
+            nbytes += size
+            if size == len(chunk):
+                chunks.popleft()
+            else:
+                chunks[0] = chunk[size:]
+        self._consumed(nbytes)
+        return nbytes
 
-    @property
-    def limit(self):
-        return self.reader._limit
+    async def readexactly(self, n):
+        self.can_continue()
+        while self._size < n:
+            if self._eof:
+                raise asyncio.IncompleteReadError(self._take(self._size), n)
+            await self._wait_for_data()
+        return self._take(n)
 
-    def readuntil(self, separator):
+    async def readline(self):
+        try:
+            return await self.readuntil(b'\n')
+        except asyncio.IncompleteReadError as exc:
+            return exc.partial
+        except asyncio.LimitOverrunError as exc:
+            self._take(exc.consumed)
+            raise ValueError(exc.args[0])
+
+    async def readuntil(self, separator=b'\n'):
+        '''Read until ``separator`` is found, with the same errors of
+        :meth:`asyncio.StreamReader.readuntil`
+        '''
         self.can_continue()
-        return self.reader.readuntil(separator)
+        seplen = len(separator)
+        offset = 0
+        while True:
+            buffer = self._coalesce()
+            index = buffer.find(separator, offset)
+            if index >= 0:
+                if index > self._limit:
+                    raise asyncio.LimitOverrunError(
+                        'Separator is found, but chunk is longer than limit',
+                        index)
+                return self._take(index + seplen)
+            offset = max(len(buffer) + 1 - seplen, 0)
+            if offset > self._limit:
+                raise asyncio.LimitOverrunError(
+                    'Separator is not found, and chunk exceed the limit',
+                    offset)
+            if self._eof:
+                raise asyncio.IncompleteReadError(self._take(self._size),
+                                                  None)
+            await self._wait_for_data()
+
+    #    INTERNALS
+    def _take(self, n):
+        # remove n bytes from the chunks, copying only when n does not
+        # match a chunk
+        if n <= 0:
+            return b''
+        chunks = self._chunks
+        chunk = chunks[0]
+        if len(chunk) == n:
+            data = chunks.popleft()
+        elif len(chunk) > n:
+            data = chunk[:n]
+            chunks[0] = chunk[n:]
+        else:
+            blocks = []
+            size = n
+            while size:
+                chunk = chunks[0]
+                if len(chunk) <= size:
+                    blocks.append(chunks.popleft())
+                    size -= len(chunk)
+                else:
+                    blocks.append(chunk[:size])
+                    chunks[0] = chunk[size:]
+                    size = 0
+            data = b''.join(blocks)
+        self._consumed(n)
+        return bytes(data)
+
+    def _coalesce(self):
+        chunks = self._chunks
+        if len(chunks) > 1:
+            data = b''.join(chunks)
+            chunks.clear()
+            chunks.append(data)
+        return chunks[0] if chunks else b''
+
+    def _consumed(self, n):
+        self._size -= n
+        if self._paused and self._size <= self.low_water:
+            self._resume()
+
+    def _resume(self):
+        self._paused = False
+        self.transport.resume_reading()
+
+    def _wakeup(self):
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def _wait_for_data(self):
+        # a reader needs more data, resume the transport if paused
+        if self._paused:
+            self._resume()
+        self._waiter = self._loop.create_future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
 
 
 def parse_form_data(environ, stream=None, **kw):
@@ -100,7 +277,10 @@ def parse_form_data(environ, stream=None, **kw):
     :parameter stream: Optional callable accepting one parameter only, the
         instance of :class:`FormDecoder` being parsed. If provided, the
         callable is invoked when data or partial data has been successfully
-        parsed.
+        parsed. When the body is read asynchronously, the callable can
+        return an awaitable and reading resumes once it is done.
+    :parameter spool_size: Optional size, in bytes, above which multipart
+        parts are spooled to disk (when ``stream`` is not provided).
     '''
     method = environ.get('REQUEST_METHOD', 'GET').upper()
     if method not in ENCODE_BODY_METHODS:
@@ -146,68 +326,77 @@ class FormDecoder:
 
 
 class MultipartDecoder(FormDecoder):
+    '''Incremental decoder of ``multipart/form-data`` bodies.
+
+    The body is read in chunks and scanned for the boundary delimiter,
+    parts are fed as they arrive and never accumulated by the decoder.
+    Without a ``stream`` callable, parts larger than ``spool_size`` bytes
+    are spooled to a temporary file.
+    '''
     boundary = None
 
+    @property
+    def spool_size(self):
+        return self.options.get('spool_size', SPOOL_SIZE)
+
     def parse(self):
         boundary = self.options.get('boundary', '')
         if not valid_boundary(boundary):
             raise HttpException("Invalid boundary for multipart/form-data",
                                 status=422)
         inp = self.environ.get('wsgi.input') or BytesIO()
-        self.buffer = bytearray()
 
         if isinstance(inp, HttpBodyReader):
             return ensure_future(self._consume(inp, boundary),
-                                 loop=inp.reader._loop)
+                                 loop=inp._loop)
         else:
             producer = BytesProducer(inp)
             return producer(self._consume, boundary)
 
     async def _consume(self, fp, boundary):
-        sep = b'--'
-        nextpart = ('--%s' % boundary).encode()
-        lastpart = ("--%s--" % boundary).encode()
-        terminator = b""
-
-        while terminator != lastpart:
-            nbytes = -1
-            data = None
-            current = None
-
-            if terminator:
-                headers = await parse_headers(fp)
-                current = MultipartPart(self, headers)
-
-                if nbytes > 0:
-                    data = await fp.read(nbytes)
-                else:
-                    data = b''
+        # The line break before the first delimiter is optional
+        body = BufferedBody(fp, b'\n')
+        buffer = body.buffer
+        delimiter = ('\n--%s' % boundary).encode()
+        size = len(delimiter)
+        current = None
 
-                if current.name:
-                    current.feed_data(data)
-                else:
-                    current = None
-
-            while 1:
-                try:
-                    line = await fp.readuntil(b'\n')
-                except asyncio.streams.LimitOverrunError as e:
-                    line = await fp.read(fp.limit)
-                line = line or lastpart
-                if line.startswith(sep):
-                    terminator = line.rstrip()
-                    if terminator in (nextpart, lastpart):
-                        break
-                if current:
-                    current.feed_data(line)
-
-            # Done with part.
+        while True:
+            index = buffer.find(delimiter)
+            if index < 0:
+                tail = len(buffer) - size
+                if tail > 0:
+                    if current:
+                        await self._wait(
+                            current.feed_data(bytes(buffer[:tail])))
+                    del buffer[:tail]
+                if await body.fill():
+                    continue
+                # no close delimiter, the part ends with the body
+                index = len(buffer)
             if current:
-                current.done()
+                end = index
+                if index and buffer[index-1] == 13:   # \r
+                    end -= 1
+                await self._wait(current.feed_data(bytes(buffer[:end])))
+                await self._wait(current.done())
+                current = None
+            del buffer[:index+size]
+            line = await body.readline()
+            if not line or line.startswith(b'--'):
+                break
+            headers = await parse_headers(body)
+            current = MultipartPart(self, headers)
+            if not current.name:
+                current = None
 
-        self.environ['wsgi.input'] = BytesIO(self.buffer)
+        self.environ['wsgi.input'] = BytesIO()
         return self.result
 
+    async def _wait(self, waiter):
+        if isawaitable(waiter):
+            await waiter
+
 
 class BytesDecoder(FormDecoder):
 
@@ -217,16 +406,27 @@ class BytesDecoder(FormDecoder):
             raise HttpException("Request to big. Increase MAXMEM.",
                                 status=LARGE_BODY_CODE)
         inp = self.environ.get('wsgi.input') or BytesIO()
-        data = inp.read()
 
-        if isawaitable(data):
-            return ensure_future(self._async(data))
+        if isinstance(inp, HttpBodyReader):
+            return ensure_future(self._consume(inp, mem_limit),
+                                 loop=inp._loop)
         else:
-            return self._ready(data)
+            producer = BytesProducer(inp)
+            return producer(self._consume, mem_limit)
 
-    async def _async(self, chunk):
-        chunk = await chunk
-        return self._ready(chunk)
+    async def _consume(self, fp, mem_limit):
+        # the limit is checked as data arrives, bodies without a
+        # content-length are not read past it
+        data = bytearray()
+        while True:
+            chunk = await fp.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            data.extend(chunk)
+            if len(data) > mem_limit:
+                raise HttpException("Request to big. Increase MAXMEM.",
+                                    status=LARGE_BODY_CODE)
+        return self._ready(bytes(data))
 
     def _ready(self, data):
         self.environ['wsgi.input'] = BytesIO(data)
@@ -259,13 +459,22 @@ class JsonDecoder(BytesDecoder):
 
 
 class MultipartPart:
+    '''A part of a ``multipart/form-data`` body.
+
+    When the decoder has a ``stream`` callable, data is kept until consumed
+    via the :meth:`recv` method, otherwise it is written into :attr:`file`,
+    a :class:`~tempfile.SpooledTemporaryFile` which rolls over to disk
+    once larger than the decoder ``spool_size``.
+    '''
     filename = None
     name = ''
+    file = None
 
     def __init__(self, parser, headers):
         self.parser = parser
         self.headers = headers
-        self._bytes = []
+        self._bytes = deque()
+        self._size = 0
         self._done = False
         length = headers.get('content-length')
         content = headers.get('content-disposition')
@@ -297,10 +506,16 @@ class MultipartPart:
 
     @property
     def size(self):
-        return reduce(lambda x, y: x+len(y), self._bytes, 0)
+        return self._size
 
     def bytes(self):
         '''Bytes'''
+        if self.file:
+            position = self.file.tell()
+            self.file.seek(0)
+            data = self.file.read()
+            self.file.seek(position)
+            return data
         return b''.join(self._bytes)
 
     def bytesio(self):
@@ -318,46 +533,58 @@ class MultipartPart:
         return self._done
 
     def feed_data(self, data):
+        '''Feed ``data`` to this part.
+
+        Return the result of the decoder ``stream`` callable, if available
+        '''
         if data:
-            self._bytes.append(data)
+            self._size += len(data)
             if self.parser.stream:
-                self.parser.stream(self)
-            else:
-                self.parser.buffer.extend(data)
+                self._bytes.append(data)
+                return self.parser.stream(self)
+            if self.file is None:
+                self.file = SpooledTemporaryFile(
+                    max_size=self.parser.spool_size)
+            self.file.write(data)
 
     def recv(self, size=-1):
-        if self._done:
-            data = self._bytes
-            self._bytes = []
-        else:
-            data = self._bytes[:-1]
-            self._bytes = self._bytes[-1:]
-        return b''.join(data)
+        '''Consume data received, at most ``size`` bytes if not negative
+        '''
+        if self.file:
+            return self.file.read(size)
+        data = b''.join(self._bytes)
+        self._bytes.clear()
+        if 0 <= size < len(data):
+            self._bytes.append(data[size:])
+            data = data[:size]
+        return data
 
     def is_file(self):
         return self.filename or self.content_type not in (None, 'text/plain')
 
     def done(self):
-        if not self._done:
-
-            if self._bytes and self.length < 0:
-                # Strip final line terminator
-                line = self._bytes[-1]
-                if line[-2:] == b"\r\n":
-                    line = line[:-2]
-                elif line[-1:] == b"\n":
-                    line = line[:-1]
-                self._bytes[-1] = line
+        '''Mark this part as complete.
 
+        Return the result of the decoder ``stream`` callable, if available
+        '''
+        if not self._done:
             self._done = True
-            if self.parser.stream:
-                self.parser.stream(self)
+            if self.file:
+                self.file.seek(0)
 
             if self.is_file():
                 self.parser.result[1][self.name] = self
             else:
                 self.parser.result[0][self.name] = self.string()
 
+            if self.parser.stream:
+                return self.parser.stream(self)
+
+    def close(self):
+        '''Close :attr:`file`, removing it from disk if spooled'''
+        if self.file:
+            self.file.close()
+
 
 async def parse_headers(fp, _class=HTTPMessage):
     """Parses only RFC2822 headers from a file pointer.
@@ -381,6 +608,37 @@ async def parse_headers(fp, _class=HTTPMessage):
     return email.parser.Parser(_class=_class).parsestr(hstring)
 
 
+class BufferedBody:
+    '''Read a body stream ``fp`` in chunks through a :attr:`buffer`'''
+
+    def __init__(self, fp, data=b''):
+        self.fp = fp
+        self.buffer = bytearray(data)
+
+    async def fill(self):
+        '''Read a chunk into the buffer, return ``False`` at end of body'''
+        chunk = await self.fp.read(CHUNK_SIZE)
+        self.buffer.extend(chunk)
+        return bool(chunk)
+
+    async def readline(self):
+        buffer = self.buffer
+        start = 0
+        while True:
+            index = buffer.find(b'\n', start)
+            if index >= 0:
+                index += 1
+                break
+            start = len(buffer)
+            # let the caller fail on lines too long
+            if start > _MAXLINE or not await self.fill():
+                index = start
+                break
+        line = bytes(buffer[:index])
+        del buffer[:index]
+        return line
+
+
 class BytesProducer:
 
     def __init__(self, bytes):
@@ -389,8 +647,8 @@ class BytesProducer:
     async def readline(self):
         return self.bytes.readline()
 
-    async def read(self):
-        return self.bytes.read()
+    async def read(self, n=-1):
+        return self.bytes.read(n)
 
     def __call__(self, consumer, *args):
         value = None
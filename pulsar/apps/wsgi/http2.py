@@ -0,0 +1,401 @@
+'''
+HTTP/2 Protocol Consumer
+==============================
+
+HTTP/2 support for the :class:`.WSGIServer` requires the h2_ package
+and the ``http2`` setting.
+
+A connection switches from HTTP/1.1 to HTTP/2 when the client starts with
+the HTTP/2 connection preface (prior knowledge) or asks for an ``h2c``
+upgrade of a request without body. Each stream is served concurrently
+by the same wsgi callable of HTTP/1.1 requests, with flow control of
+both request and response bodies.
+
+.. autoclass:: Http2ServerConnection
+   :members:
+   :member-order: bysource
+
+
+.. _h2: https://python-hyper.org/projects/h2/
+'''
+import sys
+from asyncio import wait_for, ensure_future
+from urllib.parse import urlsplit
+
+try:
+    from h2.config import H2Configuration
+    from h2.connection import H2Connection
+    from h2.exceptions import ProtocolError as H2ProtocolError
+    from h2.settings import SettingCodes
+    from h2 import events
+except ImportError:     # pragma    nocover
+    H2Connection = None
+
+from pulsar import HttpException, isawaitable
+from pulsar.utils.httpurl import Headers, current_http_date
+from pulsar.async.protocols import ProtocolConsumer
+
+from .utils import handle_wsgi_error, wsgi_request, HOP_HEADERS, log_wsgi_info
+from .server import (wsgi_environ, resolve_server_name, HttpServerResponse,
+                     AbortWsgi)
+from .formdata import HttpBodyReader
+from .wrappers import close_object
+
+
+MAX_CONCURRENT_STREAMS = 256
+
+
+class Http2Request:
+    '''The request headers of a stream, with the interface of the
+    HTTP parser used by :func:`.wsgi_environ`
+    '''
+    def __init__(self, headers):
+        self.headers = []
+        pseudo = {}
+        for name, value in headers:
+            name = name.decode('latin-1')
+            value = value.decode('latin-1')
+            if name.startswith(':'):
+                pseudo[name] = value
+            else:
+                self.headers.append((name, value))
+        self.method = pseudo.get(':method', 'GET')
+        self.path = pseudo.get(':path', '/')
+        authority = pseudo.get(':authority')
+        if authority and not any(name == 'host' for name, _ in self.headers):
+            self.headers.append(('host', authority))
+
+    def get_url(self):
+        return self.path
+
+    def get_method(self):
+        return self.method
+
+    def get_query_string(self):
+        return urlsplit(self.path).query
+
+    def get_version(self):
+        return (2, 0)
+
+
+class Http2BodyReader(HttpBodyReader):
+    '''The ``wsgi.input`` of a stream.
+
+    Consumed data is acknowledged to the client, which can then send
+    more data on the stream, rather than pausing the transport.
+    '''
+    def __init__(self, stream, headers, loop=None):
+        super().__init__(headers, None, None, loop=loop)
+        self.stream = stream
+
+    def waiting_expect(self):
+        return False
+
+    def _consumed(self, n):
+        self._size -= n
+        self.stream.acknowledge(n)
+
+
+class Http2Stream:
+    '''A request and its response on an HTTP/2 stream'''
+    def __init__(self, connection, stream_id, headers=None):
+        self.connection = connection
+        self.stream_id = stream_id
+        self.headers = Headers()
+        self.status = None
+        self.headers_sent = False
+        self.unacknowledged = 0
+        self.input = Http2BodyReader(self, headers, loop=connection._loop)
+
+    def start(self, environ):
+        self.environ = environ
+        ensure_future(self._response(environ), loop=self.connection._loop)
+
+    def feed_data(self, data, flow_controlled_length):
+        self.unacknowledged += len(data)
+        padding = flow_controlled_length - len(data)
+        if padding:
+            self.connection.acknowledge(self.stream_id, padding)
+        self.input.feed_data(data)
+
+    def acknowledge(self, size):
+        size = min(size, self.unacknowledged)
+        if size:
+            self.unacknowledged -= size
+            self.connection.acknowledge(self.stream_id, size)
+
+    def start_response(self, status, response_headers, exc_info=None):
+        '''WSGI compliant ``start_response`` callable'''
+        if exc_info:
+            try:
+                if self.headers_sent:
+                    raise exc_info[1].with_traceback(exc_info[2])
+            finally:
+                exc_info = None
+        elif self.status:
+            raise HttpException("Response headers already set!")
+        self.status = status
+        if type(response_headers) is not list:
+            raise TypeError("Headers must be a list of name/value tuples")
+        for header, value in response_headers:
+            if header.lower() not in HOP_HEADERS:
+                self.headers.add_header(header, value)
+        return self.write
+
+    async def write(self, data, end_stream=False):
+        '''Send ``data`` on the stream, sending the headers first'''
+        connection = self.connection
+        if self.environ['REQUEST_METHOD'] == 'HEAD':
+            data = b''
+        if not self.headers_sent:
+            if not self.status:
+                raise HttpException('Headers not set.')
+            self.headers_sent = True
+            end = end_stream and not data
+            connection.send_headers(self.stream_id, self._response_headers(),
+                                    end)
+            if end:
+                return
+        if data or end_stream:
+            await connection.send_data(self.stream_id, data, end_stream)
+
+    def _response_headers(self):
+        headers = [(':status', self.status[:3])]
+        for name, value in self.headers:
+            name = name.lower()
+            if name not in HOP_HEADERS:
+                headers.append((name, value))
+        if 'Server' not in self.headers:
+            headers.append(('server', self.connection.SERVER_SOFTWARE))
+        if 'Date' not in self.headers:
+            headers.append(('date', current_http_date()))
+        return headers
+
+    async def _response(self, environ):
+        connection = self.connection
+        exc_info = None
+        response = None
+        done = False
+        alive = connection.cfg.keep_alive or 15
+        await resolve_server_name(
+            environ, connection.transport.get_extra_info('sockname'),
+            connection._loop)
+        while not done:
+            done = True
+            try:
+                if exc_info is None:
+                    response = connection.wsgi_callable(environ,
+                                                        self.start_response)
+                    if isawaitable(response):
+                        response = await wait_for(response, alive)
+                else:
+                    response = handle_wsgi_error(environ, exc_info)
+                    if isawaitable(response):
+                        response = await wait_for(response, alive)
+                    self.start_response(response.status,
+                                        response.get_headers(), exc_info)
+                for chunk in response:
+                    if isawaitable(chunk):
+                        chunk = await wait_for(chunk, alive)
+                    if chunk:
+                        await self.write(chunk)
+                await self.write(b'', True)
+            # client reset the stream or disconnected
+            except (IOError, AbortWsgi, H2ProtocolError):
+                connection.reset(self.stream_id)
+            except Exception:
+                if (self.headers_sent or
+                        wsgi_request(environ).cache.handle_wsgi_error):
+                    connection.logger.exception('Exception while serving '
+                                                'stream %s', self.stream_id)
+                    connection.reset(self.stream_id)
+                else:
+                    done = False
+                    exc_info = sys.exc_info()
+            else:
+                log_wsgi_info(connection.logger.info, environ, self.status)
+            finally:
+                close_object(response)
+        connection.stream_done(self)
+
+
+class Http2ServerConnection(ProtocolConsumer):
+    '''Server side HTTP/2 :class:`.ProtocolConsumer`.
+
+    It handles all the streams of a connection, multiplexing their
+    responses according to the flow control windows of the client.
+
+    :param upgrade: optional ``(settings, environ)`` tuple of an ``h2c``
+        upgrade, where ``settings`` is the ``HTTP2-Settings`` header and
+        ``environ`` the environ of the upgraded request, served on
+        stream 1.
+    '''
+    max_concurrent_streams = MAX_CONCURRENT_STREAMS
+
+    def __init__(self, wsgi_callable, cfg, server_software=None, loop=None,
+                 environ=None, upgrade=None):
+        super().__init__(loop=loop)
+        self.wsgi_callable = wsgi_callable
+        self.cfg = cfg
+        self.SERVER_SOFTWARE = (server_software or
+                                HttpServerResponse.SERVER_SOFTWARE)
+        if environ is None:
+            environ = HttpServerResponse.environ_template(
+                cfg, self.SERVER_SOFTWARE)
+        self.environ = environ
+        self.streams = {}
+        self.h2 = H2Connection(config=H2Configuration(client_side=False,
+                                                      header_encoding=None))
+        self._upgrade = upgrade
+        self._windows = {}
+
+    def connection_made(self, connection):
+        h2 = self.h2
+        if self._upgrade:
+            settings, environ = self._upgrade
+            h2.initiate_upgrade_connection(settings)
+        else:
+            h2.initiate_connection()
+        h2.update_settings({
+            SettingCodes.MAX_CONCURRENT_STREAMS: self.max_concurrent_streams
+        })
+        self.flush()
+        if self._upgrade:
+            stream = Http2Stream(self, 1)
+            self.streams[1] = stream
+            stream.start(environ)
+
+    def data_received(self, data):
+        '''Feed ``data`` to the HTTP/2 state machine and handle events'''
+        try:
+            h2_events = self.h2.receive_data(data)
+        except H2ProtocolError:
+            self.flush()
+            self.connection.close()
+            return
+        for event in h2_events:
+            if isinstance(event, events.RequestReceived):
+                self._request_received(event)
+            elif isinstance(event, events.DataReceived):
+                stream = self.streams.get(event.stream_id)
+                if stream:
+                    stream.feed_data(event.data,
+                                     event.flow_controlled_length)
+                else:
+                    self.acknowledge(event.stream_id,
+                                     event.flow_controlled_length)
+            elif isinstance(event, events.StreamEnded):
+                stream = self.streams.get(event.stream_id)
+                if stream:
+                    stream.input.feed_eof()
+            elif isinstance(event, events.StreamReset):
+                self._wake(event.stream_id, ConnectionResetError(
+                    'Stream %s reset' % event.stream_id))
+            elif isinstance(event, (events.WindowUpdated,
+                                    events.RemoteSettingsChanged)):
+                self._wake(getattr(event, 'stream_id', 0))
+            elif isinstance(event, events.ConnectionTerminated):
+                self.connection.close()
+        self.flush()
+
+    def connection_lost(self, exc):
+        for stream_id in tuple(self._windows):
+            self._wake(stream_id, ConnectionResetError('Connection lost'))
+        for stream in self.streams.values():
+            stream.input.feed_eof()
+        return super().connection_lost(exc)
+
+    def flush(self):
+        '''Write pending HTTP/2 frames to the transport'''
+        data = self.h2.data_to_send()
+        if data:
+            return self.write(data)
+        return ()
+
+    def send_headers(self, stream_id, headers, end_stream=False):
+        self.h2.send_headers(stream_id, headers, end_stream=end_stream)
+        self.flush()
+
+    async def send_data(self, stream_id, data, end_stream=False):
+        '''Send ``data`` on ``stream_id`` within the flow control windows
+        '''
+        h2 = self.h2
+        while data:
+            size = min(h2.local_flow_control_window(stream_id),
+                       h2.max_outbound_frame_size, len(data))
+            if size <= 0:
+                await self._window(stream_id)
+                continue
+            h2.send_data(stream_id, data[:size])
+            data = data[size:]
+            waiter = self.flush()
+            if waiter:
+                await waiter
+        if end_stream:
+            h2.end_stream(stream_id)
+            self.flush()
+
+    def acknowledge(self, stream_id, size):
+        '''Acknowledge ``size`` bytes received on ``stream_id``'''
+        try:
+            self.h2.acknowledge_received_data(size, stream_id)
+        except H2ProtocolError:
+            pass
+        else:
+            self.flush()
+
+    def reset(self, stream_id):
+        '''Reset ``stream_id`` if still open'''
+        try:
+            self.h2.reset_stream(stream_id)
+        except H2ProtocolError:
+            pass
+        else:
+            self.flush()
+
+    def stream_done(self, stream):
+        '''Remove a served ``stream``'''
+        self.streams.pop(stream.stream_id, None)
+        self._windows.pop(stream.stream_id, None)
+        stream.acknowledge(stream.unacknowledged)
+
+    #    INTERNALS
+    def _request_received(self, event):
+        request = Http2Request(event.headers)
+        stream = Http2Stream(self, event.stream_id, request.headers)
+        self.streams[event.stream_id] = stream
+        transport = self.transport
+        https = True if transport.get_extra_info('sslcontext') else False
+        environ = wsgi_environ(stream.input,
+                               request,
+                               request.headers,
+                               transport.get_extra_info('sockname'),
+                               self.address,
+                               stream.headers,
+                               self.SERVER_SOFTWARE,
+                               https=https,
+                               extra={'pulsar.connection': self.connection},
+                               template=self.environ)
+        stream.start(environ)
+
+    def _window(self, stream_id):
+        waiter = self._windows.get(stream_id)
+        if waiter is None:
+            waiter = self._loop.create_future()
+            self._windows[stream_id] = waiter
+        return waiter
+
+    def _wake(self, stream_id, exc=None):
+        # a flow control window was updated or a stream was reset,
+        # the connection window (stream 0) wakes all streams
+        if stream_id:
+            waiters = [self._windows.pop(stream_id, None)]
+        else:
+            waiters = list(self._windows.values())
+            self._windows.clear()
+        for waiter in waiters:
+            if waiter and not waiter.done():
+                if exc:
+                    waiter.set_exception(exc)
+                else:
+                    waiter.set_result(None)
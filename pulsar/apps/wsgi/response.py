@@ -28,15 +28,46 @@ AccessControl
 
 '''
 import re
-from gzip import GzipFile
+import zlib
 
-from pulsar.utils.httpurl import BytesIO
+from pulsar import isawaitable
 
 
 re_accepts_gzip = re.compile(r'\bgzip\b')
+re_accepts_deflate = re.compile(r'\bdeflate\b')
 re_media_type = re.compile(r'^(image|audio|video)/.+')
 
 
+def compress_chunk(compressor, chunk, encoding='utf-8', flush=None):
+    '''Feed ``chunk`` to ``compressor`` and return the compressed bytes
+    available
+    '''
+    if not chunk:
+        return b''
+    if isinstance(chunk, str):
+        chunk = chunk.encode(encoding)
+    data = compressor.compress(chunk)
+    if flush is not None:
+        data += compressor.flush(flush)
+    return data
+
+
+class CompressedContent:
+    '''Streamed ``content`` compressed into ``chunks`` as it is iterated
+    '''
+    def __init__(self, chunks, content):
+        self.chunks = chunks
+        self.content = content
+
+    def __iter__(self):
+        return self.chunks
+
+    def close(self):
+        self.chunks.close()
+        if hasattr(self.content, 'close'):
+            self.content.close()
+
+
 class ResponseMiddleware:
     '''Base class for response middlewares.
 
@@ -90,49 +121,100 @@ class AccessControl(ResponseMiddleware):
 
 class GZipMiddleware(ResponseMiddleware):
     """A :class:`ResponseMiddleware` for compressing content if the request
-allows gzip compression. It sets the Vary header accordingly.
-
-The compression implementation is from
-http://jython.xhaus.com/http-compression-in-python-and-jython
+allows gzip or deflate compression. It sets the Vary header accordingly.
+
+Content is compressed with a :func:`zlib.compressobj`. Streamed responses
+are compressed as they are iterated, flushing the compressor after each
+chunk, and sent with chunked transfer encoding, so that large responses
+are never held in memory. Responses of known length are compressed only
+when longer than ``min_length``. The ``ETag`` of a compressed response is
+made weak and ``Accept-Ranges`` is removed, since byte ranges refer to
+the uncompressed content.
     """
-    def __init__(self, min_length=200):
+    def __init__(self, min_length=200, compresslevel=6):
         self.min_length = min_length
+        self.compresslevel = compresslevel
 
     def available(self, environ, response):
         # It's not worth compressing non-OK or really short responses
-        try:
-            if response.status_code == 200 and not response.is_streamed:
-                if response.length() < self.min_length:
+        if response.status_code == 200:
+            headers = response.headers
+            if response.is_streamed:
+                length = headers.get('Content-Length')
+                length = int(length) if length else None
+            else:
+                length = response.length()
+            if length is not None and length < self.min_length:
+                return False
+            ctype = headers.get('Content-Type', '').lower()
+            # Avoid gzipping if we've already got a content-encoding.
+            if 'Content-Encoding' in headers:
+                return False
+            # MSIE have issues with gzipped response of various
+            # content types.
+            if "msie" in environ.get('HTTP_USER_AGENT', '').lower():
+                if not ctype.startswith("text/") or "javascript" in ctype:
                     return False
-                headers = response.headers
-                ctype = headers.get('Content-Type', '').lower()
-                # Avoid gzipping if we've already got a content-encoding.
-                if 'Content-Encoding' in headers:
-                    return False
-                # MSIE have issues with gzipped response of various
-                # content types.
-                if "msie" in environ.get('HTTP_USER_AGENT', '').lower():
-                    if not ctype.startswith("text/") or "javascript" in ctype:
-                        return False
-                ae = environ.get('HTTP_ACCEPT_ENCODING', '')
-                if not re_accepts_gzip.search(ae):
-                    return False
-                if re_media_type.match(ctype):
-                    return False
-                return True
-        except Exception:
-            raise
+            if not self.coding(environ):
+                return False
+            if re_media_type.match(ctype):
+                return False
+            return True
+
+    def coding(self, environ):
+        '''The content coding, ``gzip`` or ``deflate``, accepted by the
+        client or ``None``
+        '''
+        ae = environ.get('HTTP_ACCEPT_ENCODING', '')
+        if re_accepts_gzip.search(ae):
+            return 'gzip'
+        elif re_accepts_deflate.search(ae):
+            return 'deflate'
 
     def execute(self, environ, response):
+        coding = self.coding(environ)
         headers = response.headers
         headers.add_header('Vary', 'Accept-Encoding')
-        content = b''.join(response.content)
-        response.content = (self.compress_string(content),)
-        response.headers['Content-Encoding'] = 'gzip'
+        headers['Content-Encoding'] = coding
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = 'W/%s' % etag
+        headers.pop('Accept-Ranges', None)
+        encoding = response.encoding or 'utf-8'
+        if response.is_streamed:
+            headers.pop('Content-Length', None)
+            content = response.content
+            response.content = CompressedContent(
+                self.compress(content, coding, encoding, zlib.Z_SYNC_FLUSH),
+                content)
+        else:
+            response.content = (b''.join(self.compress(response.content,
+                                                       coding, encoding)),)
+
+    def compress(self, content, coding='gzip', encoding='utf-8', flush=None):
+        '''Generator of compressed chunks of the ``content`` iterable
+
+        :param flush: optional ``zlib`` flush mode applied after each chunk
+        '''
+        compressor = self.compressor(coding)
+        for chunk in content:
+            if isawaitable(chunk):
+                yield self._compress_async(compressor, chunk, encoding, flush)
+            else:
+                data = compress_chunk(compressor, chunk, encoding, flush)
+                if data:
+                    yield data
+        yield compressor.flush()
+
+    def compressor(self, coding='gzip'):
+        wbits = zlib.MAX_WBITS
+        if coding == 'gzip':
+            wbits += 16
+        return zlib.compressobj(self.compresslevel, zlib.DEFLATED, wbits)
 
     def compress_string(self, s):
-        zbuf = BytesIO()
-        zfile = GzipFile(mode='wb', compresslevel=6, fileobj=zbuf)
-        zfile.write(s)
-        zfile.close()
-        return zbuf.getvalue()
+        return b''.join(self.compress((s,)))
+
+    async def _compress_async(self, compressor, chunk, encoding, flush):
+        chunk = await chunk
+        return compress_chunk(compressor, chunk, encoding, flush)
@@ -73,6 +73,8 @@ method.
 
 .. autofunction:: file_response
 
+.. autofunction:: asset_response
+
 
 RouterParam
 =================
@@ -507,8 +509,14 @@ class Router(metaclass=RouterType):
 
 class MediaMixin:
     cache_control = CacheControl(maxage=86400)
+    asset_cache = None
 
     def serve_file(self, request, fullpath, status_code=None):
+        if self.asset_cache is not None:
+            asset = self.asset_cache.get(fullpath, request._loop)
+            if asset is not None:
+                return asset_response(request, asset, status_code=status_code,
+                                      cache_control=self.cache_control)
         return file_response(request, fullpath, status_code=status_code,
                              cache_control=self.cache_control)
 
@@ -561,6 +569,10 @@ class MediaRouter(Router, MediaMixin):
     .. attribute:: default_file
 
         The default file to serve when a directory is requested.
+
+    .. attribute:: asset_cache
+
+        Optional :class:`.AssetCache` serving files from memory.
     '''
     def __init__(self, rule, path=None, show_indexes=False,
                  default_suffix=None, default_file='index.html',
@@ -586,8 +598,10 @@ class MediaRouter(Router, MediaMixin):
                 raise self.SkipRoute
 
         fullpath = self.filesystem_path(request)
+        cached = (self.asset_cache is not None and
+                  fullpath in self.asset_cache)
 
-        if not self._serve_only:
+        if not self._serve_only and not cached:
 
             if os.path.isdir(fullpath) and self._default_file:
                 file = os.path.join(fullpath, self._default_file)
@@ -650,6 +664,72 @@ def was_modified_since(header=None, mtime=0, size=0):
     return True
 
 
+def etag_match(header, etag):
+    '''Check if ``etag`` matches the ``If-None-Match`` ``header``
+
+    :param header: the value of the ``If-None-Match`` header.
+    :param etag: the quoted entity tag of the item.
+    '''
+    if header:
+        tags = [tag.strip() for tag in header.split(',')]
+        return '*' in tags or etag in tags or 'W/%s' % etag in tags
+    return False
+
+
+def byte_range(header, size):
+    '''The ``(start, end)`` positions, inclusive, of a ``Range`` header
+    over an item of ``size`` bytes
+
+    Return ``None`` when the ``header`` is missing, invalid or requests
+    several ranges, in which case the whole item is served.
+
+    :raise ValueError: when the range is not satisfiable.
+    '''
+    if not header:
+        return None
+    units, _, value = header.partition('=')
+    if units.strip().lower() != 'bytes' or ',' in value:
+        return None
+    first, sep, last = value.strip().partition('-')
+    if not sep or not (first + last).isdigit():
+        return None
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            raise ValueError('Range not satisfiable')
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        suffix = int(last)
+        if not suffix or not size:
+            raise ValueError('Range not satisfiable')
+        start, end = max(size - suffix, 0), size - 1
+    return start, end
+
+
+def not_modified(request, etag, mtime, size):
+    '''Check the ``If-None-Match`` or, when missing, the
+    ``If-Modified-Since`` header of ``request``
+
+    :param etag: the quoted entity tag of the item.
+    '''
+    header = request.get('HTTP_IF_NONE_MATCH')
+    if header:
+        return etag_match(header, etag)
+    header = request.get('HTTP_IF_MODIFIED_SINCE')
+    return not was_modified_since(header, mtime, size)
+
+
+def requested_range(request, etag, mtime, size):
+    '''The :func:`byte_range` of ``request`` when its ``If-Range`` header,
+    if any, matches the quoted ``etag`` or ``mtime`` of the item
+    '''
+    if_range = request.get('HTTP_IF_RANGE')
+    if not if_range or if_range == etag or if_range == http_date(mtime):
+        return byte_range(request.get('HTTP_RANGE'), size)
+
+
 def file_response(request, filepath, block=None, status_code=None,
                   content_type=None, encoding=None, cache_control=None):
     """Utility for serving a local file
@@ -663,6 +743,11 @@ def file_response(request, filepath, block=None, status_code=None,
             def get(self, request):
                 return wsgi.file_response(request, "<filepath>")
 
+    The response has an ``ETag`` validated by the ``If-None-Match`` header
+    and, unless a ``status_code`` is given, serves single ``Range``
+    requests with a ``206`` response.
+    The server sends the file with ``sendfile`` when possible.
+
     :param request: Wsgi request
     :param filepath: full path of file to serve
     :param block: Optional block size (default 1MB)
@@ -675,23 +760,99 @@ def file_response(request, filepath, block=None, status_code=None,
         info = os.stat(filepath)
         size = info[stat.ST_SIZE]
         modified = info[stat.ST_MTIME]
-        header = request.get('HTTP_IF_MODIFIED_SINCE')
-        if not was_modified_since(header, modified, size):
+        etag = digest('modified: %d - size: %d' % (modified, size))
+        response.headers['etag'] = '"%s"' % etag
+        if not_modified(request, response.headers['etag'], modified, size):
             response.status_code = 304
         else:
             if not content_type:
                 content_type, encoding = mimetypes.guess_type(filepath)
+            offset, count = 0, None
+            if not status_code:
+                response.headers['accept-ranges'] = 'bytes'
+                try:
+                    bytes_range = requested_range(
+                        request, response.headers['etag'], modified, size)
+                except ValueError:
+                    response.status_code = 416
+                    response.headers['content-range'] = 'bytes */%d' % size
+                    return response
+                if bytes_range:
+                    offset, end = bytes_range
+                    count = end - offset + 1
+                    status_code = 206
+                    response.headers['content-range'] = (
+                        'bytes %d-%d/%d' % (offset, end, size))
             file = open(filepath, 'rb')
-            response.headers['content-length'] = str(size)
-            response.content = file_wrapper(file, block)
+            response.headers['content-length'] = str(
+                size if count is None else count)
+            if count is None:
+                response.content = file_wrapper(file, block)
+            else:
+                response.content = file_wrapper(file, block, offset, count)
             response.content_type = content_type
             response.encoding = encoding
             if status_code:
                 response.status_code = status_code
-            else:
+            if status_code in (None, 206):
                 response.headers["Last-Modified"] = http_date(modified)
             if cache_control:
-                etag = digest('modified: %d - size: %d' % (modified, size))
                 cache_control(response.headers, etag=etag)
         return response
     raise Http404
+
+
+def asset_response(request, asset, status_code=None, cache_control=None):
+    """Serve a file cached by an :class:`.AssetCache` from memory
+
+    The encoded variant of the file is selected by the ``Accept-Encoding``
+    header, ranges are served from the unencoded file.
+
+    :param request: Wsgi request
+    :param asset: the cached file
+    :param status_code: Optional status code (default 200)
+    :return: a :class:`~.WsgiResponse` object
+    """
+    response = request.response
+    headers = response.headers
+    modified = int(asset.mtime)
+    if len(asset.variants) > 1:
+        headers.add_header('Vary', 'Accept-Encoding')
+    if not status_code and request.get('HTTP_RANGE'):
+        coding = 'identity'
+    else:
+        coding = asset.select(request.get('HTTP_ACCEPT_ENCODING'))
+    etag = asset.entity_tag(coding)
+    headers['etag'] = '"%s"' % etag
+    if not_modified(request, headers['etag'], modified, asset.size):
+        response.status_code = 304
+        return response
+    data = asset.variants[coding]
+    if not status_code:
+        headers['accept-ranges'] = 'bytes'
+        if coding == 'identity':
+            try:
+                bytes_range = requested_range(request, headers['etag'],
+                                              modified, asset.size)
+            except ValueError:
+                response.status_code = 416
+                headers['content-range'] = 'bytes */%d' % asset.size
+                return response
+            if bytes_range:
+                start, end = bytes_range
+                data = data[start:end+1]
+                status_code = 206
+                headers['content-range'] = 'bytes %d-%d/%d' % (start, end,
+                                                               asset.size)
+    if coding != 'identity':
+        headers['content-encoding'] = coding
+    response.content = data
+    response.content_type = asset.content_type
+    response.encoding = asset.encoding
+    if status_code:
+        response.status_code = status_code
+    if status_code in (None, 206):
+        headers["Last-Modified"] = http_date(modified)
+    if cache_control:
+        cache_control(headers, etag=etag)
+    return response
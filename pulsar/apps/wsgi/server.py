@@ -11,14 +11,20 @@ Testing WSGI Environ
 =========================
 
 .. autofunction:: test_wsgi_environ
+
+
+WSGI Environ template
+=========================
+
+.. autofunction:: environ_template
 '''
 import sys
-import time
 import os
 import socket
 import io
 from asyncio import wait_for, ensure_future, sleep
-from wsgiref.handlers import format_date_time
+from collections import deque
+from functools import lru_cache, partial
 from urllib.parse import urlparse, unquote
 
 import pulsar
@@ -26,7 +32,8 @@ from pulsar import (reraise, HttpException, ProtocolError, isawaitable,
                     BadRequest)
 from pulsar.utils.pep import native_str
 from pulsar.utils.httpurl import (Headers, has_empty_content, http_parser,
-                                  iri_to_uri, http_chunks)
+                                  iri_to_uri, http_chunks, current_http_date,
+                                  DEFAULT_CHARSET)
 
 from pulsar.async.protocols import ProtocolConsumer
 
@@ -38,6 +45,20 @@ from .wrappers import FileWrapper, close_object
 
 MAX_TIME_IN_LOOP = 0.2
 HTTP_1_1 = (1, 1)
+# maximum number of header names in the HTTP_* lookup table
+MAX_HEADER_KEYS = 1024
+HEADER_KEYS = {}
+# maximum number of host names in the SERVER_NAME lookup table
+MAX_SERVER_NAMES = 256
+SERVER_NAMES = {}
+# bytes a pipelined response buffers before waiting for its turn
+MAX_PIPELINE_BUFFER = 65536
+# methods of pipelined requests which can be served concurrently
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+# connection preface of HTTP/2 clients with prior knowledge
+HTTP2_PREFACE = b'PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n'
+SWITCHING_TO_H2C = (b'HTTP/1.1 101 Switching Protocols\r\n'
+                    b'Connection: Upgrade\r\nUpgrade: h2c\r\n\r\n')
 
 
 class AbortWsgi(Exception):
@@ -81,8 +102,85 @@ def test_wsgi_environ(path=None, method=None, headers=None, extra=None,
                         Headers(), https=https, extra=params)
 
 
+def server_name(host):
+    '''The fully qualified domain name of ``host``, resolved once.
+
+    It blocks on a cache miss, use :func:`resolve_server_name` from the
+    event loop
+    '''
+    name = SERVER_NAMES.get(host)
+    if name is None:
+        name = socket.getfqdn(host)
+        if len(SERVER_NAMES) < MAX_SERVER_NAMES:
+            SERVER_NAMES[host] = name
+    return name
+
+
+async def resolve_server_name(environ, address, loop):
+    '''Set the ``SERVER_NAME`` of ``environ`` when the name of the server
+    ``address`` was not in the cache used by :func:`wsgi_environ`.
+
+    The name is resolved in the ``loop`` executor
+    '''
+    host = address[0]
+    if environ['SERVER_NAME'] == host:
+        name = SERVER_NAMES.get(host)
+        if name is None:
+            name = await loop.run_in_executor(None, server_name, host)
+        environ['SERVER_NAME'] = name
+
+
+@lru_cache(maxsize=16)
+def header_block(server=None, date=None, connection=None):
+    '''Pre-encoded ``Server``, ``Date`` and ``Connection`` header lines'''
+    lines = []
+    if server:
+        lines.append('Server: %s\r\n' % server)
+    if date:
+        lines.append('Date: %s\r\n' % date)
+    if connection:
+        lines.append('Connection: %s\r\n' % connection)
+    return ''.join(lines).encode(DEFAULT_CHARSET)
+
+
+def header_key(header):
+    '''The ``HTTP_*`` environ key of a lower case ``header`` name'''
+    key = HEADER_KEYS.get(header)
+    if key is None:
+        key = sys.intern('HTTP_' + header.upper().replace('-', '_'))
+        if len(HEADER_KEYS) < MAX_HEADER_KEYS:
+            HEADER_KEYS[header] = key
+    return key
+
+
+def environ_template(server_software=None, extra=None):
+    '''The keys of the WSGI environ which are the same for all requests
+    of a server.
+
+    The process environment variables ``SCRIPT_NAME`` and
+    ``wsgi.url_scheme`` are read once, when the template is created.
+
+    :param server_software: the ``SERVER_SOFTWARE``
+    :param extra: additional dictionary of keys for all requests
+    '''
+    environ = {"wsgi.errors": sys.stderr,
+               "wsgi.file_wrapper": FileWrapper,
+               "wsgi.version": (1, 0),
+               "wsgi.run_once": False,
+               "wsgi.multithread": False,
+               "wsgi.multiprocess": False,
+               "wsgi.url_scheme": os.environ.get('wsgi.url_scheme', 'http'),
+               "SERVER_SOFTWARE": server_software or pulsar.SERVER_SOFTWARE,
+               "SCRIPT_NAME": os.environ.get("SCRIPT_NAME", ""),
+               "CONTENT_TYPE": ''}
+    if extra:
+        environ.update(extra)
+    return environ
+
+
 def wsgi_environ(stream, parser, request_headers, address, client_address,
-                 headers, server_software=None, https=False, extra=None):
+                 headers, server_software=None, https=False, extra=None,
+                 template=None):
     '''Build the WSGI Environment dictionary
 
     :param stream: a wsgi stream object
@@ -91,7 +189,11 @@ def wsgi_environ(stream, parser, request_headers, address, client_address,
     :param address: server address
     :param client_address: client address
     :param headers: container for response headers
+    :param template: optional environ from :func:`environ_template`,
+        copied and updated with the request keys
     '''
+    if template is None:
+        template = environ_template(server_software)
     protocol = http_protocol(parser)
     raw_uri = parser.get_url()
     request_uri = urlparse(raw_uri)
@@ -104,24 +206,16 @@ def wsgi_environ(stream, parser, request_headers, address, client_address,
         host = request_uri.netloc
     else:
         host = None
-        url_scheme = 'https' if https else os.environ.get('wsgi.url_scheme',
-                                                          'http')
+        url_scheme = 'https' if https else template['wsgi.url_scheme']
     #
-    environ = {"wsgi.input": stream,
-               "wsgi.errors": sys.stderr,
-               "wsgi.file_wrapper": FileWrapper,
-               "wsgi.version": (1, 0),
-               "wsgi.run_once": False,
-               "wsgi.multithread": False,
-               "wsgi.multiprocess": False,
-               "SERVER_SOFTWARE": server_software or pulsar.SERVER_SOFTWARE,
-               "REQUEST_METHOD": native_str(parser.get_method()),
-               "QUERY_STRING": parser.get_query_string(),
-               "RAW_URI": raw_uri,
-               "SERVER_PROTOCOL": protocol,
-               "CONTENT_TYPE": ''}
+    environ = template.copy()
+    environ["wsgi.input"] = stream
+    environ["REQUEST_METHOD"] = native_str(parser.get_method())
+    environ["QUERY_STRING"] = parser.get_query_string()
+    environ["RAW_URI"] = raw_uri
+    environ["SERVER_PROTOCOL"] = protocol
     forward = client_address
-    script_name = os.environ.get("SCRIPT_NAME", "")
+    script_name = environ["SCRIPT_NAME"]
     for header, value in request_headers:
         header = header.lower()
         if header in HOP_HEADERS:
@@ -142,8 +236,7 @@ def wsgi_environ(stream, parser, request_headers, address, client_address,
         elif header == "content-length":
             environ['CONTENT_LENGTH'] = value
             continue
-        key = 'HTTP_' + header.upper().replace('-', '_')
-        environ[key] = value
+        environ[header_key(header)] = value
     environ['wsgi.url_scheme'] = url_scheme
     if url_scheme == 'https':
         environ['HTTPS'] = 'on'
@@ -159,7 +252,7 @@ def wsgi_environ(stream, parser, request_headers, address, client_address,
         remote = forward
     environ['REMOTE_ADDR'] = remote[0]
     environ['REMOTE_PORT'] = str(remote[1])
-    environ['SERVER_NAME'] = socket.getfqdn(address[0])
+    environ['SERVER_NAME'] = SERVER_NAMES.get(address[0], address[0])
     environ['SERVER_PORT'] = address[1]
     path_info = request_uri.path
     if path_info is not None:
@@ -199,9 +292,36 @@ def keep_alive_with_status(status, headers):
     return True
 
 
+def response_queue(connection):
+    '''The queue of :class:`HttpServerResponse` of ``connection``, in
+    request order
+    '''
+    queue = getattr(connection, '_http_responses', None)
+    if queue is None:
+        queue = connection._http_responses = deque()
+        connection.bind_event('connection_lost',
+                              partial(_responses_lost, queue))
+    return queue
+
+
+def _responses_lost(queue, connection, exc=None):
+    for response in tuple(queue):
+        response._connection_lost(connection, exc)
+
+
 class HttpServerResponse(ProtocolConsumer):
     '''Server side WSGI :class:`.ProtocolConsumer`.
 
+    HTTP/1.1 pipelined requests are parsed as soon as they arrive and up
+    to the ``http_pipeline`` setting are served concurrently on a
+    connection, as long as their methods are safe. A request with an
+    unsafe method waits for the requests before it, and the requests
+    after it are served once it is done.
+    Responses are written in request order: a response
+    buffers its output until the responses before it are done.
+    A response remains the connection current consumer until it is done,
+    pipelined requests are parsed by consumers it creates.
+
     .. attribute:: wsgi_callable
 
         The wsgi callable handling requests.
@@ -210,11 +330,17 @@ class HttpServerResponse(ProtocolConsumer):
     _headers_sent = None
     _body_reader = None
     _buffer = None
+    _responses = ()
+    _pipelined = None
+    _pending = None
+    _pending_size = 0
+    _waiter = None
     _logger = LOGGER
     SERVER_SOFTWARE = pulsar.SERVER_SOFTWARE
     ONE_TIME_EVENTS = ProtocolConsumer.ONE_TIME_EVENTS + ('on_headers',)
 
-    def __init__(self, wsgi_callable, cfg, server_software=None, loop=None):
+    def __init__(self, wsgi_callable, cfg, server_software=None, loop=None,
+                 environ=None):
         super().__init__(loop=loop)
         self.wsgi_callable = wsgi_callable
         self.cfg = cfg
@@ -222,6 +348,23 @@ class HttpServerResponse(ProtocolConsumer):
         self.headers = Headers()
         self.keep_alive = False
         self.SERVER_SOFTWARE = server_software or self.SERVER_SOFTWARE
+        if environ is None:
+            environ = self.environ_template(cfg, self.SERVER_SOFTWARE)
+        self.environ = environ
+        self.bind_event('post_request', self._response_done)
+
+    @classmethod
+    def environ_template(cls, cfg, server_software=None):
+        '''The :func:`environ_template` for responses served with ``cfg``
+        '''
+        multiprocess = (cfg.concurrency == 'process')
+        return environ_template(server_software or cls.SERVER_SOFTWARE,
+                                extra={'pulsar.cfg': cfg,
+                                       'wsgi.multiprocess': multiprocess})
+
+    def connection_made(self, connection):
+        self._responses = response_queue(connection)
+        self._responses.append(self)
 
     @property
     def headers_sent(self):
@@ -238,6 +381,12 @@ class HttpServerResponse(ProtocolConsumer):
         Once we have a full HTTP message, build the wsgi ``environ`` and
         delegate the response to the :func:`wsgi_callable` function.
         '''
+        if self._pipelined is not None:
+            return self._pipelined._data_received(data)
+        if (self._data_received_count == 1 and
+                self._connection._processed == 1 and
+                data.startswith(HTTP2_PREFACE) and self.cfg.get('http2')):
+            return self._upgrade_http2(data)
         parser = self.parser
         processed = parser.execute(data, len(data))
         if parser.is_headers_complete():
@@ -247,8 +396,14 @@ class HttpServerResponse(ProtocolConsumer):
                                                    parser,
                                                    self.transport,
                                                    loop=self._loop)
-                ensure_future(self._response(self.wsgi_environ()),
-                              loop=self._loop)
+                environ = self.wsgi_environ()
+                settings = self._h2c_settings(headers)
+                if settings and parser.is_message_complete():
+                    self._body_reader.feed_eof()
+                    ProtocolConsumer.write(self, SWITCHING_TO_H2C)
+                    return self._upgrade_http2(data[processed:],
+                                               (settings, environ))
+                ensure_future(self._response(environ), loop=self._loop)
             body = parser.recv_body()
             if body:
                 self._body_reader.feed_data(body)
@@ -257,12 +412,16 @@ class HttpServerResponse(ProtocolConsumer):
             #
             self._body_reader.feed_eof()
 
-            if processed < len(data):
+            if self._can_pipeline():
+                # the next request is parsed by a new queued consumer
+                if processed < len(data):
+                    return self._pipeline()._data_received(data[processed:])
+            elif processed < len(data):
                 if not self._buffer:
-                    self._buffer = data[processed:]
+                    self._buffer = [data[processed:]]
                     self.bind_event('post_request', self._new_request)
                 else:
-                    self._buffer += data[processed:]
+                    self._buffer.append(data[processed:])
         #
         elif processed < len(data):
             # This is a parsing error, the client must have sent
@@ -357,7 +516,8 @@ class HttpServerResponse(ProtocolConsumer):
         chunks = []
         if not self._headers_sent:
             tosend = self.get_headers()
-            self._headers_sent = tosend.flat(self.version, self.status)
+            self._headers_sent = tosend.flat(self.version, self.status,
+                                             self._header_block(tosend))
             self.fire_event('on_headers')
             chunks.append(self._headers_sent)
         if data:
@@ -368,7 +528,17 @@ class HttpServerResponse(ProtocolConsumer):
         elif force and self.chunked:
             chunks.extend(http_chunks(data, True))
         if chunks:
-            return write(b''.join(chunks))
+            data = b''.join(chunks)
+            if self._in_turn():
+                return write(data)
+            # a previous pipelined response is still being written
+            if self._pending is None:
+                self._pending = []
+            self._pending.append(data)
+            self._pending_size += len(data)
+            if self._pending_size > MAX_PIPELINE_BUFFER:
+                return self._turn()
+            return ()
 
     ########################################################################
     #    INTERNALS
@@ -377,10 +547,16 @@ class HttpServerResponse(ProtocolConsumer):
         response = None
         done = False
         alive = self.cfg.keep_alive or 15
+        await resolve_server_name(environ,
+                                  self.transport.get_extra_info('sockname'),
+                                  self._loop)
         while not done:
             done = True
             try:
                 if exc_info is None:
+                    if not (self._in_turn() or self._safe()):
+                        # unsafe methods wait for the previous requests
+                        await self._turn()
                     if (not environ.get('HTTP_HOST') and
                             environ['SERVER_PROTOCOL'] != 'HTTP/1.0'):
                         raise BadRequest
@@ -399,25 +575,31 @@ class HttpServerResponse(ProtocolConsumer):
                 # Do the actual writing
                 loop = self._loop
                 start = loop.time()
-                for chunk in response:
-                    if isawaitable(chunk):
-                        chunk = await wait_for(chunk, alive)
-                        start = loop.time()
-                    result = self.write(chunk)
-                    if isawaitable(result):
-                        await wait_for(result, alive)
-                        start = loop.time()
-                    else:
-                        time_in_loop = loop.time() - start
-                        if time_in_loop > MAX_TIME_IN_LOOP:
-                            self.logger.debug(
-                                'Released the event loop after %.3f seconds',
-                                time_in_loop)
-                            await sleep(0.1, loop=self._loop)
+                wrapper = self._sendfile_wrapper(response)
+                if wrapper:
+                    await self._sendfile(wrapper)
+                else:
+                    for chunk in response:
+                        if isawaitable(chunk):
+                            chunk = await wait_for(chunk, alive)
+                            start = loop.time()
+                        result = self.write(chunk)
+                        if isawaitable(result):
+                            await wait_for(result, alive)
                             start = loop.time()
+                        else:
+                            time_in_loop = loop.time() - start
+                            if time_in_loop > MAX_TIME_IN_LOOP:
+                                self.logger.debug(
+                                    'Released the event loop after %.3f '
+                                    'seconds', time_in_loop)
+                                await sleep(0.1, loop=self._loop)
+                                start = loop.time()
                 #
                 # make sure we write headers and last chunk if needed
                 self.write(b'', True)
+                if not self._in_turn():
+                    await self._turn()
 
             # client disconnected, end this connection
             except (IOError, AbortWsgi):
@@ -479,7 +661,6 @@ class HttpServerResponse(ProtocolConsumer):
         # return a the WSGI environ dictionary
         transport = self.transport
         https = True if transport.get_extra_info('sslcontext') else False
-        multiprocess = (self.cfg.concurrency == 'process')
         environ = wsgi_environ(self._body_reader,
                                self.parser,
                                self._body_reader.headers,
@@ -488,18 +669,143 @@ class HttpServerResponse(ProtocolConsumer):
                                self.headers,
                                self.SERVER_SOFTWARE,
                                https=https,
-                               extra={'pulsar.connection': self.connection,
-                                      'pulsar.cfg': self.cfg,
-                                      'wsgi.multiprocess': multiprocess})
+                               extra={'pulsar.connection': self.connection},
+                               template=self.environ)
         self.keep_alive = keep_alive(self.headers, self.parser.get_version(),
                                      environ['REQUEST_METHOD'])
-        self.headers.update([('Server', self.SERVER_SOFTWARE),
-                             ('Date', format_date_time(time.time()))])
         return environ
 
+    def _header_block(self, headers):
+        # Server, Date and Connection headers as a cached block of bytes,
+        # unless set by the application
+        server = None if 'Server' in headers else self.SERVER_SOFTWARE
+        date = None if 'Date' in headers else current_http_date()
+        connection = headers.get('Connection')
+        if connection:
+            headers.pop('Connection')
+        return header_block(server, date, connection)
+
+    def _h2c_settings(self, headers):
+        # the HTTP2-Settings of a cleartext upgrade to HTTP/2
+        if (self.cfg.get('http2') and
+                not self.transport.get_extra_info('sslcontext')):
+            upgrade = headers.get('upgrade') or ''
+            if 'h2c' in upgrade.lower():
+                return headers.get('http2-settings')
+
+    def _upgrade_http2(self, data, upgrade=None):
+        # the connection is served by an HTTP/2 consumer from now on
+        from .http2 import Http2ServerConnection
+        self._connection.upgrade(partial(Http2ServerConnection,
+                                         self.wsgi_callable,
+                                         self.cfg,
+                                         self.SERVER_SOFTWARE,
+                                         environ=self.environ,
+                                         upgrade=upgrade))
+        self.finished()
+        return data
+
+    def _sendfile_wrapper(self, response):
+        # the FileWrapper of a response which can be sent with the loop
+        # sendfile: a file with a descriptor, a known length and a plain
+        # TCP transport. Otherwise the file is written in chunks
+        wrapper = getattr(response, 'content', response)
+        transport = self.transport
+        if (isinstance(wrapper, FileWrapper) and
+                hasattr(self._loop, 'sendfile') and
+                not self.is_chunked() and
+                transport.get_extra_info('socket') is not None and
+                not transport.get_extra_info('sslcontext')):
+            try:
+                wrapper.file.fileno()
+            except (AttributeError, OSError, ValueError):
+                return None
+            return wrapper
+
+    async def _sendfile(self, wrapper):
+        # write headers, wait for previous responses and send the file
+        # from the kernel, without copying it into python bytes
+        result = self.write(b'')
+        if not self._in_turn():
+            await self._turn()
+        elif isawaitable(result):
+            await result
+        await self._loop.sendfile(self.transport, wrapper.file,
+                                  wrapper.offset, wrapper.count)
+
     def _new_request(self, _, exc=None):
         connection = self._connection
-        connection.data_received(self._buffer)
+        connection.data_received(b''.join(self._buffer))
+
+    def _can_pipeline(self):
+        return (self.keep_alive and
+                not self.upgrade and
+                len(self._responses) < self.cfg.get('http_pipeline', 1) and
+                all(response._safe() for response in self._responses))
+
+    def _safe(self):
+        return native_str(self.parser.get_method()) in SAFE_METHODS
+
+    def _pipeline(self):
+        # build the consumer of the next pipelined request, it becomes
+        # the connection current consumer once this response is done
+        connection = self._connection
+        consumer = connection._producer.build_consumer(
+            connection._consumer_factory)
+        consumer._connection = connection
+        consumer.connection_made(connection)
+        self._pipelined = consumer
+        return consumer
+
+    def _in_turn(self):
+        responses = self._responses
+        return not responses or responses[0] is self
+
+    def _turn(self):
+        # future called back once this response is first in the queue
+        if self._waiter is None:
+            self._waiter = self._loop.create_future()
+        return self._waiter
+
+    def _response_done(self, _, exc=None):
+        connection = self._connection
+        if connection and connection._current_consumer is self:
+            consumer = self._pipelined
+            while (consumer is not None and
+                   consumer.event('post_request').fired()):
+                consumer = consumer._pipelined
+            connection._current_consumer = consumer
+        responses = self._responses
+        if responses:
+            first = responses[0] is self
+            try:
+                responses.remove(self)
+            except ValueError:
+                pass
+            if first and responses:
+                responses[0]._first()
+
+    def _first(self):
+        # the responses before this one are done, write the buffered data
+        waiter, self._waiter = self._waiter, None
+        pending, self._pending = self._pending, None
+        self._pending_size = 0
+        try:
+            if pending:
+                ProtocolConsumer.write(self, b''.join(pending))
+        except Exception as exc:
+            if waiter and not waiter.done():
+                waiter.set_exception(exc)
+        else:
+            if waiter and not waiter.done():
+                waiter.set_result(None)
+
+    def _connection_lost(self, connection, exc=None):
+        waiter, self._waiter = self._waiter, None
+        if waiter and not waiter.done():
+            waiter.set_exception(ConnectionResetError('Connection lost'))
+        if connection._current_consumer is not self:
+            self.connection_lost(exc)
 
     def _write_headers(self):
         if not self._headers_sent:
@@ -684,16 +684,30 @@ class FileWrapper:
     Available directly from the ``wsgi.file_wrapper`` key in the WSGI environ
     dictionary. Alternatively one can use the :func:`~file_response`
     high level function for serving local files.
+
+    When ``offset`` or ``count`` are given, only ``count`` bytes starting
+    at ``offset`` are served. The :class:`.HttpServerResponse` sends
+    the file with ``sendfile`` rather than iterating over it, when the
+    file and the transport allow it.
     """
-    def __init__(self, file, block=None):
+    def __init__(self, file, block=None, offset=0, count=None):
         self.file = file
         self.block = max(block or ONEMB, MAX_BUFFER_SIZE)
+        self.offset = offset
+        self.count = count
 
     def __iter__(self):
-        while True:
-            data = self.file.read(self.block)
+        if self.offset:
+            self.file.seek(self.offset)
+        remaining = self.count
+        while remaining is None or remaining > 0:
+            block = self.block if remaining is None else min(self.block,
+                                                             remaining)
+            data = self.file.read(block)
             if not data:
                 break
+            if remaining is not None:
+                remaining -= len(data)
             future = create_future()
             future.set_result(data)
             yield future
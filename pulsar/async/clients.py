@@ -1,5 +1,5 @@
 import logging
-from functools import reduce
+from collections import deque
 
 from pulsar.utils.internet import is_socket_closed
 
@@ -19,11 +19,21 @@ class Pool(AsyncObject):
     '''An asynchronous pool of open connections.
 
     Open connections are either :attr:`in_use` or :attr:`available`
-    to be used. Available connection are placed in an :class:`asyncio.Queue`.
+    to be used. When the pool is exhausted, callers wait in a first-in
+    first-out queue and released connections are handed directly to the
+    oldest :attr:`waiting` caller. Available connections are reused most
+    recently released first, so that excess connections become idle.
+
+    When any of ``max_idle_time``, ``max_lifetime`` or ``keepalive`` is
+    given, available connections are checked periodically: expired and
+    closed connections are discarded, idle connections are pinged and new
+    connections opened up to ``min_size``.
 
     This class is not thread safe.
     '''
-    def __init__(self, creator, pool_size=10, loop=None, timeout=None, **kw):
+    def __init__(self, creator, pool_size=10, loop=None, timeout=None,
+                 min_size=0, max_idle_time=None, max_lifetime=None,
+                 keepalive=None, ping=None, **kw):
         '''
         Construct an asynchronous Pool.
 
@@ -35,17 +45,48 @@ class Pool(AsyncObject):
           begins with no connections; once this number of connections
           is requested, that number of connections will remain.
 
-        :param timeout: The number of seconds to wait before giving up
-          on returning a connection. Defaults to 30.
+        :param timeout: The default number of seconds to wait before
+          giving up on returning a connection. Defaults to no timeout.
+
+        :param min_size: number of connections opened when the pool
+          starts and kept open afterwards.
+
+        :param max_idle_time: seconds after which an available connection
+          is closed, as long as more than ``min_size`` are open.
+
+        :param max_lifetime: seconds after which a connection is closed
+          rather than returned to the pool.
+
+        :param keepalive: seconds of idleness after which an available
+          connection is checked with the ``ping`` coroutine function.
         '''
         self._creator = creator
         self._closed = False
         self._timeout = timeout
-        self._queue = asyncio.Queue(maxsize=pool_size, loop=loop)
+        self._pool_size = pool_size
+        self._available = deque()
+        self._waiters = deque()
         self._connecting = 0
-        self._loop = self._queue._loop
+        self._loop = loop or asyncio.get_event_loop()
         self._logger = logger
         self._in_use_connections = set()
+        self._pinging = set()
+        self._created = {}
+        self._released = {}
+        self.min_size = min(min_size or 0, pool_size)
+        self.max_idle_time = max_idle_time
+        self.max_lifetime = max_lifetime
+        self.keepalive = keepalive
+        self._ping = ping
+        self._metrics = dict(checkouts=0, creations=0, discards=0,
+                             timeouts=0, wait_time=0.0, max_wait_time=0.0,
+                             max_waiting=0)
+        intervals = [t for t in (max_idle_time, max_lifetime, keepalive) if t]
+        self._check_interval = min(intervals) if intervals else None
+        self._check_handle = None
+        self._check_task = None
+        if self.min_size or self._check_interval:
+            self._check_handle = self._loop.call_soon(self._run_check)
 
     @property
     def pool_size(self):
@@ -55,7 +96,7 @@ class Pool(AsyncObject):
         is queued and a connection returned as soon as one becomes
         available.
         '''
-        return self._queue._maxsize
+        return self._pool_size
 
     @property
     def in_use(self):
@@ -70,7 +111,13 @@ class Pool(AsyncObject):
     def available(self):
         '''Number of available connections in the pool.
         '''
-        return reduce(self._count_connections, self._queue._queue, 0)
+        return len(self._available)
+
+    @property
+    def waiting(self):
+        '''Number of callers waiting for a connection.
+        '''
+        return len(self._waiters)
 
     @property
     def closed(self):
@@ -80,19 +127,29 @@ class Pool(AsyncObject):
 
     def __contains__(self, connection):
         if connection not in self._in_use_connections:
-            return connection in self._queue._queue
+            return connection in self._available
         return True
 
-    async def connect(self):
+    async def connect(self, timeout=None):
         '''Get a connection from the pool.
 
         The connection is either a new one or retrieved from the
         :attr:`available` connections in the pool.
 
+        :param timeout: optional number of seconds to wait for a
+            connection, it overrides the pool ``timeout``.
         :return: a :class:`~asyncio.Future` resulting in the connection.
         '''
         assert not self.closed
-        connection = await self._get()
+        start = self._loop.time()
+        if timeout is None:
+            timeout = self._timeout
+        connection = await self._get(start + timeout if timeout else None)
+        wait = self._loop.time() - start
+        metrics = self._metrics
+        metrics['checkouts'] += 1
+        metrics['wait_time'] += wait
+        metrics['max_wait_time'] = max(metrics['max_wait_time'], wait)
         return PoolConnection(self, connection)
 
     def close(self):
@@ -102,56 +159,153 @@ class Pool(AsyncObject):
         have closed
         '''
         if not self.closed:
-            waiters = []
-            queue = self._queue
-            while queue.qsize():
-                connection = queue.get_nowait()
-                if connection:
-                    waiters.append(connection.close())
-            in_use = self._in_use_connections
+            if self._check_handle:
+                self._check_handle.cancel()
+            if self._check_task:
+                self._check_task.cancel()
+            while self._waiters:
+                self._waiters.popleft().cancel()
+            waiters = [c.close() for c in self._available]
+            self._available.clear()
+            in_use = self._in_use_connections | self._pinging
             self._in_use_connections = set()
+            self._pinging = set()
             for connection in in_use:
                 if connection:
                     waiters.append(connection.close())
+            self._created.clear()
+            self._released.clear()
             self._closed = asyncio.gather(*waiters, loop=self._loop)
         return self._closed
 
-    async def _get(self):
-        queue = self._queue
-        # grab the connection without waiting, important!
-        if queue.qsize():
-            connection = queue.get_nowait()
-        # wait for one to be available
-        elif self.in_use + self._connecting >= queue._maxsize:
-            connection = await asyncio.wait_for(queue.get(), self._timeout,
-                                                loop=self._loop)
-        else:   # must create a new connection
-            self._connecting += 1
-            try:
-                connection = await self._creator()
-            finally:
-                self._connecting -= 1
-        # None signal that a connection was removed form the queue
-        # Go again
-        if connection is None:
-            connection = await self._get()
-        else:
-            if self.is_connection_closed(connection):
-                connection = await self._get()
+    def metrics(self):
+        '''Dictionary of pool metrics.
+
+        Counters of ``checkouts``, connection ``creations`` and
+        ``discards``, total, average and maximum time waited for a
+        connection in seconds, and the current state of the pool.
+        '''
+        metrics = self._metrics.copy()
+        checkouts = metrics['checkouts']
+        metrics['average_wait_time'] = (metrics['wait_time']/checkouts
+                                        if checkouts else 0.0)
+        metrics.update(pool_size=self.pool_size,
+                       min_size=self.min_size,
+                       in_use=self.in_use,
+                       available=self.available,
+                       waiting=self.waiting,
+                       connecting=self._connecting)
+        return metrics
+
+    async def check(self):
+        '''Check available connections.
+
+        Discard closed and expired connections, ping connections idle
+        for more than :attr:`keepalive` seconds and open connections
+        up to :attr:`min_size`.
+        '''
+        now = self._loop.time()
+        open_connections = self._open_connections()
+        pings = []
+        for connection in list(self._available):
+            idle = now - self._released.get(connection, now)
+            if (self.is_connection_closed(connection) or
+                    self._expired(connection, now)):
+                self._remove(connection)
+                open_connections -= 1
+            elif (self.max_idle_time and idle > self.max_idle_time and
+                    open_connections > self.min_size):
+                self._remove(connection)
+                open_connections -= 1
+            elif self.keepalive and self._ping and idle >= self.keepalive:
+                self._available.remove(connection)
+                pings.append(self._keepalive(connection))
+        if pings:
+            await asyncio.gather(*pings, loop=self._loop)
+        await self._prewarm()
+
+    async def _get(self, deadline):
+        while True:
+            if self._available:
+                connection = self._available.pop()
+            elif self._open_connections() < self._pool_size:
+                connection = await self._create()
+            else:
+                connection = await self._wait(deadline)
+                if connection is None:
+                    # a connection slot was reserved for this waiter
+                    connection = await self._create(True)
+            if (self.is_connection_closed(connection) or
+                    self._expired(connection, self._loop.time())):
+                self._discard(connection)
             else:
                 self._in_use_connections.add(connection)
-        return connection
+                return connection
+
+    async def _wait(self, deadline):
+        waiter = self._loop.create_future()
+        self._waiters.append(waiter)
+        metrics = self._metrics
+        metrics['max_waiting'] = max(metrics['max_waiting'],
+                                     len(self._waiters))
+        handle = None
+        if deadline is not None:
+            handle = self._loop.call_later(max(deadline - self._loop.time(),
+                                               0),
+                                           self._timeout_waiter, waiter)
+        try:
+            return await waiter
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif (waiter.done() and not waiter.cancelled() and
+                    not waiter.exception()):
+                # cancelled after a connection or slot was handed over
+                connection = waiter.result()
+                if connection is None:
+                    # release the slot reserved for this waiter
+                    self._connecting -= 1
+                self._handover(connection)
+            raise
+        finally:
+            if handle:
+                handle.cancel()
+
+    def _timeout_waiter(self, waiter):
+        if not waiter.done():
+            self._metrics['timeouts'] += 1
+            waiter.set_exception(asyncio.TimeoutError())
+
+    def _handover(self, connection):
+        '''Hand a released ``connection`` to the oldest waiter.
+
+        When ``connection`` is ``None`` a connection slot has been freed
+        and the waiter is in charge of opening a new connection.
+        '''
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                if connection is None:
+                    self._connecting += 1
+                waiter.set_result(connection)
+                return
+        if connection is None or self.closed:
+            return
+        else:
+            self._released[connection] = self._loop.time()
+            self._available.append(connection)
 
     def _put(self, conn, discard=False):
-        if not self.closed:
-            try:
-                # None signal that a connection was removed form the queue
-                self._queue.put_nowait(None if discard else conn)
-            except asyncio.QueueFull:
-                # The queue of available connection is already full
-                if conn:
-                    conn.close()
         self._in_use_connections.discard(conn)
+        if conn and not discard and self._expired(conn, self._loop.time()):
+            # recycle the connection
+            conn.close()
+            discard = True
+        if discard:
+            self._forget(conn)
+            self._handover(None)
+        else:
+            self._handover(conn)
 
     def is_connection_closed(self, connection):
         is_closing = getattr(connection.transport, 'is_closing', None)
@@ -171,10 +325,94 @@ class Pool(AsyncObject):
     def status(self, message=None, level=None):
         return ('Pool size: %d  Connections in pool: %d '
                 'Current Checked out connections: %d' %
-                (self._queue._maxsize, self.available, self.in_use))
+                (self._pool_size, self.available, self.in_use))
+
+    async def _create(self, reserved=False):
+        if not reserved:
+            self._connecting += 1
+        try:
+            connection = await self._creator()
+        except Exception:
+            self._connecting -= 1
+            # let the next waiter try
+            self._handover(None)
+            raise
+        self._connecting -= 1
+        self._created[connection] = self._loop.time()
+        self._metrics['creations'] += 1
+        return connection
+
+    def _open_connections(self):
+        return (self.in_use + self.available + self._connecting +
+                len(self._pinging))
+
+    def _expired(self, connection, now):
+        created = self._created.get(connection)
+        return bool(self.max_lifetime and created is not None and
+                    now - created > self.max_lifetime)
+
+    def _forget(self, connection):
+        self._created.pop(connection, None)
+        self._released.pop(connection, None)
+        self._metrics['discards'] += 1
+
+    def _discard(self, connection):
+        self._forget(connection)
+        connection.close()
+        self._handover(None)
 
-    def _count_connections(self, x, y):
-        return x + int(y is not None)
+    def _remove(self, connection):
+        '''Remove an available ``connection`` from the pool and close it'''
+        self._available.remove(connection)
+        self._discard(connection)
+
+    async def _keepalive(self, connection):
+        self._pinging.add(connection)
+        try:
+            await self._ping(connection)
+        except Exception as exc:
+            self._logger.warning('Discard connection after failed ping: %s',
+                                 exc)
+            self._discard(connection)
+            return
+        finally:
+            self._pinging.discard(connection)
+        if self.closed:
+            connection.close()
+        else:
+            self._put(connection)
+
+    async def _prewarm(self):
+        missing = self.min_size - self._open_connections()
+        if missing > 0:
+            connections = await asyncio.gather(
+                *[self._create() for _ in range(missing)],
+                loop=self._loop, return_exceptions=True)
+            for connection in connections:
+                if isinstance(connection, Exception):
+                    self._logger.warning('Could not pre-warm connection: %s',
+                                         connection)
+                elif self.closed:
+                    connection.close()
+                else:
+                    self._put(connection)
+
+    def _run_check(self):
+        self._check_handle = None
+        self._check_task = asyncio.ensure_future(self._check(),
+                                                 loop=self._loop)
+
+    async def _check(self):
+        try:
+            await self.check()
+        except Exception:
+            self._logger.exception('Unhandled exception while checking %s',
+                                   self)
+        finally:
+            self._check_task = None
+            if self._check_interval and not self.closed:
+                self._check_handle = self._loop.call_later(
+                    self._check_interval, self._run_check)
 
 
 class PoolConnection:
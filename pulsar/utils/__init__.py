@@ -70,6 +70,12 @@ Slugify
 .. automodule:: pulsar.utils.slugify
 
 
+Serializers
+==================
+
+.. automodule:: pulsar.utils.serializers
+
+
 Logging
 ==================
 
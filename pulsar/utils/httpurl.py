@@ -41,6 +41,7 @@ HTTP Parser
 import os
 import sys
 import re
+import time
 import string
 import mimetypes
 from hashlib import sha1, md5
@@ -48,7 +49,7 @@ from uuid import uuid4
 from email.utils import formatdate
 from io import BytesIO
 import zlib
-from collections import deque, OrderedDict
+from collections import OrderedDict
 from urllib import request as urllibr
 from http import client as httpclient
 from urllib.parse import quote, urlsplit, splitport
@@ -669,10 +670,32 @@ class Headers:
             else:
                 return self._headers.pop(key, None)
 
-    def flat(self, version, status):
-        '''Full headers bytes representation'''
-        vs = version + (status, self)
-        return ('HTTP/%s.%s %s\r\n%s' % vs).encode(DEFAULT_CHARSET)
+    def flat(self, version, status, block=None, ordered=False):
+        '''Full headers bytes representation.
+
+        Headers are serialised in insertion order unless ``ordered`` is
+        ``True``, in which case they are grouped as :meth:`__str__` does.
+
+        :param block: optional pre-encoded header lines, each terminated
+            by ``\r\n``, added after the headers in this container
+        '''
+        lines = ['HTTP/%s.%s %s' % (version + (status,))]
+        if ordered:
+            # drop the last empty line which closes the headers
+            lines.extend(list(self._ordered())[:-1])
+        else:
+            joiners = HEADER_FIELDS_JOINER
+            for k, values in self._headers.items():
+                joiner = joiners.get(k, ', ')
+                if joiner:
+                    lines.append(k + ': ' + joiner.join(values))
+                else:
+                    lines.extend([k + ': ' + value for value in values])
+            lines.append('')
+        data = '\r\n'.join(lines).encode(DEFAULT_CHARSET)
+        if block:
+            data += block
+        return data + b'\r\n'
 
     def __iter__(self):
         dj = ', '
@@ -717,6 +740,9 @@ METHOD_RE = re.compile("[A-Z0-9$-_.]{3,20}")
 VERSION_RE = re.compile("HTTP/(\d+).(\d+)")
 STATUS_RE = re.compile("(\d{3})\s*(\w*)")
 HEADER_RE = re.compile("[\x00-\x1F\x7F()<>@,;:\[\]={} \t\\\\\"]")
+# Header names as received mapped to their validated camel case field
+HEADER_NAMES = {}
+MAX_HEADER_NAMES = 1000
 
 # errors
 BAD_FIRST_LINE = 0
@@ -739,6 +765,11 @@ class InvalidChunkSize(Exception):
 class HttpParser:
     '''A python HTTP parser.
 
+    Data is accumulated in a ``bytearray`` scanned from offsets, so that
+    headers arriving in many small pieces are not joined again at every
+    call. The header block is split in one pass once its terminator is
+    found and chunked bodies are decoded in place.
+
     Original code from https://github.com/benoitc/http-parser
 
     2011 (c) Benoit Chesneau <benoitc@e-engura.org>
@@ -749,7 +780,8 @@ class HttpParser:
         self.errno = None
         self.errstr = ""
         # protected variables
-        self._buf = []
+        self._buf = bytearray()
+        self._scanned = 0
         self._version = None
         self._method = method
         self._status_code = None
@@ -762,6 +794,7 @@ class HttpParser:
         self._fragment = None
         self._headers = OrderedDict()
         self._chunked = False
+        self._chunk_rest = 0
         self._body = []
         self._trailers = None
         self._partial_body = False
@@ -832,63 +865,55 @@ class HttpParser:
         return self._chunked
 
     def execute(self, data, length):
+        '''Parse ``length`` bytes of ``data``.
+
+        Return the number of bytes consumed, which is less than ``length``
+        when an error occurs or when the message is complete before the
+        end of ``data``, the remaining bytes belonging to the next message.
+        '''
         # end of body can be passed manually by putting a length of 0
         if length == 0:
             self.__on_message_complete = True
             return length
+        elif self.__on_message_complete:
+            return 0
+        elif self.__on_headers_complete:
+            return self._execute_body(data, length)
         #
-        data = bytes(data)
-        # start to parse
-        nb_parsed = 0
-        while True:
-            if not self.__on_firstline:
-                idx = data.find(b'\r\n')
-                if idx < 0:
-                    self._buf.append(data)
-                    return len(data)
-                else:
-                    self.__on_firstline = True
-                    self._buf.append(data[:idx])
-                    first_line = to_string(b''.join(self._buf),
-                                           DEFAULT_CHARSET)
-                    rest = data[idx+2:]
-                    data = b''
-                    if self._parse_firstline(first_line):
-                        nb_parsed = nb_parsed + idx + 2
-                        self._buf = [rest]
-                    else:
-                        return nb_parsed
-            elif not self.__on_headers_complete:
-                if data:
-                    self._buf.append(data)
-                    data = b''
-                try:
-                    to_parse = b''.join(self._buf)
-                    ret = self._parse_headers(to_parse)
-                    if ret is False:
-                        return length
-                    nb_parsed = nb_parsed + (len(to_parse) - ret)
-                except InvalidHeader as e:
-                    self.errno = INVALID_HEADER
-                    self.errstr = str(e)
-                    return nb_parsed
-            elif not self.__on_message_complete:
-                self.__on_message_begin = True
-                if data:
-                    self._buf.append(data)
-                    data = b''
-                ret = self._parse_body()
-                if ret is None:
-                    return length
-                elif ret < 0:
-                    return ret
-                elif ret == 0:
-                    self.__on_message_complete = True
-                    return length
-                else:
-                    nb_parsed = max(length, ret)
-            else:
+        buf = self._buf
+        offset = len(buf)
+        buf.extend(data)
+        if not self.__on_firstline:
+            idx = buf.find(b'\r\n', max(offset - 1, 0))
+            if idx < 0:
+                return length
+            self.__on_firstline = True
+            first_line = buf[:idx].decode(DEFAULT_CHARSET)
+            if not self._parse_firstline(first_line):
                 return 0
+            # the CRLF of the first line starts the headers terminator
+            # when there are no headers
+            self._scanned = idx
+        #
+        start = self._scanned
+        idx = buf.find(b'\r\n\r\n', start)
+        if idx < 0:
+            self._scanned = max(len(buf) - 3, start)
+            return length
+        try:
+            self._parse_headers(buf[buf.find(b'\r\n')+2:idx+2],
+                                self._headers)
+        except InvalidHeader as e:
+            self.errno = INVALID_HEADER
+            self.errstr = str(e)
+            return 0
+        self._on_headers()
+        consumed = idx + 4 - offset
+        buf.clear()
+        if self.__on_message_complete or consumed == length:
+            return consumed
+        parsed = self._execute_body(data[consumed:], length - consumed)
+        return parsed if parsed < 0 else consumed + parsed
 
     def _parse_firstline(self, line):
         try:
@@ -947,48 +972,51 @@ class HttpParser:
             raise InvalidRequestLine("Invalid HTTP version: %s" % bits[2])
         self._version = (int(match.group(1)), int(match.group(2)))
 
-    def _parse_headers(self, data):
-        if data == b'\r\n':
-            self.__on_headers_complete = True
-            self._buf = []
-            return 0
-        idx = data.find(b'\r\n\r\n')
-        if idx < 0:  # we don't have all headers
-            return False
-        chunk = to_string(data[:idx], DEFAULT_CHARSET)
-        # Split lines on \r\n keeping the \r\n on each line
-        lines = deque(('%s\r\n' % line for line in chunk.split('\r\n')))
-        # Parse headers into key/value pairs paying attention
-        # to continuation lines.
-        while len(lines):
-            # Parse initial header name : value pair.
-            curr = lines.popleft()
-            if curr.find(":") < 0:
+    def _parse_headers(self, data, headers):
+        '''Parse a block of header lines, each terminated by CRLF,
+        into the ``headers`` dictionary of lists
+        '''
+        names = HEADER_NAMES
+        values = None
+        for line in data.decode(DEFAULT_CHARSET).split('\r\n'):
+            if line.startswith((' ', '\t')):
+                # obsolete line folding, the value continues
+                if values:
+                    values[-1] = ('%s %s' % (values[-1], line.strip())).strip()
                 continue
-            name, value = curr.split(":", 1)
-            name = name.rstrip(" \t").upper()
-            if HEADER_RE.search(name):
-                raise InvalidHeader("invalid header name %s" % name)
-            name, value = header_field(name.strip()), [value.lstrip()]
-            # Consume value continuation lines
-            while len(lines) and lines[0].startswith((" ", "\t")):
-                value.append(lines.popleft())
-            value = ''.join(value).rstrip()
-            if name in self._headers:
-                self._headers[name].append(value)
-            else:
-                self._headers[name] = [value]
+            name, sep, value = line.partition(':')
+            if not sep:
+                values = None
+                continue
+            field = names.get(name)
+            if field is None:
+                field = name.rstrip(' \t')
+                if HEADER_RE.search(field):
+                    raise InvalidHeader("invalid header name %s" % field)
+                field = header_field(field)
+                if len(names) < MAX_HEADER_NAMES:
+                    names[name] = field
+            values = headers.get(field)
+            if values is None:
+                values = headers[field] = []
+            values.append(value.strip())
+        return headers
+
+    def _on_headers(self):
+        headers = self._headers
         # detect now if body is sent by chunks.
-        clen = self._headers.get('Content-Length')
-        if 'Transfer-Encoding' in self._headers:
-            te = self._headers['Transfer-Encoding'][0].lower()
+        clen = headers.get('Content-Length')
+        te = headers.get('Transfer-Encoding')
+        if te:
+            te = te[-1].rsplit(',', 1)[-1].strip().lower()
             self._chunked = (te == 'chunked')
-        else:
-            self._chunked = False
         #
         status = self._status_code
         if status and has_empty_content(status, self._method):
+            self._chunked = False
             clen = 0
+        elif self._chunked:
+            clen = None
         elif clen is not None:
             try:
                 clen = int(clen[0])
@@ -997,6 +1025,9 @@ class HttpParser:
             else:
                 if clen < 0:  # ignore nonsensical negative lengths
                     clen = None
+        if clen is None and not status and not self._chunked:
+            # requests without a length have no body
+            clen = 0
         #
         if clen is None:
             self._clen_rest = sys.maxsize
@@ -1004,82 +1035,102 @@ class HttpParser:
             self._clen_rest = self._clen = clen
         #
         # detect encoding and set decompress object
-        if self.decompress and 'Content-Encoding' in self._headers:
-            encoding = self._headers['Content-Encoding'][0]
+        if self.decompress and 'Content-Encoding' in headers:
+            encoding = headers['Content-Encoding'][0]
             if encoding == "gzip":
                 self.__decompress_obj = zlib.decompressobj(16+zlib.MAX_WBITS)
                 self.__decompress_first_try = False
             elif encoding == "deflate":
                 self.__decompress_obj = zlib.decompressobj()
 
-        rest = data[idx+4:]
-        self._buf = [rest]
         self.__on_headers_complete = True
         self.__on_message_begin = True
-        return len(rest)
+        if self._clen_rest == 0:
+            self.__on_message_complete = True
 
-    def _parse_body(self):
-        data = b''.join(self._buf)
-        #
-        if not self._chunked:
-            #
-            if not data and self._clen is None:
-                if not self._status:    # message complete only for servers
-                    self.__on_message_complete = True
+    def _execute_body(self, data, length):
+        if self._chunked:
+            return self._parse_chunks(data, length)
+        rest = self._clen_rest
+        if length >= rest:
+            data = data[:rest]
+            length = rest
+            self.__on_message_complete = True
+        self._clen_rest = rest - length
+        self._add_body(bytes(data))
+        return length
+
+    def _add_body(self, data):
+        data = self._decompress(data)
+        self._partial_body = True
+        if data:
+            self._body.append(data)
+
+    def _parse_chunks(self, data, length):
+        # only incomplete chunk lines and trailers are buffered, chunk data
+        # is sliced from data
+        buf = self._buf
+        if buf:
+            buf.extend(data)
+            data = buf
+        size = len(data)
+        pos = 0
+        rest = self._chunk_rest
+        while pos < size:
+            if rest > 2:
+                # chunk data followed by CRLF
+                end = pos + rest - 2
+                if end > size:
+                    end = size
+                self._add_body(bytes(data[pos:end]))
+                rest -= end - pos
+                pos = end
+            elif rest > 0:
+                # CRLF after chunk data
+                if size - pos < rest:
+                    break
+                pos += rest
+                rest = 0
+            elif rest < 0:
+                # trailers after the last chunk
+                if data[pos:pos+2] == b'\r\n':
+                    idx = pos - 2
+                else:
+                    idx = data.find(b'\r\n\r\n', pos)
+                    if idx < 0:
+                        break
+                    try:
+                        self._trailers = self._parse_headers(
+                            data[pos:idx+2], OrderedDict())
+                    except InvalidHeader as e:
+                        self.errno = INVALID_HEADER
+                        self.errstr = str(e)
+                        return -1
+                pos = idx + 4
+                self.__on_message_complete = True
+                buf.clear()
+                return length - size + pos
             else:
-                if self._clen_rest is not None:
-                    self._clen_rest -= len(data)
-
-                # maybe decompress
-                data = self._decompress(data)
-
-                self._partial_body = True
-                if data:
-                    self._body.append(data)
-                self._buf = []
-                if self._clen_rest <= 0:
-                    self.__on_message_complete = True
-            return
+                idx = data.find(b'\r\n', pos)
+                if idx < 0:
+                    break
+                chunk_size = data[pos:idx].split(b';', 1)[0].strip()
+                try:
+                    rest = int(chunk_size, 16)
+                except ValueError:
+                    rest = -1
+                if rest < 0:
+                    self.errno = INVALID_CHUNK
+                    self.errstr = "invalid chunk size [%s]" % chunk_size
+                    return -1
+                pos = idx + 2
+                rest = rest + 2 if rest else -1
+        self._chunk_rest = rest
+        if data is buf:
+            del buf[:pos]
         else:
-            try:
-                size, rest = self._parse_chunk_size(data)
-            except InvalidChunkSize as e:
-                self.errno = INVALID_CHUNK
-                self.errstr = "invalid chunk size [%s]" % str(e)
-                return -1
-            if size == 0:
-                return size
-            if size is None or len(rest) < size + 2:
-                return None
-            body_part, rest = rest[:size], rest[size:]
-
-            # maybe decompress
-            body_part = self._decompress(body_part)
-            self._partial_body = True
-            self._body.append(body_part)
-            rest = rest[2:]
-            self._buf = [rest] if rest else []
-            return len(rest) + 2
-
-    def _parse_chunk_size(self, data):
-        idx = data.find(b'\r\n')
-        if idx < 0:
-            return None, None
-        line, rest_chunk = data[:idx], data[idx+2:]
-        chunk_size = line.split(b';', 1)[0].strip()
-        try:
-            chunk_size = int(chunk_size, 16)
-        except ValueError:
-            raise InvalidChunkSize(chunk_size)
-        if chunk_size == 0:
-            self._parse_trailers(rest_chunk)
-            return 0, None
-        return chunk_size, rest_chunk
-
-    def _parse_trailers(self, data):
-        idx = data.find(b'\r\n\r\n')
-        if data[:2] == b'\r\n':
-            self._trailers = self._parse_headers(data[:idx])
+            buf.extend(data[pos:])
+        return length
 
     def _decompress(self, data):
         deco = self.__decompress_obj
@@ -1210,6 +1261,19 @@ def http_date(epoch_seconds=None):
     return formatdate(epoch_seconds, usegmt=True)
 
 
+_CURRENT_DATE = [None, None]
+
+
+def current_http_date():
+    '''The :func:`http_date` of the current time, formatted at most once
+    per second.
+    '''
+    now = int(time.time())
+    if _CURRENT_DATE[0] != now:
+        _CURRENT_DATE[:] = now, http_date(now)
+    return _CURRENT_DATE[1]
+
+
 # ################################################################# COOKIES
 def create_cookie(name, value, **kwargs):
     """Make a cookie from underspecified parameters.
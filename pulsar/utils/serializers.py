@@ -0,0 +1,139 @@
+'''A registry of serializers for message payloads.
+
+Serializers are registered by name and looked up with
+:func:`get_serializer` which falls back to the standard library
+:mod:`json` when the requested serializer is not available.
+
+Messages encoded with :func:`dumps` carry a content tag with the name of
+the serializer, unless the serializer is ``json``, so that :func:`loads`
+decodes messages from peers using different serializers. Since payloads
+may come from the network, only register serializers which cannot
+execute code when loading, never :mod:`pickle`.
+
+.. autofunction:: register_serializer
+
+.. autofunction:: get_serializer
+
+.. autofunction:: dumps
+
+.. autofunction:: loads
+
+'''
+import json
+
+try:
+    import orjson
+except ImportError:     # pragma    nocover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:     # pragma    nocover
+    msgpack = None
+
+
+# content tags are enclosed by this byte, which never starts a json text
+TAG = b'\x00'
+DEFAULT_SERIALIZER = 'json'
+
+serializers = {}
+
+
+class Serializer:
+    '''Base class for serializers'''
+    name = None
+
+    def dumps(self, obj):
+        '''Serialize ``obj`` into bytes'''
+        raise NotImplementedError
+
+    def loads(self, data):
+        '''Deserialize bytes ``data``'''
+        raise NotImplementedError
+
+
+class Json(Serializer):
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj).encode('utf-8')
+
+    def loads(self, data):
+        if not isinstance(data, str):
+            data = bytes(data).decode('utf-8')
+        return json.loads(data)
+
+
+class OrJson(Serializer):
+    name = 'orjson'
+
+    def dumps(self, obj):
+        return orjson.dumps(obj)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class MsgPack(Serializer):
+    name = 'msgpack'
+
+    def dumps(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+def register_serializer(serializer):
+    '''Register a :class:`Serializer` class or instance by its name'''
+    if isinstance(serializer, type):
+        serializer = serializer()
+    serializers[serializer.name] = serializer
+    return serializer
+
+
+def get_serializer(name=None):
+    '''The serializer registered as ``name``.
+
+    :param name: a serializer name, a :class:`Serializer` or ``None`` for
+        the default serializer.
+    :return: the serializer or the ``json`` serializer if ``name`` is not
+        registered.
+    '''
+    if isinstance(name, Serializer):
+        return name
+    return (serializers.get(name or DEFAULT_SERIALIZER) or
+            serializers[DEFAULT_SERIALIZER])
+
+
+def dumps(obj, serializer=None):
+    '''Encode ``obj`` with ``serializer`` and prepend its content tag'''
+    serializer = get_serializer(serializer)
+    data = serializer.dumps(obj)
+    if serializer.name == DEFAULT_SERIALIZER:
+        return data
+    return b''.join((TAG, serializer.name.encode('utf-8'), TAG, data))
+
+
+def loads(data):
+    '''Decode ``data`` encoded by :func:`dumps`.
+
+    Data without a content tag is decoded as ``json``.
+    '''
+    if data[:1] == TAG:
+        end = data.find(TAG, 1)
+        if end < 0:
+            raise ValueError('Invalid content tag')
+        name = bytes(data[1:end]).decode('utf-8')
+        serializer = serializers.get(name)
+        if serializer is None:
+            raise ValueError('Unknown content tag "%s"' % name)
+        return serializer.loads(data[end+1:])
+    return serializers[DEFAULT_SERIALIZER].loads(data)
+
+
+register_serializer(Json)
+if orjson:   # pragma    nocover
+    register_serializer(OrJson)
+if msgpack:  # pragma    nocover
+    register_serializer(MsgPack)
@@ -45,11 +45,28 @@ Zset
 .. autoclass:: Zset
    :members:
    :member-order: bysource
+
+
+.. module:: pulsar.utils.structures.stream
+
+Stream
+~~~~~~~~~~~~~~~
+.. autoclass:: Stream
+   :members:
+   :member-order: bysource
+
+
+StreamGroup
+~~~~~~~~~~~~~~~
+.. autoclass:: StreamGroup
+   :members:
+   :member-order: bysource
 '''
 from collections import *       # noqa
 
 from .skiplist import Skiplist  # noqa
 from .zset import Zset          # noqa
+from .stream import Stream, StreamGroup     # noqa
 from .misc import (MultiValueDict, AttributeDictionary, FrozenDict,  # noqa
                    Dict, Deque, merge_prefix, recursive_update,  # noqa
                    mapping_iterator, inverse_mapping, aslist)    # noqa
@@ -0,0 +1,352 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+
+MIN_ID = (0, 0)
+MAX_ID = (2**64 - 1, 2**64 - 1)
+
+
+class Stream:
+    '''Append-only log equivalent of a redis stream.
+
+    Entries are ``(id, fields)`` pairs where ``id`` is a ``(ms, seq)`` tuple
+    and ``fields`` a flat tuple of field/value pairs. Entries are stored in
+    chunks of at most :attr:`chunk_size` elements, each chunk holding a
+    list of ids and a list of fields. The first id of each chunk is
+    kept in a separate list so that ranges are located by bisection.
+    '''
+    __slots__ = ('_chunks', '_firsts', '_size', 'last_id', 'groups')
+    chunk_size = 128
+
+    def __init__(self, data=None):
+        self._chunks = []
+        self._firsts = []
+        self._size = 0
+        self.last_id = MIN_ID
+        self.groups = {}
+        if data:
+            self.extend(data)
+
+    def __repr__(self):
+        return 'Stream(%d)' % self._size
+    __str__ = __repr__
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        # a stream exists, with its consumer groups, even when empty
+        return True
+
+    def __iter__(self):
+        for ids, fields in self._chunks:
+            yield from zip(ids, fields)
+
+    def __getstate__(self):
+        return (list(self), self.last_id, self.groups)
+
+    def __setstate__(self, state):
+        data, last_id, groups = state
+        self.__init__(data)
+        self.last_id = last_id
+        self.groups = groups
+
+    @property
+    def first_id(self):
+        '''The id of the first entry or ``None`` if the stream is empty'''
+        return self._firsts[0] if self._firsts else None
+
+    def next_id(self, ms):
+        '''The next id for an entry added at ``ms`` milliseconds
+        '''
+        last_ms, seq = self.last_id
+        if ms > last_ms:
+            return (ms, 0)
+        return (last_ms, seq + 1)
+
+    def add(self, id, fields):
+        '''Append a new entry at the end of this :class:`Stream`.
+
+        ``id`` must be greater than :attr:`last_id`, otherwise a
+        ``ValueError`` is raised.
+        '''
+        if id <= self.last_id:
+            raise ValueError('id must be greater than the last id')
+        chunks = self._chunks
+        if not chunks or len(chunks[-1][0]) >= self.chunk_size:
+            chunks.append(([], []))
+            self._firsts.append(id)
+        ids, values = chunks[-1]
+        ids.append(id)
+        values.append(tuple(fields))
+        self.last_id = id
+        self._size += 1
+        return id
+
+    def extend(self, iterable):
+        '''Extend this :class:`Stream` with an iterable over
+        ``id``, ``fields`` pairs.
+        '''
+        add = self.add
+        for id, fields in iterable:
+            add(id, fields)
+
+    def get(self, id):
+        '''Fields of the entry with ``id`` or ``None``'''
+        i = bisect_right(self._firsts, id) - 1
+        if i >= 0:
+            ids, values = self._chunks[i]
+            j = bisect_left(ids, id)
+            if j < len(ids) and ids[j] == id:
+                return values[j]
+
+    def range(self, start=MIN_ID, end=MAX_ID, count=None, reverse=False):
+        '''Entries with ids between ``start`` and ``end``, both included.
+
+        When ``reverse`` is ``True`` entries are returned from ``end``
+        backward to ``start``.
+        '''
+        if reverse:
+            entries = self._backward(end, start)
+        else:
+            entries = self._forward(start, end)
+        if count is not None and count >= 0:
+            result = []
+            for entry in entries:
+                if len(result) >= count:
+                    break
+                result.append(entry)
+            return result
+        return list(entries)
+
+    def after(self, id, count=None):
+        '''Entries with ids strictly greater than ``id``'''
+        if id >= self.last_id:
+            return []
+        ms, seq = id
+        start = (ms + 1, 0) if seq >= MAX_ID[1] else (ms, seq + 1)
+        return self.range(start, MAX_ID, count)
+
+    def remove(self, ids):
+        '''Remove entries with the given ``ids``.
+
+        Return the number of entries removed.
+        '''
+        removed = 0
+        firsts = self._firsts
+        chunks = self._chunks
+        for id in ids:
+            i = bisect_right(firsts, id) - 1
+            if i < 0:
+                continue
+            cids, values = chunks[i]
+            j = bisect_left(cids, id)
+            if j < len(cids) and cids[j] == id:
+                del cids[j]
+                del values[j]
+                removed += 1
+                if cids:
+                    firsts[i] = cids[0]
+                else:
+                    del chunks[i]
+                    del firsts[i]
+        self._size -= removed
+        return removed
+
+    def trim(self, maxlen, approximate=False):
+        '''Trim this :class:`Stream` to at most ``maxlen`` entries.
+
+        When ``approximate`` is ``True`` only whole chunks are evicted
+        and the stream may be left with slightly more than ``maxlen``
+        entries. Return the number of entries removed.
+        '''
+        maxlen = max(maxlen, 0)
+        chunks = self._chunks
+        removed = 0
+        while chunks and self._size - len(chunks[0][0]) >= maxlen:
+            n = len(chunks.pop(0)[0])
+            self._firsts.pop(0)
+            self._size -= n
+            removed += n
+        if not approximate and self._size > maxlen:
+            n = self._size - maxlen
+            ids, values = chunks[0]
+            del ids[:n]
+            del values[:n]
+            self._firsts[0] = ids[0]
+            self._size -= n
+            removed += n
+        return removed
+
+    #    INTERNALS
+    def _forward(self, start, end):
+        chunks = self._chunks
+        i = max(bisect_right(self._firsts, start) - 1, 0)
+        j = bisect_left(chunks[i][0], start) if chunks else 0
+        for ids, values in chunks[i:]:
+            for k in range(j, len(ids)):
+                if ids[k] > end:
+                    return
+                yield ids[k], values[k]
+            j = 0
+
+    def _backward(self, end, start):
+        chunks = self._chunks
+        i = bisect_right(self._firsts, end) - 1
+        if i < 0:
+            return
+        j = bisect_right(chunks[i][0], end) - 1
+        while i >= 0:
+            ids, values = chunks[i]
+            for k in range(j, -1, -1):
+                if ids[k] < start:
+                    return
+                yield ids[k], values[k]
+            i -= 1
+            if i >= 0:
+                j = len(chunks[i][0]) - 1
+
+
+class StreamConsumer:
+    '''A consumer in a :class:`StreamGroup`'''
+    __slots__ = ('seen', 'pending')
+
+    def __init__(self, seen):
+        self.seen = seen
+        self.pending = set()
+
+    def __getstate__(self):
+        return (self.seen, self.pending)
+
+    def __setstate__(self, state):
+        self.seen, self.pending = state
+
+
+class StreamPending:
+    '''An entry of the pending entries list of a :class:`StreamGroup`'''
+    __slots__ = ('consumer', 'delivered', 'count')
+
+    def __init__(self, consumer, delivered, count=1):
+        self.consumer = consumer
+        self.delivered = delivered
+        self.count = count
+
+    def __getstate__(self):
+        return (self.consumer, self.delivered, self.count)
+
+    def __setstate__(self, state):
+        self.consumer, self.delivered, self.count = state
+
+
+class StreamGroup:
+    '''A consumer group of a :class:`Stream`.
+
+    .. attribute:: last_id
+
+        Id of the last entry delivered to the group
+
+    .. attribute:: pending
+
+        Ordered mapping of ids delivered but not yet acknowledged
+        to the :class:`StreamPending` entry
+
+    .. attribute:: consumers
+
+        Mapping of consumer names to :class:`StreamConsumer`
+    '''
+    __slots__ = ('last_id', 'pending', 'consumers')
+
+    def __init__(self, last_id=MIN_ID):
+        self.last_id = last_id
+        self.pending = OrderedDict()
+        self.consumers = {}
+
+    def __getstate__(self):
+        return (self.last_id, self.pending, self.consumers)
+
+    def __setstate__(self, state):
+        self.last_id, self.pending, self.consumers = state
+
+    def consumer(self, name, now):
+        '''Get or create the consumer ``name`` and mark it as seen'''
+        consumer = self.consumers.get(name)
+        if consumer is None:
+            self.consumers[name] = consumer = StreamConsumer(now)
+        else:
+            consumer.seen = now
+        return consumer
+
+    def deliver(self, id, name, now, noack=False):
+        '''Deliver ``id`` to consumer ``name``.
+
+        Unless ``noack`` is ``True`` the entry is added to the pending
+        entries list, or its delivery counter incremented if already
+        pending.
+        '''
+        if id > self.last_id:
+            self.last_id = id
+        if noack:
+            return
+        entry = self.pending.get(id)
+        if entry is None:
+            self.pending[id] = StreamPending(name, now)
+        else:
+            if entry.consumer != name:
+                self.consumers[entry.consumer].pending.discard(id)
+                entry.consumer = name
+            entry.delivered = now
+            entry.count += 1
+        self.consumers[name].pending.add(id)
+
+    def ack(self, ids):
+        '''Acknowledge ``ids``, return the number of entries removed
+        from the pending entries list.
+        '''
+        acked = 0
+        for id in ids:
+            entry = self.pending.pop(id, None)
+            if entry is not None:
+                consumer = self.consumers.get(entry.consumer)
+                if consumer:
+                    consumer.pending.discard(id)
+                acked += 1
+        return acked
+
+    def claim(self, id, name, now, min_idle, delivered=None,
+              retrycount=None, force=False, justid=False):
+        '''Change the ownership of a pending entry to consumer ``name``.
+
+        Return ``True`` if the entry was claimed.
+        '''
+        entry = self.pending.get(id)
+        if entry is None:
+            if not force:
+                return False
+            entry = StreamPending(name, now, 0)
+            self.pending[id] = entry
+        elif min_idle and now - entry.delivered < min_idle:
+            return False
+        else:
+            owner = self.consumers.get(entry.consumer)
+            if owner:
+                owner.pending.discard(id)
+        self.consumers[name].pending.add(id)
+        entry.consumer = name
+        entry.delivered = now if delivered is None else delivered
+        if retrycount is not None:
+            entry.count = retrycount
+        elif not justid:
+            entry.count += 1
+        return True
+
+    def remove_consumer(self, name):
+        '''Remove consumer ``name`` and its pending entries.
+
+        Return the number of pending entries removed.
+        '''
+        consumer = self.consumers.pop(name, None)
+        if consumer is None:
+            return 0
+        for id in consumer.pending:
+            self.pending.pop(id, None)
+        return len(consumer.pending)
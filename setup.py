@@ -75,6 +75,9 @@ meta = dict(
     include_package_data=True,
     setup_requires=['wheel'],
     packages=find_packages(include=['pulsar', 'pulsar.*', 'pulsar_test']),
+    extras_require={
+        'http2': ['h2']
+    },
     entry_points={
         "distutils.commands": [
             "pulsar_test = pulsar_test:Test"
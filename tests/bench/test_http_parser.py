@@ -0,0 +1,65 @@
+import unittest
+
+from pulsar.utils.httpurl import HttpParser
+
+try:
+    from http_parser.parser import HttpParser as CHttpParser
+except ImportError:     # pragma    nocover
+    CHttpParser = None
+
+
+class TestPythonHttpParser(unittest.TestCase):
+    __benchmark__ = True
+    __number__ = 10000
+    _sizes = {'tiny': 2,
+              'small': 10,
+              'normal': 20,
+              'big': 50,
+              'huge': 100}
+
+    @classmethod
+    def setUpClass(cls):
+        size = cls._sizes[cls.cfg.size]
+        headers = ''.join(('X-Header-%s: value %s\r\n' % (i, i)
+                           for i in range(size)))
+        cls.request = ('GET /bench?page=1 HTTP/1.1\r\n'
+                       'Host: 127.0.0.1:8060\r\n'
+                       '%s\r\n' % headers).encode('utf-8')
+        # headers received in small pieces
+        cls.pieces = [cls.request[i:i+16]
+                      for i in range(0, len(cls.request), 16)]
+        body = b''.join((b'%x\r\n%s\r\n' % (1000, b'x'*1000)
+                         for _ in range(size)))
+        response = ('HTTP/1.1 200 OK\r\n'
+                    'Transfer-Encoding: chunked\r\n'
+                    '%s\r\n' % headers).encode('utf-8')
+        response += body + b'0\r\n\r\n'
+        cls.packets = [response[i:i+1400]
+                       for i in range(0, len(response), 1400)]
+
+    def parser(self, kind=0):
+        return HttpParser(kind=kind)
+
+    def test_request(self):
+        parser = self.parser()
+        parser.execute(self.request, len(self.request))
+        parser.get_headers()
+
+    def test_request_pieces(self):
+        parser = self.parser()
+        for piece in self.pieces:
+            parser.execute(piece, len(piece))
+        parser.get_headers()
+
+    def test_chunked_response(self):
+        parser = self.parser(kind=1)
+        for packet in self.packets:
+            parser.execute(packet, len(packet))
+            parser.recv_body()
+
+
+@unittest.skipUnless(CHttpParser, 'Requires http-parser')
+class TestCHttpParser(TestPythonHttpParser):
+
+    def parser(self, kind=0):
+        return CHttpParser(kind=kind)
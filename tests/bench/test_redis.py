@@ -4,6 +4,8 @@ import unittest
 
 from pulsar import HAS_C_EXTENSIONS
 from pulsar.apps.ds import redis_parser
+from pulsar.apps.ds.parser import InvalidResponse, response_error
+from pulsar.apps.ds.pyparser import TaskParser
 
 characters = string.ascii_letters + string.digits
 
@@ -26,12 +28,21 @@ class RedisPyParser(unittest.TestCase):
                     for s in range(nsize)]
         cls.data_bytes = [(''.join((choice(characters) for l in range(20)))
                            ).encode('utf-8') for s in range(nsize)]
-        cls.parser = redis_parser(cls.redis_py_parser)()
+        cls.parser = cls.create_parser()
         cls.chunk = cls.parser.multi_bulk(cls.data)
+        cls.commands = [(('set', key, value), {})
+                        for key, value in zip(cls.data, cls.data_bytes)]
+
+    @classmethod
+    def create_parser(cls):
+        return redis_parser(cls.redis_py_parser)()
 
     def test_pack_command(self):
         self.parser.pack_command(self.data)
 
+    def test_pack_pipeline(self):
+        self.parser.pack_pipeline(self.commands)
+
     def test_encode_multi_bulk(self):
         self.parser.multi_bulk(self.data)
 
@@ -46,3 +57,11 @@ class RedisPyParser(unittest.TestCase):
 @unittest.skipUnless(HAS_C_EXTENSIONS, 'Requires C extensions')
 class RedisCParser(RedisPyParser):
     redis_py_parser = False
+
+
+class RedisPyTaskParser(RedisPyParser):
+    '''The task based python parser, before the offset scanner'''
+
+    @classmethod
+    def create_parser(cls):
+        return TaskParser(InvalidResponse, response_error)
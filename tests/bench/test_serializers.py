@@ -0,0 +1,61 @@
+import unittest
+
+from pulsar.utils import serializers
+from pulsar.apps.data.channels import Codec, Json
+
+
+class JsonSerializer(unittest.TestCase):
+    __benchmark__ = True
+    __number__ = 10000
+    _sizes = {'tiny': 1,
+              'small': 10,
+              'normal': 50,
+              'big': 200,
+              'huge': 1000}
+    serializer = 'json'
+
+    @classmethod
+    def setUpClass(cls):
+        size = cls._sizes[cls.cfg.size]
+        cls.codec = Codec(cls.serializer)
+        cls.message = {'event': 'update',
+                       'channel': 'models',
+                       'data': [{'id': i,
+                                 'name': 'item %s' % i,
+                                 'price': i*1.5,
+                                 'tags': ['a', 'b', 'c'],
+                                 'active': bool(i % 2)}
+                                for i in range(size)]}
+        cls.channels = ['channel%s' % i for i in range(10)]
+        cls.encoded = cls.codec.encode(cls.message)
+
+    def test_encode(self):
+        self.codec.encode(self.message)
+
+    def test_decode(self):
+        self.codec.decode(self.encoded)
+
+    def test_encode_events(self):
+        self.codec.encode_events('update', self.channels,
+                                 self.message['data'])
+
+
+class JsonChannels(JsonSerializer):
+    '''The channels json protocol encoding fanned out events once'''
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.codec = Json()
+
+
+@unittest.skipUnless('orjson' in serializers.serializers,
+                     'Requires orjson')
+class OrJsonSerializer(JsonSerializer):
+    serializer = 'orjson'
+
+
+@unittest.skipUnless('msgpack' in serializers.serializers,
+                     'Requires msgpack')
+class MsgPackSerializer(JsonSerializer):
+    serializer = 'msgpack'
@@ -1,6 +1,8 @@
 import os
+import json
 from base64 import b64decode
 from functools import wraps
+from urllib.parse import urlparse
 import socket
 import unittest
 import asyncio
@@ -9,6 +11,7 @@ import examples
 
 from pulsar import send, SERVER_SOFTWARE, get_event_loop
 from pulsar.utils.path import Path
+from pulsar.utils.httpurl import http_parser
 from pulsar.utils.system import platform
 from pulsar.apps.http import (HttpClient, TooManyRedirects, HttpResponse,
                               HttpRequestException, HTTPDigestAuth,
@@ -668,6 +671,43 @@ class TestHttpClient(TestHttpClientBase, unittest.TestCase):
         self.assertEqual(response.status_code, 304)
         self.assertFalse('Content-length' in response.headers)
 
+    async def test_media_file_etag(self):
+        http = self._client
+        response = await http.get(self.httpbin('media/httpbin.js'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['accept-ranges'], 'bytes')
+        etag = response.headers['etag']
+        self.assertTrue(etag.startswith('"'))
+        response = await http.get(self.httpbin('media/httpbin.js'),
+                                  headers={'If-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['etag'], etag)
+        response = await http.get(self.httpbin('media/httpbin.js'),
+                                  headers={'If-none-match': '"foo"'})
+        self.assertEqual(response.status_code, 200)
+
+    async def test_media_file_range(self):
+        path = Path(examples.__file__).parent
+        with open(path.join('httpbin', 'assets', 'httpbin.js'), 'rb') as f:
+            content = f.read()
+        size = len(content)
+        http = self._client
+        response = await http.get(self.httpbin('media/httpbin.js'),
+                                  headers={'Range': 'bytes=10-29'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['content-range'],
+                         'bytes 10-29/%d' % size)
+        self.assertEqual(response.content, content[10:30])
+        response = await http.get(self.httpbin('media/httpbin.js'),
+                                  headers={'Range': 'bytes=-15'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, content[-15:])
+        response = await http.get(self.httpbin('media/httpbin.js'),
+                                  headers={'Range': 'bytes=%d-' % size})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['content-range'],
+                         'bytes */%d' % size)
+
     async def test_http_get_timeit(self):
         N = 10
         client = self._client
@@ -778,6 +818,38 @@ class TestHttpClient(TestHttpClientBase, unittest.TestCase):
                socket.getaddrinfo(result, None)}
         self.assertTrue({'127.0.0.1', '::1'} & ips)
 
+    @no_tls
+    async def test_pipelining(self):
+        address = urlparse(self.uri)
+        host, port = address.hostname, address.port
+        reader, writer = await asyncio.open_connection(host, port)
+        paths = ('response_headers', 'getsize/200000', 'get', 'getsize/10')
+        writer.write(b''.join((('GET /%s HTTP/1.1\r\nHost: %s:%s\r\n\r\n'
+                                % (path, host, port)).encode('utf-8')
+                               for path in paths)))
+        responses = []
+        body = []
+        parser = http_parser(kind=1)
+        while len(responses) < len(paths):
+            data = await reader.read(65536)
+            self.assertTrue(data)
+            while data:
+                processed = parser.execute(data, len(data))
+                body.append(parser.recv_body())
+                data = data[processed:]
+                if parser.is_message_complete():
+                    self.assertEqual(parser.get_status_code(), 200)
+                    responses.append(json.loads(
+                        b''.join(body).decode('utf-8')))
+                    body = []
+                    parser = http_parser(kind=1)
+        writer.close()
+        # the first response is still the connection current consumer
+        self.assertEqual(responses[0]['Transfer-Encoding'], 'chunked')
+        self.assertEqual(responses[1]['size'], 200000)
+        self.assertFalse('size' in responses[2])
+        self.assertEqual(responses[3]['size'], 10)
+
     async def test_raw_property(self):
         http = self._client
         response = await http.get(self.httpbin('plaintext'))
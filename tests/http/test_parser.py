@@ -159,6 +159,62 @@ class TestPythonHttpParser(unittest.TestCase):
         self.assertEqual(p.execute(data, len(data)), len(data))
 
 
+    def test_pipelined_requests(self):
+        p = self.parser()
+        data = (b'GET /a HTTP/1.1\r\nHost: x\r\n\r\n'
+                b'POST /b HTTP/1.1\r\nContent-Length: 3\r\n\r\nfoo'
+                b'GET /c HTTP/1.1\r\n\r\n')
+        self.assertEqual(p.execute(data, len(data)), 28)
+        self.assertTrue(p.is_message_complete())
+        self.assertEqual(p.get_path(), '/a')
+        data = data[28:]
+        p = self.parser()
+        self.assertEqual(p.execute(data, len(data)), 42)
+        self.assertTrue(p.is_message_complete())
+        self.assertEqual(p.recv_body(), b'foo')
+
+    def test_slow_headers(self):
+        p = self.parser()
+        data = (b'GET /test HTTP/1.1\r\nHost: 0.0.0.0\r\n'
+                b'X-Folded: one\r\n two\r\n\r\n')
+        for index in range(len(data)):
+            self.assertEqual(p.execute(data[index:index+1], 1), 1)
+        self.assertTrue(p.is_message_complete())
+        headers = p.get_headers()
+        self.assertEqual(headers['Host'], ['0.0.0.0'])
+        self.assertEqual(headers['X-Folded'], ['one two'])
+
+    def test_chunked_response(self):
+        data = (b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'5\r\nhello\r\na;name=value\r\n0123456789\r\n'
+                b'0\r\nX-Trailer: foo\r\n\r\n')
+        for size in (1, 3, len(data)):
+            p = self.parser()
+            body = []
+            for index in range(0, len(data), size):
+                chunk = data[index:index+size]
+                self.assertEqual(p.execute(chunk, len(chunk)), len(chunk))
+                body.append(p.recv_body())
+            self.assertTrue(p.is_chunked())
+            self.assertTrue(p.is_message_complete())
+            self.assertEqual(b''.join(body), b'hello0123456789')
+
+    def test_invalid_chunk(self):
+        p = self.parser()
+        data = (b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'xyz\r\n')
+        self.assertNotEqual(p.execute(data, len(data)), len(data))
+
+    def test_response_until_eof(self):
+        p = self.parser()
+        data = b'HTTP/1.1 200 OK\r\n\r\nhello'
+        self.assertEqual(p.execute(data, len(data)), len(data))
+        self.assertFalse(p.is_message_complete())
+        self.assertEqual(p.recv_body(), b'hello')
+        self.assertEqual(p.execute(b'', 0), 0)
+        self.assertTrue(p.is_message_complete())
+
+
 @unittest.skipUnless(hasextensions, 'Requires C extensions')
 class TestCHttpParser(TestPythonHttpParser):
 
@@ -61,6 +61,29 @@ class ChannelsTests:
         await channels.close()
         self.assertEqual(channels.status, StatusType.closed)
 
+    async def test_publish_many(self):
+        json = Json()
+        self.assertEqual(json.encode_events('boom', ['a', 'b'], {'x': 1}),
+                         [json.encode({'event': 'boom', 'channel': 'a',
+                                       'data': {'x': 1}}),
+                          json.encode({'event': 'boom', 'channel': 'b',
+                                       'data': {'x': 1}})])
+        channels = self.channels()
+        names = ['many%s' % i for i in range(5)]
+        futures = dict(((name, asyncio.Future()) for name in names))
+
+        def fire(channel, event, data):
+            futures[channel.name].set_result((event, data))
+
+        await asyncio.gather(*[channels.register(name, '*', fire)
+                               for name in names])
+        await channels.connect()
+        self.assertEqual(channels.status, StatusType.connected)
+        await channels.publish_many(names, 'boom', 'ciao!')
+        results = await asyncio.gather(*futures.values())
+        self.assertEqual(results, [('boom', 'ciao!')]*5)
+        await channels.close()
+
     async def __test_fail_subscribe(self):
         channels = self.channels()
         original, warning, critical = self._patch(
@@ -85,7 +108,7 @@ class ChannelsTests:
     async def test_fail_publish(self):
         channels = self.channels()
         original, warning, critical = self._patch(
-            channels, channels.pubsub, 'publish'
+            channels, channels.pubsub, 'publish_batch'
         )
         await channels.publish('channel3', 'event2', 'failure')
         args, kw = await critical.end
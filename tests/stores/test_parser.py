@@ -4,6 +4,8 @@ import unittest
 import pulsar
 from pulsar.apps.ds import (redis_parser, ResponseError, NoScriptError,
                             InvalidResponse)
+from pulsar.apps.ds.parser import response_error
+from pulsar.apps.ds.pyparser import TaskParser
 
 
 def lua_nested_table(nesting, s=100):
@@ -21,8 +23,8 @@ def lua_nested_table(nesting, s=100):
 
 class TestParser(unittest.TestCase):
 
-    def parser(self):
-        return redis_parser()()
+    def parser(self, **kw):
+        return redis_parser()(**kw)
 
     #    DECODER
     def test_null(self):
@@ -134,12 +136,64 @@ class TestParser(unittest.TestCase):
         self.assertEqual(res2[0], b'100')
         self.assertEqual(res2[1], result[1])
 
+    def test_compact(self):
+        p = self.parser()
+        p.compact_size = 10
+        for i in range(20):
+            p.feed(b'$5\r\nhello\r\n:')
+            self.assertEqual(p.get(), b'hello')
+            self.assertEqual(p.get(), False)
+            p.feed(b'%d\r\n' % i)
+            self.assertEqual(p.get(), i)
+        self.assertEqual(p.buffer(), b'')
+
+    def test_zero_copy(self):
+        p = self.parser(zero_copy=True)
+        p.feed(b'*2\r\n$5\r\nhello\r\n$3\r\nfoo\r\n$3\r\nba')
+        value = p.get()
+        self.assertIsInstance(value[0], memoryview)
+        self.assertEqual(value, [b'hello', b'foo'])
+        p.feed(b'r\r\n')
+        self.assertEqual(p.get(), b'bar')
+        self.assertEqual(value, [b'hello', b'foo'])
+        self.assertEqual(p.buffer(), b'')
+
+    def test_lazy_arrays(self):
+        p = self.parser(lazy_arrays=True)
+        result = lua_nested_table(3)
+        data = p.multi_bulk(result)
+        while data:
+            self.assertEqual(p.get(), False)
+            chunk, data = data[:7], data[7:]
+            p.feed(chunk)
+        value = p.get()
+        self.assertEqual(len(value), len(result))
+        self.assertEqual(value[0], b'100')
+        self.assertEqual(value[1], result[1])
+        self.assertEqual(value[-1], b'1')
+        self.assertEqual(value[2][:3], [b'-8', result[1], None])
+        self.assertEqual(p.buffer(), b'')
+        p.feed(b'*0\r\n*-1\r\n')
+        self.assertEqual(p.get(), [])
+        self.assertEqual(p.get(), None)
+
     # CLIENT ENCODERS
     def test_encode_commands(self):
         p = self.parser()
         chunk = p.pack_command(['whatever', None])
         self.assertEqual(chunk, b'*2\r\n$8\r\nwhatever\r\n$4\r\nNone\r\n')
 
+    def test_encode_pipeline(self):
+        p = self.parser()
+        value = b'x' * 2000
+        chunk = p.pack_pipeline([(('set', 'a', value), {}),
+                                 ((b'get', 'a'), {}),
+                                 (('incrby', 'b', 3), {})])
+        self.assertEqual(chunk, b''.join((
+            b'*3\r\n$3\r\nset\r\n$1\r\na\r\n$2000\r\n', value,
+            b'\r\n*2\r\n$3\r\nget\r\n$1\r\na\r\n',
+            b'*3\r\n$6\r\nincrby\r\n$1\r\nb\r\n$1\r\n3\r\n')))
+
     # SERVER ENCODERS
 
     def test_encode_empty_string(self):
@@ -156,5 +210,11 @@ class TestParser(unittest.TestCase):
 @unittest.skipUnless(pulsar.HAS_C_EXTENSIONS, 'Requires C extensions')
 class TestPythonParser(TestParser):
 
-    def parser(self):
-        return redis_parser(True)()
+    def parser(self, **kw):
+        return redis_parser(True)(**kw)
+
+
+class TestTaskParser(TestParser):
+
+    def parser(self, **kw):
+        return TaskParser(InvalidResponse, response_error, **kw)
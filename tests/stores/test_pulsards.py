@@ -10,6 +10,7 @@ from pulsar.utils.string import random_string
 from pulsar.utils.structures import Zset
 from pulsar.apps.ds import PulsarDS, redis_parser, ResponseError
 from pulsar.apps.data import create_store
+from pulsar.apps.data.redis import ShardedStore
 
 
 class Listener:
@@ -186,6 +187,18 @@ class RedisCommands(StoreMixin):
         eq(await c.renamenx(key, des+'a'), True)
         eq(await c.exists(key), False)
 
+    async def test_unlink(self):
+        key1 = self.randomkey()
+        key2 = key1 + '2'
+        c = self.client
+        eq = self.assertEqual
+        eq(await c.sadd(key1, *range(5000)), 5000)
+        eq(await c.set(key2, 'hello'), True)
+        eq(await c.unlink(key1, key2, key1 + '3'), 2)
+        eq(await c.exists(key1), False)
+        eq(await c.exists(key2), False)
+        eq(await c.unlink(key1), 0)
+
     ###########################################################################
     #    BAD REQUESTS
     # async def test_no_command(self):
@@ -1120,6 +1133,163 @@ class RedisCommands(StoreMixin):
         eq(await c.zremrangebyscore(key, 2, 4), 0)
         eq(await c.zrange(key, 0, -1), [b'a1', b'a5'])
 
+    ###########################################################################
+    #    STREAMS
+    async def test_xadd_xlen_xrange(self):
+        key = self.randomkey()
+        eq = self.assertEqual
+        c = self.client
+        eq(await c.xlen(key), 0)
+        eq(await c.xadd(key, {'a': 1}, id='1-1'), b'1-1')
+        eq(await c.xadd(key, [('b', 2), ('c', 3)], id='1-2'), b'1-2')
+        await self.wait.assertRaises(ResponseError, c.xadd, key,
+                                     {'a': 1}, id='1-1')
+        id = await c.xadd(key, {'d': 4})
+        eq(await c.xlen(key), 3)
+        eq(await c.type(key), 'stream')
+        eq(await c.xrange(key), [(b'1-1', {b'a': b'1'}),
+                                 (b'1-2', {b'b': b'2', b'c': b'3'}),
+                                 (id, {b'd': b'4'})])
+        eq(await c.xrange(key, '1-2', '1-2'), [(b'1-2', {b'b': b'2',
+                                                         b'c': b'3'})])
+        eq(await c.xrange(key, count=1), [(b'1-1', {b'a': b'1'})])
+        eq(await c.xrevrange(key, count=1), [(id, {b'd': b'4'})])
+        eq(await c.xdel(key, '1-2', '9-9'), 1)
+        eq(await c.xlen(key), 2)
+        eq(await c.set(key + 'x', 'foo'), True)
+        await self.wait.assertRaises(ResponseError, c.xadd, key + 'x',
+                                     {'a': 1})
+        # an invalid ID does not create the stream
+        key = self.randomkey()
+        await self.wait.assertRaises(ResponseError, c.xadd, key,
+                                     {'a': 1}, id='bad')
+        await self.wait.assertRaises(ResponseError, c.xadd, key,
+                                     {'a': 1}, id='0-0')
+        eq(await c.exists(key), 0)
+        eq(await c.type(key), 'none')
+
+    async def test_xadd_maxlen_xtrim(self):
+        key = self.randomkey()
+        eq = self.assertEqual
+        c = self.client
+        for i in range(1, 11):
+            await c.xadd(key, {'i': i}, id='%d-0' % i, maxlen=5,
+                         approximate=False)
+        eq(await c.xlen(key), 5)
+        eq((await c.xrange(key, count=1))[0][0], b'6-0')
+        eq(await c.xtrim(key, 2, approximate=False), 3)
+        eq(await c.xrange(key), [(b'9-0', {b'i': b'9'}),
+                                 (b'10-0', {b'i': b'10'})])
+
+    async def test_xread(self):
+        key1 = self.randomkey()
+        key2 = key1 + 'x'
+        bk1 = key1.encode('utf-8')
+        eq = self.assertEqual
+        c = self.client
+        eq(await c.xread({key1: '0'}), [])
+        eq(await c.xadd(key1, {'a': 1}, id='1-0'), b'1-0')
+        eq(await c.xadd(key1, {'b': 2}, id='2-0'), b'2-0')
+        eq(await c.xread({key1: '0', key2: '0'}),
+           [(bk1, [(b'1-0', {b'a': b'1'}), (b'2-0', {b'b': b'2'})])])
+        eq(await c.xread({key1: '1-0'}, count=1),
+           [(bk1, [(b'2-0', {b'b': b'2'})])])
+        eq(await c.xread({key1: '$'}, block=100), [])
+
+    async def test_xread_block(self):
+        key = self.randomkey()
+        bk = key.encode('utf-8')
+        c = self.client
+        read = asyncio.ensure_future(c.xread({key: '$'}, block=0))
+        await asyncio.sleep(0.1)
+        self.assertFalse(read.done())
+        self.assertEqual(await c.xadd(key, {'a': 1}, id='5-0'), b'5-0')
+        self.assertEqual(await read, [(bk, [(b'5-0', {b'a': b'1'})])])
+
+    async def test_xreadgroup_xack(self):
+        key = self.randomkey()
+        bk = key.encode('utf-8')
+        eq = self.assertEqual
+        c = self.client
+        await self.wait.assertRaises(ResponseError, c.xgroup, 'create', key,
+                                     'workers', '$')
+        eq(await c.xgroup('create', key, 'workers', '$', 'MKSTREAM'), True)
+        await self.wait.assertRaises(ResponseError, c.xgroup, 'create', key,
+                                     'workers', '$')
+        eq(await c.xadd(key, {'job': 1}, id='1-0'), b'1-0')
+        eq(await c.xadd(key, {'job': 2}, id='2-0'), b'2-0')
+        eq(await c.xreadgroup('workers', 'alice', {key: '>'}, count=1),
+           [(bk, [(b'1-0', {b'job': b'1'})])])
+        eq(await c.xreadgroup('workers', 'bob', {key: '>'}),
+           [(bk, [(b'2-0', {b'job': b'2'})])])
+        eq(await c.xreadgroup('workers', 'bob', {key: '>'}), [])
+        pending = await c.xpending(key, 'workers')
+        eq(pending['pending'], 2)
+        eq(pending['min'], b'1-0')
+        eq(pending['max'], b'2-0')
+        eq(pending['consumers'], {b'alice': 1, b'bob': 1})
+        # history of pending entries for a consumer
+        eq(await c.xreadgroup('workers', 'alice', {key: '0'}),
+           [(bk, [(b'1-0', {b'job': b'1'})])])
+        eq(await c.xack(key, 'workers', '1-0'), 1)
+        eq(await c.xack(key, 'workers', '1-0'), 0)
+        eq(await c.xreadgroup('workers', 'alice', {key: '0'}), [(bk, [])])
+        pending = await c.xpending(key, 'workers', count=10)
+        eq(len(pending), 1)
+        eq(pending[0]['id'], b'2-0')
+        eq(pending[0]['consumer'], b'bob')
+        eq(pending[0]['delivered'], 1)
+        await self.wait.assertRaises(ResponseError, c.xreadgroup, 'foo',
+                                     'alice', {key: '>'})
+
+    async def test_xclaim(self):
+        key = self.randomkey()
+        eq = self.assertEqual
+        c = self.client
+        eq(await c.xgroup('create', key, 'workers', '0', 'MKSTREAM'), True)
+        eq(await c.xadd(key, {'job': 1}, id='1-0'), b'1-0')
+        await c.xreadgroup('workers', 'alice', {key: '>'})
+        eq(await c.xclaim(key, 'workers', 'bob', 3600000, ['1-0']), [])
+        eq(await c.xclaim(key, 'workers', 'bob', 0, ['1-0']),
+           [(b'1-0', {b'job': b'1'})])
+        pending = await c.xpending(key, 'workers', count=10)
+        eq(pending[0]['consumer'], b'bob')
+        eq(pending[0]['delivered'], 2)
+        eq(await c.xclaim(key, 'workers', 'alice', 0, ['1-0'], justid=True),
+           [b'1-0'])
+        eq(await c.xgroup('delconsumer', key, 'workers', 'alice'), 1)
+        eq(await c.xgroup('destroy', key, 'workers'), 1)
+
+    ###########################################################################
+    #    HYPERLOGLOG
+    async def test_pfadd_pfcount(self):
+        key = self.randomkey()
+        eq = self.assertEqual
+        c = self.client
+        eq(await c.pfcount(key), 0)
+        eq(await c.pfadd(key, 'a', 'b', 'c'), 1)
+        eq(await c.pfadd(key, 'a', 'b'), 0)
+        eq(await c.pfcount(key), 3)
+        eq(await c.pfadd(key, *range(1000)), 1)
+        count = await c.pfcount(key)
+        self.assertTrue(980 < count < 1030)
+        eq(await c.set(key + 'x', 'foo'), True)
+        await self.wait.assertRaises(ResponseError, c.pfadd, key + 'x', 'a')
+        await self.wait.assertRaises(ResponseError, c.pfcount, key + 'x')
+
+    async def test_pfmerge(self):
+        key1 = self.randomkey()
+        key2 = key1 + '2'
+        des = key1 + 'd'
+        eq = self.assertEqual
+        c = self.client
+        eq(await c.pfadd(key1, *range(500)), 1)
+        eq(await c.pfadd(key2, *range(250, 750)), 1)
+        eq(await c.pfmerge(des, key1, key2), True)
+        count = await c.pfcount(des)
+        self.assertTrue(730 < count < 770)
+        eq(await c.pfcount(key1, key2), count)
+
     ###########################################################################
     #    CONNECTION
     async def test_ping(self):
@@ -1236,6 +1406,51 @@ class RedisCommands(StoreMixin):
         result = await self.client.watch(key1)
         self.assertEqual(result, 1)
 
+    async def test_multi_exec(self):
+        key = self.randomkey()
+        eq = self.assertEqual
+        c = self.client
+        pipe = c.pipeline()
+        pipe.set(key, 1)
+        pipe.incr(key)
+        pipe.lpush(key, 'foo')
+        pipe.get(key)
+        result = await pipe.commit(raise_on_error=False)
+        eq(len(result), 4)
+        eq(result[:2], [True, 2])
+        self.assertIsInstance(result[2], Exception)
+        eq(result[3], b'2')
+
+    async def test_pipeline_no_transaction(self):
+        key = self.randomkey()
+        eq = self.assertEqual
+        c = self.client
+        pipe = c.pipeline(transaction=False, chunk_size=10)
+        for i in range(25):
+            pipe.rpush(key, i)
+        eq(await pipe.commit(), list(range(1, 26)))
+        eq(await c.llen(key), 25)
+        pipe = c.pipeline(transaction=False, chunk_size=2)
+        pipe.lindex(key, 0)
+        pipe.incr(key)
+        pipe.llen(key)
+        result = []
+        async for value in pipe.stream(raise_on_error=False):
+            result.append(value)
+        eq(len(result), 3)
+        eq(result[0], b'0')
+        self.assertIsInstance(result[1], Exception)
+        eq(result[2], 25)
+
+    async def test_exec_abort(self):
+        key = self.randomkey()
+        c = self.client
+        pipe = c.pipeline()
+        pipe.set(key, 1)
+        pipe.execute('foo')
+        await self.wait.assertRaises(ResponseError, pipe.commit)
+        self.assertEqual(await c.get(key), None)
+
 
 class TestPulsarStore(RedisCommands, unittest.TestCase):
     app_cfg = None
@@ -1265,6 +1480,219 @@ class TestPulsarStore(RedisCommands, unittest.TestCase):
         self.assertEqual(store.encoding, 'utf-8')
         self.assertTrue(repr(store))
 
+    async def test_multiplex(self):
+        store = self.create_store('%s/9' % self.pulsards_uri, multiplex=1)
+        c = store.client()
+        eq = self.assertEqual
+        key = self.randomkey()
+        # tasks are created in order, gather uses a set on python 3.6
+        requests = [asyncio.ensure_future(c.incr(key)) for _ in range(50)]
+        while not store._multiplexed:
+            await asyncio.sleep(0)
+        # requests issued while the connection opens keep their order
+        requests.extend((asyncio.ensure_future(c.incr(key))
+                         for _ in range(50)))
+        results = await asyncio.gather(*requests)
+        eq(results, list(range(1, 101)))
+        eq(len(store._multiplexed), 1)
+        eq(store.pool.in_use, 0)
+        pipe = c.pipeline()
+        pipe.get(key)
+        pipe.incr(key)
+        eq(await pipe.commit(), [b'100', 101])
+        await self.wait.assertRaises(ResponseError, c.lpush, key, 'foo')
+        eq(await c.get(key), b'101')
+        await store.close()
+        eq(store._multiplexed, [])
+
+    async def test_sharded(self):
+        store = ShardedStore(['%s/12' % self.pulsards_uri,
+                              '%s/13' % self.pulsards_uri],
+                             namespace=self.randomkey(6).lower())
+        c = store.client()
+        eq = self.assertEqual
+        keys = [self.randomkey() for _ in range(20)]
+        eq(len(set(store.node(key) for key in keys)), 2)
+        values = []
+        for i, key in enumerate(keys):
+            values.extend((key, i))
+        eq(await c.mset(*values), True)
+        eq(await c.mget(*keys), [str(i).encode('utf-8')
+                                 for i in range(20)])
+        eq(await c.exists(*keys), 20)
+        pipe = c.pipeline()
+        for key in keys:
+            pipe.incr(key)
+        eq(await pipe.commit(), list(range(1, 21)))
+        eq(await c.delete(*keys), 20)
+        # streams are read from the node owning the keys after STREAMS
+        other = [key for key in keys if store.node(key) != store.node(keys[0])]
+        self.assertTrue(await c.xadd(keys[0], {'a': 1}))
+        result = await c.xread({keys[0]: 0})
+        eq(len(result), 1)
+        eq(result[0][0], keys[0].encode('utf-8'))
+        await self.wait.assertRaises(ValueError, c.xread,
+                                     {keys[0]: 0, other[0]: 0})
+        eq(await c.delete(keys[0]), 1)
+        eq(store.pubsub().store, store._command_node('PUBLISH', ()))
+        #
+        node = store.node(keys[0])
+        store._eject(node)
+        self.assertNotEqual(store.node(keys[0]), node)
+        eq(await c.set(keys[0], 'foo'), True)
+        await store._check(node)
+        eq(store.node(keys[0]), node)
+        await store.close()
+
+    async def test_sharded_node_error(self):
+        store = ShardedStore(['%s/12' % self.pulsards_uri,
+                              'pulsar://127.0.0.1:1/12'],
+                             namespace=self.randomkey(6).lower())
+        c = store.client()
+        down = store.nodes[1]
+        key = self.randomkey()
+        while store.node(key) != down:
+            key = self.randomkey()
+        # writes are not retried on the remaining nodes
+        await self.wait.assertRaises(ConnectionError, c.set, key, 'foo')
+        self.assertFalse(down.dns in store.ring)
+        self.assertEqual(await c.get(key), None)
+        store.ring.add(down.dns)
+        # reads are
+        self.assertEqual(await c.get(key), None)
+        self.assertFalse(down.dns in store.ring)
+        await store.close()
+
+    async def wait_metrics(self, store, condition, timeout=5):
+        '''Pool metrics of ``store`` once ``condition(metrics)`` holds'''
+        loop = store._loop
+        deadline = loop.time() + timeout
+        metrics = store.pool_metrics()
+        while not condition(metrics) and loop.time() < deadline:
+            await asyncio.sleep(0.01)
+            metrics = store.pool_metrics()
+        return metrics
+
+    async def test_pool_health(self):
+        store = self.create_store('%s/9' % self.pulsards_uri,
+                                  pool_min_size=2, pool_max_lifetime=0.3,
+                                  pool_keepalive=0.05)
+        eq = self.assertEqual
+        metrics = await self.wait_metrics(
+            store, lambda m: m['available'] == 2)
+        eq(metrics['creations'], 2)
+        eq(metrics['available'], 2)
+        eq(await store.ping(), True)
+        # connections expire and are replaced by the periodic check
+        metrics = await self.wait_metrics(
+            store, lambda m: (m['creations'] >= 4 and m['discards'] >= 2 and
+                              m['available'] == 2))
+        eq(metrics['checkouts'], 1)
+        eq(metrics['available'], 2)
+        self.assertTrue(metrics['discards'] >= 2)
+        self.assertTrue(metrics['creations'] >= 4)
+        await store.close()
+
+    async def test_pool_waiters(self):
+        store = self.create_store('%s/9' % self.pulsards_uri, pool_size=1)
+        pool = store.pool
+        eq = self.assertEqual
+        connection = await pool.connect()
+        await self.wait.assertRaises(asyncio.TimeoutError, pool.connect, 0.01)
+        waiters = [asyncio.ensure_future(pool.connect()) for _ in range(3)]
+        await asyncio.sleep(0)
+        eq(pool.waiting, 3)
+        waiters[1].cancel()
+        raw = connection.connection
+        connection.close()
+        first = await waiters[0]
+        eq(first.connection, raw)
+        eq(pool.waiting, 1)
+        first.close()
+        last = await waiters[2]
+        eq(last.connection, raw)
+        last.close()
+        metrics = pool.metrics()
+        eq(metrics['timeouts'], 1)
+        eq(metrics['max_waiting'], 3)
+        eq(metrics['creations'], 1)
+        # cancelled after a connection slot was handed over
+        connection = await pool.connect()
+        waiter = asyncio.ensure_future(pool.connect())
+        await asyncio.sleep(0)
+        connection.close(discard=True)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        eq(pool.metrics()['connecting'], 0)
+        connection = await pool.connect(1)
+        connection.close()
+        await store.close()
+
+    async def test_failover_nodes(self):
+        address = '%s:%s' % self.app_cfg.addresses[0]
+        store = self.create_store('%s/9' % self.pulsards_uri,
+                                  nodes='127.0.0.1:1,%s' % address,
+                                  failover_interval=0)
+        failover = store.failover
+        eq = self.assertEqual
+        c = store.client()
+        key = self.randomkey()
+        eq(await c.set(key, 'foo'), True)
+        eq(failover.primary, tuple(self.app_cfg.addresses[0]))
+        eq(failover.replicas, [])
+        pool = store.pool
+        # simulate a failover
+        failover.primary = ('127.0.0.1', 1)
+        await failover.refresh()
+        eq(failover.primary, tuple(self.app_cfg.addresses[0]))
+        self.assertNotEqual(store.pool, pool)
+        self.assertTrue(pool.closed)
+        eq(await c.get(key), b'foo')
+        await store.close()
+
+    async def test_flushdb_async(self):
+        store = self.create_store('%s/11' % self.pulsards_uri)
+        c = store.client()
+        eq = self.assertEqual
+        key = self.randomkey()
+        eq(await c.sadd(key, *range(5000)), 5000)
+        eq(await c.set(key + '2', 'hello'), True)
+        eq(await c.flushdb('async'), True)
+        eq(await c.dbsize(), 0)
+        await self.wait.assertRaises(ResponseError, c.flushdb, 'foo')
+
+    async def test_object(self):
+        key = self.randomkey()
+        eq = self.assertEqual
+        c = self.client
+        eq(await c.object('encoding', key), None)
+        eq(await c.sadd(key, 'a', 'b'), 2)
+        eq(await c.object('encoding', key), b'hashtable')
+        eq(await c.object('refcount', key), 1)
+        eq(await c.object('freq', key), 5)
+        self.assertTrue(await c.object('idletime', key) >= 0)
+        await self.wait.assertRaises(ResponseError, c.object, 'foo', key)
+
+    async def test_memory_usage(self):
+        key = self.randomkey()
+        eq = self.assertEqual
+        c = self.client
+        eq(await c.memory('usage', key), None)
+        eq(await c.sadd(key, *range(100)), 100)
+        size = await c.memory('usage', key)
+        self.assertTrue(size > 100)
+        eq(await c.sadd(key, *range(100, 1000)), 900)
+        self.assertTrue(await c.memory('usage', key) > size)
+        self.assertTrue(await c.memory('usage', key, 'samples', 0) > size)
+        info = await c.info('memory')
+        self.assertTrue(info['used_memory'] > size)
+        self.assertTrue(info['used_memory_dataset'] > size)
+        debug = await c.debug('object', key)
+        self.assertTrue(debug.startswith(b'Value at:'))
+        await self.wait.assertRaises(ResponseError, c.debug, 'object',
+                                     key + 'x')
+
 
 @unittest.skipUnless(pulsar.HAS_C_EXTENSIONS, 'Requires cython extensions')
 class TestPulsarStorePyParser(TestPulsarStore):
@@ -1,7 +1,24 @@
 import re
+import asyncio
 import unittest
 
 from pulsar.apps.ds import redis_to_py_pattern
+from pulsar.apps.ds.server import Db, LazyFree
+from pulsar.apps.data.redis.sharded import HashRing, hash_key
+
+
+class DummyStore:
+    NOTIFY_GENERIC = 1
+    _expired_keys = 0
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._lazyfree = LazyFree(loop)
+        # one element per loop iteration
+        self._lazyfree.chunk_size = 1
+
+    def _signal(self, *args, **kw):
+        pass
 
 
 class TestUtils(unittest.TestCase):
@@ -33,3 +50,44 @@ class TestUtils(unittest.TestCase):
         self.match(c, 'hello')
         self.match(c, 'hallo')
         self.not_match(c, 'hollo')
+
+    def test_hash_key(self):
+        self.assertEqual(hash_key('foo'), b'foo')
+        self.assertEqual(hash_key('user:{1000}:name'), b'1000')
+        self.assertEqual(hash_key(b'{a}{b}'), b'a')
+        self.assertEqual(hash_key('foo{}bar'), b'foo{}bar')
+        self.assertEqual(hash_key('foo{bar'), b'foo{bar')
+
+    def test_hash_ring(self):
+        ring = HashRing(['a', 'b', 'c'])
+        self.assertEqual(len(ring), 3)
+        keys = ['key%s' % i for i in range(1000)]
+        owners = dict(((key, ring.get(key)) for key in keys))
+        self.assertEqual(set(owners.values()), set(('a', 'b', 'c')))
+        self.assertEqual(ring.get('{tag}x'), ring.get('{tag}y'))
+        ring.remove('b')
+        self.assertFalse('b' in ring)
+        for key in keys:
+            if owners[key] != 'b':
+                self.assertEqual(ring.get(key), owners[key])
+            else:
+                self.assertNotEqual(ring.get(key), 'b')
+        ring.add('b')
+        self.assertEqual(dict(((key, ring.get(key)) for key in keys)),
+                         owners)
+        self.assertEqual(HashRing().get('foo'), None)
+
+    async def test_lazy_flush_expires(self):
+        store = DummyStore(asyncio.get_event_loop())
+        db = Db(0, store)
+        keys = ['key%s' % i for i in range(100)]
+        for key in keys:
+            db._timer(0, key, b'foo')
+        db.flush(lazy=True)
+        self.assertEqual(len(db), 0)
+        db._timer(10, keys[0], b'bla')
+        await asyncio.sleep(0.05)
+        # timers of the flushed keys don't expire the new key
+        self.assertEqual(db.peek(keys[0]), b'bla')
+        self.assertEqual(store._expired_keys, 0)
+        db.flush()
@@ -0,0 +1,101 @@
+import pickle
+import unittest
+
+from pulsar.utils.structures import Stream, StreamGroup
+
+
+class SmallStream(Stream):
+    chunk_size = 4
+
+
+class TestStream(unittest.TestCase):
+
+    def stream(self, size=20, stream_class=SmallStream):
+        s = stream_class()
+        s.extend((((i, 0), (b'f', str(i).encode('utf-8')))
+                  for i in range(1, size + 1)))
+        return s
+
+    def ids(self, entries):
+        return [id for id, _ in entries]
+
+    def test_add(self):
+        s = self.stream()
+        self.assertEqual(len(s), 20)
+        self.assertEqual(len(s._chunks), 5)
+        self.assertEqual(s.first_id, (1, 0))
+        self.assertEqual(s.last_id, (20, 0))
+        self.assertRaises(ValueError, s.add, (20, 0), ())
+        self.assertEqual(s.next_id(5), (20, 1))
+        self.assertEqual(s.next_id(30), (30, 0))
+        self.assertTrue(Stream())
+
+    def test_range(self):
+        s = self.stream()
+        self.assertEqual(self.ids(s.range((3, 0), (9, 0))),
+                         [(i, 0) for i in range(3, 10)])
+        self.assertEqual(self.ids(s.range((3, 0), (9, 0), reverse=True)),
+                         [(i, 0) for i in range(9, 2, -1)])
+        self.assertEqual(self.ids(s.range(count=2)), [(1, 0), (2, 0)])
+        self.assertEqual(self.ids(s.after((18, 0))), [(19, 0), (20, 0)])
+        self.assertEqual(s.after((20, 0)), [])
+        self.assertEqual(s.get((5, 0)), (b'f', b'5'))
+        self.assertEqual(s.get((5, 1)), None)
+        self.assertEqual(Stream().range(), [])
+
+    def test_remove(self):
+        s = self.stream()
+        self.assertEqual(s.remove([(1, 0), (4, 0), (5, 0), (50, 0)]), 3)
+        self.assertEqual(len(s), 17)
+        self.assertEqual(s.first_id, (2, 0))
+        self.assertEqual(self.ids(s.range((3, 0), (6, 0))),
+                         [(3, 0), (6, 0)])
+
+    def test_trim(self):
+        s = self.stream()
+        self.assertEqual(s.trim(10, approximate=True), 8)
+        self.assertEqual(len(s), 12)
+        self.assertEqual(s.trim(10), 2)
+        self.assertEqual(len(s), 10)
+        self.assertEqual(s.first_id, (11, 0))
+        self.assertEqual(s.trim(0), 10)
+        self.assertEqual(len(s), 0)
+        self.assertEqual(s.last_id, (20, 0))
+
+    def test_pickle(self):
+        # SmallStream cannot be imported by name from the test module
+        s = self.stream(stream_class=Stream)
+        s.groups[b'g'] = StreamGroup((3, 0))
+        s2 = pickle.loads(pickle.dumps(s))
+        self.assertEqual(list(s2), list(s))
+        self.assertEqual(s2.last_id, s.last_id)
+        self.assertEqual(s2.groups[b'g'].last_id, (3, 0))
+
+
+class TestStreamGroup(unittest.TestCase):
+
+    def test_deliver_ack(self):
+        g = StreamGroup()
+        g.consumer(b'a', 0)
+        g.deliver((1, 0), b'a', 10)
+        g.deliver((2, 0), b'a', 10, noack=True)
+        self.assertEqual(g.last_id, (2, 0))
+        self.assertEqual(list(g.pending), [(1, 0)])
+        self.assertEqual(g.ack([(1, 0), (2, 0)]), 1)
+        self.assertFalse(g.pending)
+        self.assertFalse(g.consumers[b'a'].pending)
+
+    def test_claim(self):
+        g = StreamGroup()
+        g.consumer(b'a', 0)
+        g.consumer(b'b', 0)
+        g.deliver((1, 0), b'a', 10)
+        self.assertFalse(g.claim((1, 0), b'b', 20, 100))
+        self.assertTrue(g.claim((1, 0), b'b', 200, 100))
+        self.assertEqual(g.pending[(1, 0)].consumer, b'b')
+        self.assertEqual(g.pending[(1, 0)].count, 2)
+        self.assertFalse(g.consumers[b'a'].pending)
+        self.assertFalse(g.claim((5, 0), b'b', 200, 0))
+        self.assertTrue(g.claim((5, 0), b'b', 200, 0, force=True))
+        self.assertEqual(g.remove_consumer(b'b'), 2)
+        self.assertFalse(g.pending)
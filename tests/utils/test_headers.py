@@ -1,6 +1,6 @@
 import unittest
 
-from pulsar.utils.httpurl import Headers, SimpleCookie
+from pulsar.utils.httpurl import Headers, SimpleCookie, current_http_date
 
 
 class TestHeaders(unittest.TestCase):
@@ -109,3 +109,40 @@ class TestHeaders(unittest.TestCase):
         self.assertTrue(
             h in ('Set-Cookie: bla=foo\r\nSet-Cookie: pippo=pluto\r\n\r\n',
                   'Set-Cookie: pippo=pluto\r\nSet-Cookie: bla=foo\r\n\r\n'))
+
+    def test_flat(self):
+        h = Headers()
+        h['content-type'] = 'text/html'
+        h['cache-control'] = 'no-cache'
+        h.add_header('Set-Cookie', 'bla=foo')
+        h.add_header('Set-Cookie', 'pippo=pluto')
+        self.assertEqual(h.flat((1, 1), '200 OK'),
+                         b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: text/html\r\n'
+                         b'Cache-Control: no-cache\r\n'
+                         b'Set-Cookie: bla=foo\r\n'
+                         b'Set-Cookie: pippo=pluto\r\n\r\n')
+        self.assertEqual(h.flat((1, 1), '200 OK', b'Server: foo\r\n'),
+                         b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: text/html\r\n'
+                         b'Cache-Control: no-cache\r\n'
+                         b'Set-Cookie: bla=foo\r\n'
+                         b'Set-Cookie: pippo=pluto\r\n'
+                         b'Server: foo\r\n\r\n')
+        ordered = h.flat((1, 1), '200 OK', ordered=True)
+        self.assertTrue(ordered.startswith(b'HTTP/1.1 200 OK\r\n'
+                                           b'Cache-Control: no-cache\r\n'))
+        self.assertEqual(len(ordered), len(h.flat((1, 1), '200 OK')))
+        ordered = h.flat((1, 1), '200 OK', b'Server: foo\r\n', ordered=True)
+        self.assertTrue(ordered.endswith(b'\r\nServer: foo\r\n\r\n'))
+        self.assertEqual(ordered.count(b'\r\n\r\n'), 1)
+        self.assertEqual(Headers().flat((1, 1), '200 OK', b'Server: foo\r\n',
+                                        ordered=True),
+                         b'HTTP/1.1 200 OK\r\nServer: foo\r\n\r\n')
+        self.assertEqual(Headers().flat((1, 0), '204 No Content'),
+                         b'HTTP/1.0 204 No Content\r\n\r\n')
+
+    def test_current_http_date(self):
+        date = current_http_date()
+        self.assertTrue(date.endswith(' GMT'))
+        self.assertEqual(len(date), 29)
@@ -0,0 +1,61 @@
+import json
+import unittest
+
+from pulsar.utils import serializers
+from pulsar.apps.data.channels import Codec, Json
+
+
+class Reversed(serializers.Serializer):
+    name = 'reversed'
+
+    def dumps(self, obj):
+        return json.dumps(obj).encode('utf-8')[::-1]
+
+    def loads(self, data):
+        return json.loads(bytes(data)[::-1].decode('utf-8'))
+
+
+class TestSerializers(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        serializers.register_serializer(Reversed)
+
+    @classmethod
+    def tearDownClass(cls):
+        serializers.serializers.pop('reversed')
+
+    def test_get_serializer(self):
+        json_serializer = serializers.get_serializer()
+        self.assertEqual(json_serializer.name, 'json')
+        self.assertEqual(serializers.get_serializer('json'), json_serializer)
+        self.assertEqual(serializers.get_serializer('foo'), json_serializer)
+        self.assertEqual(serializers.get_serializer('reversed').name,
+                         'reversed')
+        serializer = Reversed()
+        self.assertEqual(serializers.get_serializer(serializer), serializer)
+
+    def test_json_untagged(self):
+        data = serializers.dumps({'a': [1, 2]})
+        self.assertEqual(data, b'{"a": [1, 2]}')
+        self.assertEqual(serializers.loads(data), {'a': [1, 2]})
+        self.assertEqual(serializers.loads(memoryview(data)), {'a': [1, 2]})
+
+    def test_tagged(self):
+        data = serializers.dumps({'a': [1, 2]}, 'reversed')
+        self.assertTrue(data.startswith(b'\x00reversed\x00'))
+        self.assertEqual(serializers.loads(data), {'a': [1, 2]})
+
+    def test_invalid_tag(self):
+        self.assertRaises(ValueError, serializers.loads, b'\x00foo\x00{}')
+        self.assertRaises(ValueError, serializers.loads, b'\x00foo')
+
+    def test_codec(self):
+        msg = {'event': 'boom', 'channel': 'a', 'data': [1, 2]}
+        codec = Codec('reversed')
+        data = codec.encode(msg)
+        self.assertEqual(codec.decode(data), msg)
+        self.assertEqual(Json().decode(data), msg)
+        self.assertEqual(codec.decode(Json().encode(msg).encode('utf-8')),
+                         msg)
+        self.assertEqual(codec.encode_events('boom', ['a'], [1, 2]), [data])
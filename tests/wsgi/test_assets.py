@@ -0,0 +1,134 @@
+'''Tests the asset cache of the MediaRouter'''
+import os
+import gzip
+import asyncio
+import shutil
+import tempfile
+import unittest
+
+from pulsar.apps.wsgi import AssetCache, MediaRouter, test_wsgi_environ
+from pulsar.apps.wsgi.assets import accepted_encodings
+
+
+class TestAssetCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def file(self, name, data):
+        path = os.path.join(self.path, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings(None), set())
+        self.assertEqual(accepted_encodings('gzip, deflate, br'),
+                         set(('gzip', 'deflate', 'br')))
+        self.assertEqual(accepted_encodings('gzip;q=0.5, br;q=0'),
+                         set(('gzip',)))
+
+    def test_get(self):
+        data = b'body { color: red; }\n' * 100
+        path = self.file('style.css', data)
+        cache = AssetCache()
+        asset = cache.get(path)
+        self.assertEqual(asset.variants['identity'], data)
+        self.assertEqual(gzip.decompress(asset.variants['gzip']), data)
+        self.assertEqual(asset.content_type, 'text/css')
+        self.assertTrue(path in cache)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.memory, asset.memory)
+        self.assertEqual(cache.get(path), asset)
+        self.assertEqual(asset.select('gzip'), 'gzip')
+        self.assertEqual(asset.select('deflate'), 'identity')
+        self.assertNotEqual(asset.entity_tag('gzip'),
+                            asset.entity_tag('identity'))
+
+    async def test_compress_in_executor(self):
+        data = b'body { color: red; }\n' * 100
+        path = self.file('style.css', data)
+        cache = AssetCache()
+        asset = cache.get(path, asyncio.get_event_loop())
+        # served without content coding until compressed
+        self.assertEqual(list(asset.variants), ['identity'])
+        self.assertEqual(asset.select('gzip'), 'identity')
+        self.assertEqual(cache.memory, len(data))
+        for _ in range(100):
+            if 'gzip' in asset.variants:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(gzip.decompress(asset.variants['gzip']), data)
+        self.assertEqual(asset.select('gzip'), 'gzip')
+        self.assertEqual(cache.memory, asset.memory)
+
+    def test_not_cached(self):
+        cache = AssetCache(max_file_size=10)
+        self.assertEqual(cache.get(self.file('big.txt', b'x' * 20)), None)
+        self.assertEqual(cache.get(self.path), None)
+        self.assertEqual(cache.get(os.path.join(self.path, 'foo')), None)
+        self.assertEqual(len(cache), 0)
+
+    def test_no_compression(self):
+        cache = AssetCache()
+        asset = cache.get(self.file('small.txt', b'hello'))
+        self.assertEqual(list(asset.variants), ['identity'])
+        asset = cache.get(self.file('image.png', b'\x89PNG' * 100))
+        self.assertEqual(list(asset.variants), ['identity'])
+
+    def test_lru(self):
+        cache = AssetCache(max_size=250, min_length=1000)
+        paths = [self.file('%s.txt' % i, b'x' * 100) for i in range(3)]
+        cache.get(paths[0])
+        cache.get(paths[1])
+        cache.get(paths[0])
+        cache.get(paths[2])
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.memory, 200)
+        self.assertTrue(paths[0] in cache)
+        self.assertFalse(paths[1] in cache)
+        self.assertTrue(paths[2] in cache)
+
+    def test_invalidation(self):
+        cache = AssetCache(check_interval=0)
+        path = self.file('app.js', b'var a = 1;')
+        asset = cache.get(path)
+        stat = os.stat(path)
+        self.file('app.js', b'var a = 2;')
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+        asset2 = cache.get(path)
+        self.assertNotEqual(asset, asset2)
+        self.assertEqual(asset2.variants['identity'], b'var a = 2;')
+        self.assertNotEqual(asset.etag, asset2.etag)
+        os.remove(path)
+        self.assertEqual(cache.get(path), None)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.memory, 0)
+
+    def test_media_router(self):
+        data = b'body { color: red; }\n' * 100
+        self.file('style.css', data)
+        cache = AssetCache()
+        router = MediaRouter('/media', self.path, asset_cache=cache)
+        self.assertEqual(router.asset_cache, cache)
+        environ = test_wsgi_environ('/media/style.css', extra={
+            'HTTP_ACCEPT_ENCODING': 'gzip'})
+        response = router(environ)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.content)), data)
+        etag = response.headers['etag']
+        environ = test_wsgi_environ('/media/style.css', extra={
+            'HTTP_ACCEPT_ENCODING': 'gzip', 'HTTP_IF_NONE_MATCH': etag})
+        response = router(environ)
+        self.assertEqual(response.status_code, 304)
+        environ = test_wsgi_environ('/media/style.css', extra={
+            'HTTP_RANGE': 'bytes=0-9'})
+        response = router(environ)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.content), data[:10])
+        self.assertFalse('content-encoding' in response.headers)
+
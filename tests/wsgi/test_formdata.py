@@ -0,0 +1,190 @@
+'''Tests the body reader of the wsgi server and form data decoders'''
+import asyncio
+import unittest
+from io import BytesIO
+
+from pulsar import HttpException
+from pulsar.utils.httpurl import Headers
+from pulsar.apps.wsgi.formdata import (HttpBodyReader, BytesDecoder,
+                                       parse_form_data)
+
+
+BOUNDARY = 'e9ab5a8c0d3f4e6b'
+
+
+def multipart(*parts):
+    body = []
+    for name, value, filename in parts:
+        disposition = 'form-data; name="%s"' % name
+        if filename:
+            disposition += '; filename="%s"' % filename
+        body.append(('--%s\r\nContent-Disposition: %s\r\n\r\n' %
+                     (BOUNDARY, disposition)).encode())
+        body.append(value + b'\r\n')
+    body.append(('--%s--\r\n' % BOUNDARY).encode())
+    return b''.join(body)
+
+
+def environ(body):
+    return {'REQUEST_METHOD': 'POST',
+            'CONTENT_TYPE': 'multipart/form-data; boundary=%s' % BOUNDARY,
+            'wsgi.input': body}
+
+
+class Transport:
+
+    def __init__(self):
+        self.paused = False
+        self.written = []
+
+    def pause_reading(self):
+        self.paused = True
+
+    def resume_reading(self):
+        self.paused = False
+
+    def write(self, data):
+        self.written.append(data)
+
+
+class TestHttpBodyReader(unittest.TestCase):
+
+    def reader(self, **kw):
+        self.transport = Transport()
+        return HttpBodyReader(Headers(), None, self.transport, **kw)
+
+    async def test_read(self):
+        reader = self.reader()
+        reader.feed_data(b'hello ')
+        reader.feed_data(b'world')
+        self.assertEqual(await reader.read(3), b'hel')
+        self.assertEqual(await reader.read(3), b'lo ')
+        reader.feed_eof()
+        self.assertFalse(reader.at_eof())
+        self.assertEqual(await reader.read(), b'world')
+        self.assertTrue(reader.at_eof())
+        self.assertEqual(await reader.read(), b'')
+
+    async def test_read_wait(self):
+        reader = self.reader()
+        loop = asyncio.get_event_loop()
+        loop.call_soon(reader.feed_data, b'foo')
+        self.assertEqual(await reader.read(10), b'foo')
+        loop.call_soon(reader.feed_eof)
+        self.assertEqual(await reader.read(10), b'')
+
+    async def test_readinto(self):
+        reader = self.reader()
+        reader.feed_data(b'abc')
+        reader.feed_data(b'defgh')
+        reader.feed_eof()
+        buffer = bytearray(5)
+        self.assertEqual(await reader.readinto(buffer), 5)
+        self.assertEqual(buffer, b'abcde')
+        self.assertEqual(await reader.readinto(buffer), 3)
+        self.assertEqual(buffer[:3], b'fgh')
+        self.assertEqual(await reader.readinto(buffer), 0)
+
+    async def test_readline(self):
+        reader = self.reader()
+        reader.feed_data(b'first li')
+        reader.feed_data(b'ne\nsecond\r\nlast')
+        reader.feed_eof()
+        self.assertEqual(await reader.readline(), b'first line\n')
+        self.assertEqual(await reader.readuntil(b'\r\n'), b'second\r\n')
+        self.assertEqual(await reader.readline(), b'last')
+
+    async def test_readexactly(self):
+        reader = self.reader()
+        reader.feed_data(b'abc')
+        reader.feed_data(b'def')
+        self.assertEqual(await reader.readexactly(4), b'abcd')
+        reader.feed_eof()
+        with self.assertRaises(asyncio.IncompleteReadError) as cm:
+            await reader.readexactly(4)
+        self.assertEqual(cm.exception.partial, b'ef')
+
+    async def test_limit(self):
+        reader = self.reader(limit=4)
+        reader.feed_data(b'abcdefgh\n')
+        with self.assertRaises(asyncio.LimitOverrunError):
+            await reader.readuntil(b'\n')
+        self.assertEqual(await reader.read(reader.limit), b'abcd')
+
+    async def test_watermarks(self):
+        reader = self.reader(high_water=10, low_water=4)
+        reader.feed_data(b'x' * 8)
+        self.assertFalse(self.transport.paused)
+        reader.feed_data(b'x' * 8)
+        self.assertTrue(self.transport.paused)
+        await reader.read(8)
+        self.assertTrue(self.transport.paused)
+        await reader.read(4)
+        self.assertFalse(self.transport.paused)
+
+
+class TestMultipartDecoder(unittest.TestCase):
+
+    def test_parse(self):
+        body = multipart(('name', b'pulsar', None),
+                         ('file', b'line\r\n--not a boundary\n', 'a.txt'))
+        data, files = parse_form_data(environ(BytesIO(body)))
+        self.assertEqual(data['name'], 'pulsar')
+        part = files['file']
+        self.assertEqual(part.filename, 'a.txt')
+        self.assertEqual(part.size, 23)
+        self.assertEqual(part.bytes(), b'line\r\n--not a boundary\n')
+        self.assertEqual(part.recv(4), b'line')
+        self.assertFalse(part.file._rolled)
+        part.close()
+
+    async def test_parse_chunks(self):
+        value = bytes(range(256)) * 10
+        body = b'preamble\r\n' + multipart(('file', value, 'a.bin'),
+                                             ('empty', b'', None))
+        reader = HttpBodyReader(Headers(), None, Transport())
+        loop = asyncio.get_event_loop()
+        for index in range(0, len(body), 7):
+            loop.call_soon(reader.feed_data, body[index:index+7])
+        loop.call_soon(reader.feed_eof)
+        data, files = await parse_form_data(environ(reader))
+        self.assertEqual(data['empty'], '')
+        self.assertEqual(files['file'].bytes(), value)
+
+    def test_spool(self):
+        value = b'x' * 1000
+        body = multipart(('file', value, 'a.txt'), ('small', b'y', 'b.txt'))
+        _, files = parse_form_data(environ(BytesIO(body)), spool_size=100)
+        self.assertTrue(files['file'].file._rolled)
+        self.assertFalse(files['small'].file._rolled)
+        self.assertEqual(files['file'].recv(), value)
+
+    async def test_stream(self):
+        value = b'z' * 100000
+        body = multipart(('name', b'pulsar', None), ('file', value, 'a.txt'))
+        reader = HttpBodyReader(Headers(), None, Transport())
+        reader.feed_data(body)
+        reader.feed_eof()
+        loop = asyncio.get_event_loop()
+        chunks = []
+
+        def stream(part):
+            if part.is_file():
+                chunks.append(part.recv())
+                waiter = loop.create_future()
+                loop.call_soon(waiter.set_result, None)
+                return waiter
+
+        data, files = await parse_form_data(environ(reader), stream=stream)
+        self.assertEqual(data['name'], 'pulsar')
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(b''.join(chunks), value)
+        self.assertEqual(files['file'].size, len(value))
+        self.assertEqual(files['file'].file, None)
+
+    def test_bytes_limit(self):
+        decoder = BytesDecoder({'wsgi.input': BytesIO(b'x' * 20)}, {}, None)
+        with self.assertRaises(HttpException):
+            decoder.parse(mem_limit=10)
+        decoder = BytesDecoder({'wsgi.input': BytesIO(b'x' * 10)}, {}, None)
+        self.assertEqual(decoder.parse(mem_limit=10), (b'x' * 10, None))
@@ -0,0 +1,216 @@
+'''Tests HTTP/2 support of the wsgi server'''
+import asyncio
+import unittest
+
+import pulsar
+from pulsar import send, SERVER_SOFTWARE
+from pulsar.apps import wsgi
+from pulsar.apps.wsgi import H2Connection
+
+from examples.helloworld.manage import server
+
+if H2Connection:
+    from h2.config import H2Configuration
+    from h2 import events
+
+
+class Http2Client:
+    address = None
+
+    def h2(self):
+        return H2Connection(config=H2Configuration(client_side=True,
+                                                   header_encoding='utf-8'))
+
+    def request_headers(self, method='GET', path='/'):
+        return [(':method', method),
+                (':scheme', 'http'),
+                (':authority', '%s:%s' % self.address),
+                (':path', path)]
+
+    async def responses(self, h2, reader, writer, streams, data=None):
+        # read frames until all streams have ended
+        responses = dict(((stream, [None, b'']) for stream in streams))
+        ended = set()
+        while len(ended) < len(streams):
+            if not data:
+                data = await reader.read(65536)
+                self.assertTrue(data)
+            for event in h2.receive_data(data):
+                if isinstance(event, events.ResponseReceived):
+                    responses[event.stream_id][0] = dict(event.headers)
+                elif isinstance(event, events.DataReceived):
+                    responses[event.stream_id][1] += event.data
+                    h2.acknowledge_received_data(
+                        event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, events.StreamEnded):
+                    ended.add(event.stream_id)
+            writer.write(h2.data_to_send())
+            data = None
+        return responses
+
+
+@unittest.skipUnless(H2Connection, 'Requires h2')
+class TestHttp2(Http2Client, unittest.TestCase):
+    app_cfg = None
+    concurrency = 'thread'
+
+    @classmethod
+    async def setUpClass(cls):
+        s = server(name='http2_%s' % cls.concurrency,
+                   concurrency=cls.concurrency,
+                   bind='127.0.0.1:0', http2=True)
+        cls.app_cfg = await send('arbiter', 'run', s)
+        cls.address = cls.app_cfg.addresses[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.app_cfg is not None:
+            return send('arbiter', 'kill_actor', cls.app_cfg.name)
+
+    async def test_prior_knowledge(self):
+        reader, writer = await asyncio.open_connection(*self.address)
+        h2 = self.h2()
+        h2.initiate_connection()
+        streams = [1, 3, 5]
+        for stream in streams:
+            h2.send_headers(stream, self.request_headers(), end_stream=True)
+        writer.write(h2.data_to_send())
+        responses = await self.responses(h2, reader, writer, streams)
+        writer.close()
+        for stream in streams:
+            headers, body = responses[stream]
+            self.assertEqual(headers[':status'], '200')
+            self.assertEqual(headers['content-type'], 'text/plain')
+            self.assertEqual(headers['server'], SERVER_SOFTWARE)
+            self.assertTrue(headers['date'])
+            self.assertEqual(body, b'Hello World!\n')
+
+    async def test_head(self):
+        reader, writer = await asyncio.open_connection(*self.address)
+        h2 = self.h2()
+        h2.initiate_connection()
+        h2.send_headers(1, self.request_headers('HEAD'), end_stream=True)
+        writer.write(h2.data_to_send())
+        responses = await self.responses(h2, reader, writer, [1])
+        writer.close()
+        headers, body = responses[1]
+        # helloworld does not serve HEAD, the error has no body
+        self.assertEqual(headers[':status'], '405')
+        self.assertEqual(body, b'')
+
+    async def test_h2c_upgrade(self):
+        reader, writer = await asyncio.open_connection(*self.address)
+        h2 = self.h2()
+        settings = h2.initiate_upgrade_connection()
+        request = ('GET / HTTP/1.1\r\n'
+                   'Host: %s:%s\r\n'
+                   'Connection: Upgrade, HTTP2-Settings\r\n'
+                   'Upgrade: h2c\r\n'
+                   'HTTP2-Settings: %s\r\n\r\n') % (self.address +
+                                                    (settings.decode(),))
+        writer.write(request.encode('latin-1'))
+        data = b''
+        while b'\r\n\r\n' not in data:
+            chunk = await reader.read(65536)
+            self.assertTrue(chunk)
+            data += chunk
+        head, _, data = data.partition(b'\r\n\r\n')
+        self.assertTrue(head.startswith(b'HTTP/1.1 101 '))
+        self.assertTrue(b'Upgrade: h2c' in head)
+        writer.write(h2.data_to_send())
+        responses = await self.responses(h2, reader, writer, [1], data)
+        writer.close()
+        headers, body = responses[1]
+        self.assertEqual(headers[':status'], '200')
+        self.assertEqual(body, b'Hello World!\n')
+
+
+async def echo(environ, start_response):
+    # echo the request body or send a body of the requested size
+    body = await environ['wsgi.input'].read()
+    path = environ['PATH_INFO']
+    if path.startswith('/size/'):
+        body = b'x' * int(path[6:])
+    start_response('200 OK', [('Content-Length', str(len(body)))])
+    return [body]
+
+
+@unittest.skipUnless(H2Connection, 'Requires h2')
+class TestHttp2FlowControl(Http2Client, unittest.TestCase):
+    tcp = None
+
+    @classmethod
+    async def setUpClass(cls):
+        appserver = wsgi.WSGIServer(callable=echo, http2=True)
+        cls.tcp = pulsar.TcpServer(appserver.protocol_factory(),
+                                   asyncio.get_event_loop(),
+                                   address=('127.0.0.1', 0))
+        await cls.tcp.start_serving()
+        cls.address = cls.tcp.address
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.tcp is not None:
+            return cls.tcp.close()
+
+    async def test_request_body_flow_control(self):
+        reader, writer = await asyncio.open_connection(*self.address)
+        h2 = self.h2()
+        h2.initiate_connection()
+        body = bytes(range(256)) * 1000
+        h2.send_headers(1, self.request_headers('POST', '/echo'))
+        self.assertTrue(len(body) > h2.local_flow_control_window(1))
+        data = body
+        updated = 0
+        while data:
+            size = min(h2.local_flow_control_window(1),
+                       h2.max_outbound_frame_size, len(data))
+            if size:
+                h2.send_data(1, data[:size])
+                data = data[size:]
+            else:
+                # the server acknowledges the body read by the application
+                writer.write(h2.data_to_send())
+                chunk = await reader.read(65536)
+                self.assertTrue(chunk)
+                for event in h2.receive_data(chunk):
+                    if (isinstance(event, events.WindowUpdated) and
+                            event.stream_id == 1):
+                        updated += event.delta
+        h2.end_stream(1)
+        writer.write(h2.data_to_send())
+        responses = await self.responses(h2, reader, writer, [1])
+        writer.close()
+        self.assertTrue(updated > 0)
+        headers, received = responses[1]
+        self.assertEqual(headers[':status'], '200')
+        self.assertEqual(received, body)
+
+    async def test_response_flow_control(self):
+        reader, writer = await asyncio.open_connection(*self.address)
+        h2 = self.h2()
+        h2.initiate_connection()
+        window = h2.local_settings.initial_window_size
+        size = 3 * window
+        h2.send_headers(1, self.request_headers('GET', '/size/%d' % size),
+                        end_stream=True)
+        writer.write(h2.data_to_send())
+        # the server sends a window of data and waits for more credit
+        headers = None
+        received = 0
+        while received < window:
+            chunk = await reader.read(65536)
+            self.assertTrue(chunk)
+            for event in h2.receive_data(chunk):
+                self.assertFalse(isinstance(event, events.StreamEnded))
+                if isinstance(event, events.ResponseReceived):
+                    headers = dict(event.headers)
+                elif isinstance(event, events.DataReceived):
+                    received += event.flow_controlled_length
+        self.assertEqual(headers[':status'], '200')
+        self.assertEqual(received, window)
+        h2.acknowledge_received_data(received, 1)
+        writer.write(h2.data_to_send())
+        responses = await self.responses(h2, reader, writer, [1])
+        writer.close()
+        self.assertEqual(len(responses[1][1]), size - window)
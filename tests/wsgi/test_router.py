@@ -5,6 +5,7 @@ import pulsar
 from pulsar import Http404
 from pulsar.apps.wsgi import (Router, RouterParam, route, test_wsgi_environ,
                               MediaRouter)
+from pulsar.apps.wsgi.routers import byte_range, etag_match
 
 from examples.httpbin.manage import HttpBin
 
@@ -254,3 +255,25 @@ class TestRouter(unittest.TestCase):
         self.assertEqual(router(test_wsgi_environ('/foo')), None)
         self.assertEqual(router(test_wsgi_environ('/foo/bla')), None)
         self.assertRaises(Http404, router, test_wsgi_environ('/foo/bla.png'))
+
+    def test_byte_range(self):
+        self.assertEqual(byte_range(None, 100), None)
+        self.assertEqual(byte_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(byte_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(byte_range('bytes=90-200', 100), (90, 99))
+        self.assertEqual(byte_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(byte_range('bytes=-200', 100), (0, 99))
+        self.assertEqual(byte_range('bytes=0-9,20-29', 100), None)
+        self.assertEqual(byte_range('bytes=9-0', 100), None)
+        self.assertEqual(byte_range('items=0-9', 100), None)
+        self.assertEqual(byte_range('bytes=a-b', 100), None)
+        self.assertRaises(ValueError, byte_range, 'bytes=100-', 100)
+        self.assertRaises(ValueError, byte_range, 'bytes=-0', 100)
+
+    def test_etag_match(self):
+        self.assertFalse(etag_match(None, '"a"'))
+        self.assertTrue(etag_match('"a"', '"a"'))
+        self.assertTrue(etag_match('"b", "a"', '"a"'))
+        self.assertTrue(etag_match('W/"a"', '"a"'))
+        self.assertTrue(etag_match('*', '"a"'))
+        self.assertFalse(etag_match('"b"', '"a"'))
@@ -1,6 +1,11 @@
 '''Tests the wsgi middleware in pulsar.apps.wsgi'''
+import os
 import time
+import zlib
 import pickle
+import asyncio
+import tempfile
+import threading
 import unittest
 from unittest import mock
 from datetime import datetime, timedelta
@@ -9,7 +14,10 @@ from urllib.parse import urlparse
 import pulsar
 from pulsar.apps import wsgi
 from pulsar.apps import http
+from pulsar.apps.wsgi import server
+from pulsar.apps.wsgi.wrappers import FileWrapper
 from pulsar.apps.wsgi.utils import cookie_date
+from pulsar.utils.httpurl import http_parser
 
 
 class WsgiRequestTests(unittest.TestCase):
@@ -235,3 +243,167 @@ class WsgiRequestTests(unittest.TestCase):
         response = request.redirect('/foo2', permanent=True)
         self.assertEqual(response.status_code, 301)
         self.assertEqual(response['location'], '/foo2')
+
+    def test_environ_template(self):
+        template = server.environ_template('foo', extra={'bla': 1})
+        self.assertEqual(template['SERVER_SOFTWARE'], 'foo')
+        self.assertEqual(template['wsgi.version'], (1, 0))
+        self.assertEqual(template['bla'], 1)
+        self.assertFalse('wsgi.input' in template)
+        request = self.request(headers=[('x-custom-header', 'bla')])
+        self.assertEqual(request.environ['HTTP_X_CUSTOM_HEADER'], 'bla')
+        self.assertEqual(server.header_key('x-custom-header'),
+                         'HTTP_X_CUSTOM_HEADER')
+        self.assertTrue(server.header_key('x-custom-header') is
+                        server.HEADER_KEYS['x-custom-header'])
+        self.assertEqual(server.SERVER_NAMES.get('127.0.0.1', '127.0.0.1'),
+                         request.environ['SERVER_NAME'])
+
+    async def test_server_name_in_executor(self):
+        threads = []
+
+        def getfqdn(host):
+            threads.append(threading.current_thread())
+            return 'fqdn.%s' % host
+
+        loop = asyncio.get_event_loop()
+        address = ('127.0.0.99', 8060)
+        with mock.patch.dict(server.SERVER_NAMES), \
+                mock.patch('socket.getfqdn', side_effect=getfqdn):
+            environ = wsgi.test_wsgi_environ()
+            environ['SERVER_NAME'] = address[0]
+            await server.resolve_server_name(environ, address, loop)
+            self.assertEqual(environ['SERVER_NAME'], 'fqdn.127.0.0.99')
+            environ['SERVER_NAME'] = address[0]
+            await server.resolve_server_name(environ, address, loop)
+            self.assertEqual(environ['SERVER_NAME'], 'fqdn.127.0.0.99')
+            self.assertEqual(server.server_name(address[0]),
+                             'fqdn.127.0.0.99')
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.current_thread())
+
+    async def test_file_wrapper(self):
+        # larger than the socket buffer, sent with the loop sendfile when
+        # available or written in chunks
+        data = os.urandom(1 << 22)
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+
+            def app(environ, start_response):
+                start_response('200 OK', [('Content-Length', str(len(data)))])
+                return FileWrapper(open(f.name, 'rb'))
+
+            appserver = wsgi.WSGIServer(callable=app)
+            tcp = pulsar.TcpServer(appserver.protocol_factory(),
+                                   asyncio.get_event_loop(),
+                                   address=('127.0.0.1', 0))
+            await tcp.start_serving()
+            client = http.HttpClient()
+            url = 'http://%s:%s/' % tcp.address
+            response = await client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, data)
+            await tcp.close()
+
+    async def _pipelined(self, *requests):
+        # send pipelined requests and return the order in which the
+        # application started and finished them
+        events = []
+
+        async def app(environ, start_response):
+            name = '%s %s' % (environ['REQUEST_METHOD'],
+                              environ['PATH_INFO'])
+            events.append('start ' + name)
+            await environ['wsgi.input'].read()
+            if environ['PATH_INFO'] == '/slow':
+                await asyncio.sleep(0.1)
+            events.append('end ' + name)
+            start_response('200 OK', [('Content-Length', '2')])
+            return [b'ok']
+
+        appserver = wsgi.WSGIServer(callable=app)
+        tcp = pulsar.TcpServer(appserver.protocol_factory(),
+                               asyncio.get_event_loop(),
+                               address=('127.0.0.1', 0))
+        await tcp.start_serving()
+        reader, writer = await asyncio.open_connection(*tcp.address)
+        writer.write(b''.join(
+            ('%s HTTP/1.1\r\nHost: localhost\r\n'
+             'Content-Length: 0\r\n\r\n' % r).encode('utf-8')
+            for r in requests))
+        parser = http_parser(kind=1)
+        responses = 0
+        while responses < len(requests):
+            data = await reader.read(65536)
+            self.assertTrue(data)
+            while data:
+                processed = parser.execute(data, len(data))
+                data = data[processed:]
+                if parser.is_message_complete():
+                    self.assertEqual(parser.get_status_code(), 200)
+                    responses += 1
+                    parser = http_parser(kind=1)
+        writer.close()
+        await tcp.close()
+        return events
+
+    async def test_pipelined_safe_methods(self):
+        events = await self._pipelined('GET /slow', 'HEAD /', 'GET /')
+        self.assertEqual(events[-1], 'end GET /slow')
+
+    async def test_pipelined_unsafe_method(self):
+        events = await self._pipelined('GET /slow', 'POST /slow', 'GET /')
+        self.assertEqual(events, ['start GET /slow', 'end GET /slow',
+                                  'start POST /slow', 'end POST /slow',
+                                  'start GET /', 'end GET /'])
+
+    def test_gzip_middleware(self):
+        middleware = wsgi.GZipMiddleware(min_length=20)
+        environ = {'HTTP_ACCEPT_ENCODING': 'gzip, deflate'}
+        r = wsgi.WsgiResponse(content=b'short')
+        self.assertFalse(middleware.available(environ, r))
+        content = b'long enough content ' * 10
+        r = wsgi.WsgiResponse(content=content, content_type='text/plain')
+        self.assertFalse(middleware.available({}, r))
+        self.assertTrue(middleware.available(environ, r))
+        r = middleware(environ, r)
+        self.assertEqual(r.headers['content-encoding'], 'gzip')
+        self.assertFalse(r.is_streamed)
+        self.assertEqual(zlib.decompress(b''.join(r), 31), content)
+
+    def test_gzip_middleware_etag(self):
+        middleware = wsgi.GZipMiddleware()
+        environ = {'HTTP_ACCEPT_ENCODING': 'gzip'}
+        stream = (b'line %d\n' % l for l in range(100))
+        r = wsgi.WsgiResponse(content=stream, content_type='text/plain')
+        r.headers['etag'] = '"abc"'
+        r.headers['accept-ranges'] = 'bytes'
+        r = middleware(environ, r)
+        self.assertEqual(r.headers['content-encoding'], 'gzip')
+        self.assertEqual(r.headers['etag'], 'W/"abc"')
+        self.assertFalse('accept-ranges' in r.headers)
+        self.assertEqual(zlib.decompress(b''.join(r), 31),
+                         b''.join(b'line %d\n' % l for l in range(100)))
+        r.close()
+
+    def test_gzip_middleware_streamed(self):
+        middleware = wsgi.GZipMiddleware()
+        environ = {'HTTP_ACCEPT_ENCODING': 'deflate'}
+        stream = ('line {0}\n'.format(l+1) for l in range(1000))
+        r = wsgi.WsgiResponse(content=stream, content_type='text/plain')
+        r.headers['content-length'] = '8893'
+        r = middleware(environ, r)
+        self.assertEqual(r.headers['content-encoding'], 'deflate')
+        self.assertFalse('content-length' in r.headers)
+        self.assertTrue(r.is_streamed)
+        decompressor = zlib.decompressobj()
+        data = []
+        for chunk in r:
+            # each chunk is flushed and can be decompressed on its own
+            data.append(decompressor.decompress(chunk))
+            self.assertTrue(data[-1] or len(data) == 1001)
+        self.assertEqual(b''.join(data).decode('utf-8'),
+                         ''.join('line {0}\n'.format(l+1)
+                                 for l in range(1000)))
+        r.close()